@@ -2,7 +2,6 @@ import streamlit as st
 import os
 import sys
 from enum import Enum
-import psutil
 # Configuração da página com mais opções
 st.set_page_config(
     page_title="Sistema de Conciliação Bancária",
@@ -0,0 +1,63 @@
+"""
+Benchmark da conciliação Credshop x ERP.
+
+Gera extratos sintéticos de tamanhos crescentes (benchmarks/gerador.py), concilia com o mesmo motor
+usado por credshop.conciliar_credshop_erp e mostra tempo, linhas/s e tempo
+por linha. Com custo linear o tempo por linha fica estável entre os tamanhos.
+
+Uso: python benchmarks/bench_credshop.py [tamanho ...]
+"""
+
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gerador  # noqa: E402
+from conciliacao import COLUNAS_ERP, PERFIL_CREDSHOP, conciliar, limpar_erp  # noqa: E402
+from credshop import preparar_credshop  # noqa: E402
+
+
+TAMANHOS = [1_000, 2_000, 5_000, 10_000, 20_000, 50_000]
+
+# Títulos do ERP por linha do extrato (o ERP costuma ser maior que o extrato)
+TITULOS_POR_LINHA = 3
+
+
+def gerar_dados(n_linhas, semente=0):
+    """
+    Extrato Credshop e ERP de gerador.gerar_dados (sem cancelamentos), já
+    limpos como na conciliação, mas sem passar pelo disco.
+    """
+    df_erp, df_extrato = gerador.gerar_dados(
+        "credshop", n_linhas, cancelamento=0, outros_titulos=TITULOS_POR_LINHA - 1, semente=semente
+    )
+    # O CSV da Credshop chega como uma coluna só, com os campos separados por vírgulas
+    linhas = df_extrato.astype(str).agg(",".join, axis=1)
+    df_credshop = preparar_credshop(pd.DataFrame({0: linhas}))
+    return df_credshop, limpar_erp(df_erp[COLUNAS_ERP])
+
+
+def medir(n_linhas):
+    df_credshop, df_erp = gerar_dados(n_linhas)
+    inicio = time.perf_counter()
+    resultado, _ = conciliar(df_credshop, df_erp, PERFIL_CREDSHOP)
+    segundos = time.perf_counter() - inicio
+    conciliadas = int((resultado["Status"] == PERFIL_CREDSHOP.status_conciliado).sum())
+    return segundos, conciliadas, len(df_erp)
+
+
+def main():
+    tamanhos = [int(t) for t in sys.argv[1:]] or TAMANHOS
+    print(f"{'linhas':>8} {'títulos':>8} {'segundos':>9} {'linhas/s':>10} {'µs/linha':>9} {'conciliadas':>11}")
+    for n in tamanhos:
+        segundos, conciliadas, titulos = medir(n)
+        print(f"{n:>8} {titulos:>8} {segundos:>9.3f} {n / segundos:>10.0f} "
+              f"{segundos / n * 1e6:>9.1f} {conciliadas:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark de ponta a ponta dos três adquirentes.
+
+Para cada adquirente e tamanho, gera o ERP e o extrato sintéticos
+(benchmarks/gerador.py; reaproveitados entre execuções) e mede, num processo
+novo, as etapas do app: leitura (ERP e extrato), limpeza, conciliação
+(gerar_resultado do módulo, com a separação de cancelamentos e a segunda
+passada do Santander) e exportação da planilha final. Para cada etapa mostra
+segundos, linhas do extrato por segundo e o pico de memória do processo
+(RSS máximo) até o fim da etapa; depois, a memória ocupada pelo ERP e pelo
+extrato já limpos (com os tipos compactos de conciliacao.compactar_tipos).
+
+Uso: python benchmarks/bench_modulos.py [--adquirentes santander cielo] [--tamanhos 1000 10000] [--pasta dados]
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - resource só existe no Unix
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gerador import ADQUIRENTES, gerar_arquivos  # noqa: E402
+
+
+TAMANHOS = [1_000, 10_000, 100_000, 1_000_000]
+
+PASTA_DADOS = os.path.join(tempfile.gettempdir(), "conciliafacil-bench")
+
+MB = 1024 * 1024
+
+
+def pico_memoria_mb():
+    """RSS máximo do processo até agora, em MB (None fora do Unix)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return pico / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def medir(adquirente, caminho_erp, caminho_extrato):
+    """
+    Roda as etapas uma vez neste processo; retorna ([(etapa, segundos, pico MB)],
+    {"ERP": MB, "extrato": MB}) com a memória dos DataFrames limpos.
+    """
+    from cache import tamanho_em_bytes
+    from conciliacao import carregar_erp, limpar_erp
+    from exportacao import exportar_excel
+    from lote import ADQUIRENTES as FUNCOES
+
+    nome_modulo, carregar, limpar = FUNCOES[adquirente]
+    modulo = importlib.import_module(nome_modulo)
+    etapas = []
+
+    def etapa(nome, funcao, *args):
+        inicio = time.perf_counter()
+        resultado = funcao(*args)
+        etapas.append((nome, time.perf_counter() - inicio, pico_memoria_mb()))
+        return resultado
+
+    df_erp, df_extrato = etapa(
+        "leitura", lambda: (carregar_erp(caminho_erp), getattr(modulo, carregar)(caminho_extrato))
+    )
+    df_erp, df_extrato = etapa("limpeza", lambda: (limpar_erp(df_erp), getattr(modulo, limpar)(df_extrato)))
+    memoria = {"ERP": tamanho_em_bytes(df_erp) / MB, "extrato": tamanho_em_bytes(df_extrato) / MB}
+    resultado = etapa("conciliação", modulo.gerar_resultado, df_extrato, df_erp)
+    with tempfile.TemporaryDirectory() as pasta:
+        etapa("exportação", exportar_excel, os.path.join(pasta, "Conciliação_final.xlsx"), resultado["abas"])
+    return etapas, memoria
+
+
+def medir_em_processo_novo(adquirente, caminho_erp, caminho_extrato):
+    """medir() num processo Python novo, para o pico de memória ser só desta medição."""
+    saida = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--medir", adquirente, caminho_erp, caminho_extrato],
+        stdout=subprocess.PIPE, text=True, check=True,
+    )
+    return json.loads(saida.stdout.splitlines()[-1])
+
+
+def ler_argumentos(argumentos=None):
+    parser = argparse.ArgumentParser(description="Tempo e memória de cada etapa por adquirente e tamanho.")
+    parser.add_argument("--adquirentes", nargs="+", choices=ADQUIRENTES, default=list(ADQUIRENTES))
+    parser.add_argument("--tamanhos", nargs="+", type=int, default=TAMANHOS, help="vendas no extrato")
+    parser.add_argument("--pasta", default=PASTA_DADOS, help=f"pasta dos arquivos gerados (padrão: {PASTA_DADOS})")
+    parser.add_argument("--medir", nargs=3, metavar=("ADQUIRENTE", "ERP", "EXTRATO"), help=argparse.SUPPRESS)
+    return parser.parse_args(argumentos)
+
+
+def main(argumentos=None):
+    args = ler_argumentos(argumentos)
+    if args.medir:
+        logging.basicConfig(level=logging.ERROR)
+        print(json.dumps(medir(*args.medir)))
+        return
+
+    print(f"{'adquirente':<10} {'linhas':>9} {'etapa':<12} {'segundos':>9} {'linhas/s':>10} {'pico MB':>8}")
+    for adquirente in args.adquirentes:
+        for n in args.tamanhos:
+            caminho_erp, caminho_extrato = gerar_arquivos(adquirente, n, args.pasta)
+            try:
+                etapas, memoria = medir_em_processo_novo(adquirente, caminho_erp, caminho_extrato)
+            except subprocess.CalledProcessError as e:
+                print(f"{adquirente:<10} {n:>9} falhou (código {e.returncode})")
+                continue
+            etapas.append(("total", sum(segundos for _, segundos, _ in etapas), etapas[-1][2]))
+            for nome, segundos, pico in etapas:
+                pico = f"{pico:>8.0f}" if pico is not None else f"{'-':>8}"
+                print(f"{adquirente:<10} {n:>9} {nome:<12} {segundos:>9.3f} {n / segundos:>10.0f} {pico}")
+            print(f"{adquirente:<10} {n:>9} " + " · ".join(f"{nome} limpo: {mb:.1f} MB" for nome, mb in memoria.items()))
+
+
+if __name__ == "__main__":
+    main()
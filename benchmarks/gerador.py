@@ -0,0 +1,271 @@
+"""
+Arquivos sintéticos do ERP e dos extratos Santander, Cielo e Credshop.
+
+Os arquivos saem no mesmo formato dos reais: o CSV do ERP (';', latin1,
+vírgula decimal, "Numero" como "123456-1/3"), a aba "Detalhado" do
+Santander e o relatório da Cielo (XLSX com linhas de banner antes do
+cabeçalho) e o CSV da Credshop (sem cabeçalho, separado por vírgulas).
+
+Cada linha do extrato é uma parcela de venda. Com as taxas:
+- `ruido`: linhas com data, valor ou código levemente diferentes do ERP
+  (sempre dentro das tolerâncias da conciliação);
+- `divergencia`: linhas sem título no ERP;
+- `cancelamento`: vendas que ganham um lançamento de cancelamento/estorno.
+O ERP ainda traz `outros_titulos` de outras Pessoas do Título.
+
+Uso: python benchmarks/gerador.py santander 10000 [-o pasta] [--ruido 0.1 ...]
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+try:
+    import xlsxwriter
+except ImportError:  # pragma: no cover - xlsxwriter é opcional
+    xlsxwriter = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conciliacao import PERFIS  # noqa: E402
+from credshop import CABECALHOS_CREDSHOP  # noqa: E402
+from santander import COLUNAS_SANTANDER  # noqa: E402
+
+
+ADQUIRENTES = ("santander", "cielo", "credshop")
+
+RUIDO = 0.10
+DIVERGENCIA = 0.05
+CANCELAMENTO = 0.02
+OUTROS_TITULOS = 0.10
+
+INICIO = pd.Timestamp("2024-01-01")
+FORMATO_DATA = "%d/%m/%Y"
+
+# Cabeçalho do relatório de vendas da Cielo (ler_planilha ignora maiúsculas)
+COLUNAS_CIELO = [
+    "Data da venda", "Data prevista de pagamento", "Estabelecimento", "Tipo de lançamento", "Bandeira",
+    "Valor bruto", "Valor líquido", "Número da parcela", "Quantidade total de parcelas",
+    "Código da autorização", "NSU/DOC",
+]
+
+BANDEIRAS = ["VISA CRÉDITO", "MASTERCARD CRÉDITO", "ELO CRÉDITO", "VISA DÉBITO", "MAESTRO DÉBITO"]
+OUTRAS_PESSOAS = ["Stone Instituicao de Pagamento S.a.", "Pagseguro Internet S.a.", "Cliente Balcão"]
+
+
+def dias_do_periodo(n_linhas):
+    """Dias cobertos pelos dados: cresce com o tamanho para a densidade de vendas por dia ficar parecida."""
+    return max(30, n_linhas // 1000)
+
+
+def gerar_vendas(n_linhas, rng):
+    """Parcelas de venda (a verdade comum ao ERP e ao extrato)."""
+    totais = rng.choice([1, 1, 1, 2, 3, 4, 6, 10, 12], n_linhas)
+    return pd.DataFrame({
+        "documento": rng.integers(100_000, 999_999, n_linhas),
+        "data": INICIO + pd.to_timedelta(rng.integers(0, dias_do_periodo(n_linhas), n_linhas), unit="D"),
+        "valor": np.round(rng.uniform(5, 800, n_linhas), 2),
+        "parcela": np.minimum(rng.integers(1, 13, n_linhas), totais),
+        "total": totais,
+        "autorizacao": [f"{n:06d}" for n in rng.integers(0, 1_000_000, n_linhas)],
+        "nsu": [f"{n:09d}" for n in rng.integers(0, 1_000_000_000, n_linhas)],
+    })
+
+
+def gerar_dados(adquirente, n_linhas, ruido=RUIDO, divergencia=DIVERGENCIA, cancelamento=CANCELAMENTO,
+                outros_titulos=OUTROS_TITULOS, semente=0):
+    """
+    (df_erp, df_extrato) crus, com as colunas e os textos dos arquivos reais.
+    O extrato tem `n_linhas` vendas, mais os cancelamentos.
+    """
+    rng = np.random.default_rng(semente)
+    vendas = gerar_vendas(n_linhas, rng)
+
+    # ERP: as vendas que existem nele e títulos de outras Pessoas do Título, em ordem de emissão
+    no_erp = rng.random(n_linhas) >= divergencia
+    outros = gerar_vendas(int(n_linhas * outros_titulos), rng)
+    titulos = pd.concat([vendas[no_erp], outros], ignore_index=True)
+    pessoas = np.concatenate([
+        np.full(int(no_erp.sum()), PERFIS[adquirente].pessoa_titulo, dtype=object),
+        rng.choice(OUTRAS_PESSOAS, len(outros)),
+    ])
+    ordem = np.argsort(titulos["data"].to_numpy(), kind="stable")
+    titulos, pessoas = titulos.iloc[ordem].reset_index(drop=True), pessoas[ordem]
+    df_erp = pd.DataFrame({
+        "Chave": np.arange(1, len(titulos) + 1),
+        "Numero": [f"{d}-{p}/{t}" for d, p, t in zip(titulos["documento"], titulos["parcela"], titulos["total"])],
+        "Nome do Cliente": "CONSUMIDOR FINAL",
+        "Emissão": titulos["data"].dt.strftime(FORMATO_DATA),
+        "Valor": titulos["valor"],
+        "Autorização": titulos["autorizacao"],
+        "NSU": titulos["nsu"],
+        "Pessoa do Título": pessoas,
+    })
+
+    extrato = aplicar_ruido(vendas, ruido, rng)
+    extrato["cancelamento"] = False
+    cancelados = extrato[rng.random(n_linhas) < cancelamento].assign(cancelamento=True)
+    cancelados["valor"] = -cancelados["valor"]
+    extrato = pd.concat([extrato, cancelados], ignore_index=True)
+
+    formatar = {"santander": _extrato_santander, "cielo": _extrato_cielo, "credshop": _extrato_credshop}[adquirente]
+    return df_erp, formatar(extrato, rng)
+
+
+def aplicar_ruido(vendas, ruido, rng):
+    """Cópia das vendas com data (±1 a 3 dias), valor (±0,01 a 0,15) ou código alterado em `ruido` das linhas."""
+    extrato = vendas.copy()
+    tipo = np.where(rng.random(len(extrato)) < ruido, rng.integers(0, 3, len(extrato)), -1)
+
+    data = tipo == 0
+    deslocamento = rng.integers(1, 4, int(data.sum())) * rng.choice([-1, 1], int(data.sum()))
+    extrato.loc[data, "data"] += pd.to_timedelta(deslocamento, unit="D")
+
+    valor = tipo == 1
+    extrato.loc[valor, "valor"] = np.round(extrato.loc[valor, "valor"] + rng.uniform(-0.15, 0.15, int(valor.sum())), 2)
+
+    # Um dígito trocado no NSU
+    codigo = np.flatnonzero(tipo == 2)
+    nsu = extrato["nsu"].to_numpy(dtype=object)
+    posicoes = rng.integers(0, 9, len(codigo))
+    digitos = rng.integers(0, 10, len(codigo))
+    nsu[codigo] = [texto[:p] + str(d) + texto[p + 1:] for texto, p, d in zip(nsu[codigo], posicoes, digitos)]
+    extrato["nsu"] = nsu
+    return extrato
+
+
+def _extrato_santander(extrato, rng):
+    parcelas = np.where(
+        extrato["total"] > 1,
+        extrato["parcela"].astype(str) + " de " + extrato["total"].astype(str),
+        None,
+    )
+    return pd.DataFrame({
+        "EC CENTRALIZADOR": rng.choice([1011223344, 1011223345], len(extrato)),
+        "DATA DE VENCIMENTO": (extrato["data"] + pd.to_timedelta(30 * extrato["parcela"], unit="D")).dt.strftime(FORMATO_DATA),
+        "TIPO DE LANÇAMENTO": np.where(extrato["cancelamento"], "Cancelamento/Chargeback", "Venda"),
+        "PARCELAS": parcelas,
+        "AUTORIZAÇÃO": extrato["autorizacao"],
+        "NÚMERO COMPROVANTE DE VENDA (NSU)": extrato["nsu"],
+        "DATA DA VENDA": extrato["data"].dt.strftime(FORMATO_DATA),
+        "VALOR DA PARCELA": extrato["valor"],
+        "VALOR LÍQUIDO": np.round(extrato["valor"] * 0.97, 2),
+        "BANDEIRA / MODALIDADE": rng.choice(BANDEIRAS, len(extrato)),
+    })[COLUNAS_SANTANDER]
+
+
+def _extrato_cielo(extrato, rng):
+    return pd.DataFrame({
+        "Data da venda": extrato["data"].dt.strftime(FORMATO_DATA),
+        "Data prevista de pagamento": (extrato["data"] + pd.to_timedelta(30 * extrato["parcela"], unit="D")).dt.strftime(FORMATO_DATA),
+        "Estabelecimento": "1234567890",
+        "Tipo de lançamento": np.where(extrato["cancelamento"], "Estorno", "Venda"),
+        "Bandeira": rng.choice(BANDEIRAS, len(extrato)),
+        "Valor bruto": extrato["valor"],
+        "Valor líquido": np.round(extrato["valor"] * 0.97, 2),
+        "Número da parcela": extrato["parcela"],
+        "Quantidade total de parcelas": extrato["total"],
+        "Código da autorização": extrato["autorizacao"],
+        "NSU/DOC": extrato["nsu"],
+    })[COLUNAS_CIELO]
+
+
+def _extrato_credshop(extrato, rng):
+    return pd.DataFrame({
+        "Data do Recebimento": (extrato["data"] + pd.to_timedelta(30 * extrato["parcela"], unit="D")).dt.strftime(FORMATO_DATA),
+        "estabelecimento credshop": "4455",
+        "pos": rng.integers(1, 20, len(extrato)).astype(str),
+        "cv": extrato["nsu"].str.lstrip("0").replace("", "0"),
+        "Tipo de Lançamento": np.where(extrato["cancelamento"], "Estorno", "Venda"),
+        "Data da Venda": extrato["data"].dt.strftime(FORMATO_DATA),
+        "parcela": [f"{p:02d}{t:02d}" for p, t in zip(extrato["parcela"], extrato["total"])],
+        "Valor Bruto": extrato["valor"].map("{:.2f}".format),
+        "Taxa Credshop": "2.99",
+        "Valor Líquido": (extrato["valor"] * 0.97).map("{:.2f}".format),
+    })[CABECALHOS_CREDSHOP]
+
+
+# =========================
+# Gravação dos arquivos
+# =========================
+def gravar_erp(caminho, df_erp):
+    df_erp.to_csv(caminho, sep=";", decimal=",", float_format="%.2f", encoding="latin1", index=False)
+
+
+def gravar_planilha(caminho, df, aba=None, banner=()):
+    """XLSX com as linhas de `banner`, uma linha em branco e `df` com cabeçalho, escrito linha a linha."""
+    linhas = [[texto] for texto in banner] + ([[]] if banner else []) + [list(df.columns)]
+    valores = zip(*[serie.astype(object).where(serie.notna(), None).tolist() for _, serie in df.items()])
+
+    if xlsxwriter is not None:
+        livro = xlsxwriter.Workbook(caminho, {"constant_memory": True})
+        planilha = livro.add_worksheet(aba)
+        for n, linha in enumerate([*linhas, *valores]):
+            planilha.write_row(n, 0, linha)
+        livro.close()
+        return
+
+    livro = Workbook(write_only=True)
+    planilha = livro.create_sheet(aba)
+    for linha in [*linhas, *valores]:
+        planilha.append(list(linha))
+    livro.save(caminho)
+
+
+def gravar_credshop(caminho, df):
+    with open(caminho, "w", encoding="latin1", newline="") as arquivo:
+        for linha in zip(*[df[coluna].astype(str) for coluna in df.columns]):
+            arquivo.write(",".join(linha) + "\n")
+
+
+def gerar_arquivos(adquirente, n_linhas, pasta, ruido=RUIDO, divergencia=DIVERGENCIA, cancelamento=CANCELAMENTO,
+                   outros_titulos=OUTROS_TITULOS, semente=0, refazer=False):
+    """
+    Grava em `pasta` o ERP e o extrato de gerar_dados e devolve os dois
+    caminhos. Arquivos já gerados com os mesmos parâmetros são reaproveitados.
+    """
+    os.makedirs(pasta, exist_ok=True)
+    taxas = dict(ruido=ruido, divergencia=divergencia, cancelamento=cancelamento, outros_titulos=outros_titulos, semente=semente)
+    sufixo = f"{adquirente}-{n_linhas}-r{ruido}-d{divergencia}-c{cancelamento}-o{outros_titulos}-s{semente}"
+    extensao = "csv" if adquirente == "credshop" else "xlsx"
+    caminho_erp = os.path.join(pasta, f"erp-{sufixo}.csv")
+    caminho_extrato = os.path.join(pasta, f"extrato-{sufixo}.{extensao}")
+    if not refazer and os.path.exists(caminho_erp) and os.path.exists(caminho_extrato):
+        return caminho_erp, caminho_extrato
+
+    df_erp, df_extrato = gerar_dados(adquirente, n_linhas, **taxas)
+    gravar_erp(caminho_erp, df_erp)
+    if adquirente == "santander":
+        gravar_planilha(caminho_extrato, df_extrato, aba="Detalhado", banner=["Extrato de Vendas Detalhado"])
+    elif adquirente == "cielo":
+        gravar_planilha(caminho_extrato, df_extrato, banner=["Relatório de vendas", "Período: últimos meses"])
+    else:
+        gravar_credshop(caminho_extrato, df_extrato)
+    return caminho_erp, caminho_extrato
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Gera o ERP e o extrato sintéticos de um adquirente.")
+    parser.add_argument("adquirente", choices=ADQUIRENTES)
+    parser.add_argument("linhas", type=int, help="vendas no extrato")
+    parser.add_argument("-o", "--pasta", default=".", help="pasta dos arquivos gerados (padrão: atual)")
+    parser.add_argument("--ruido", type=float, default=RUIDO)
+    parser.add_argument("--divergencia", type=float, default=DIVERGENCIA)
+    parser.add_argument("--cancelamento", type=float, default=CANCELAMENTO)
+    parser.add_argument("--outros-titulos", type=float, default=OUTROS_TITULOS)
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args(argumentos)
+
+    for caminho in gerar_arquivos(
+        args.adquirente, args.linhas, args.pasta, args.ruido, args.divergencia, args.cancelamento,
+        args.outros_titulos, args.semente, refazer=True,
+    ):
+        print(caminho)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Caches em memória que sobrevivem às reexecuções do Streamlit.
+
+O Streamlit roda o main() inteiro a cada clique; os módulos, porém, são
+importados uma vez só por processo, então os caches daqui continuam vivos
+entre uma reexecução e outra. As chaves usam o hash do conteúdo dos
+arquivos enviados, e não o nome, para que um arquivo novo com o mesmo nome
+nunca reaproveite o resultado do anterior.
+
+Há dois caches: PLANILHAS, com os arquivos já lidos e limpos, e RESULTADOS,
+com a conciliação pronta (abas e planilha gerada) para cada combinação de
+arquivos, adquirente, parâmetros e VERSAO_MOTOR.
+
+As etapas com versão (o ERP, que é o mesmo para os três adquirentes) também
+ficam em disco no formato Arrow IPC, em CONCILIAFACIL_CACHE_PASTA: outro
+processo ou outra página que recebe o mesmo arquivo não precisa ler o CSV
+nem limpar de novo. O ganho é de tempo, não de memória: o arquivo é aberto
+com memory map, mas o to_pandas copia as colunas para o DataFrame. Sem
+pyarrow, só o cache em memória é usado.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from conciliacao import VERSAO_MOTOR
+from instrumentacao import etapa as etapa_medida
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pragma: no cover - pyarrow é opcional
+    pa = None
+
+
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
+PASTA_CACHE_DISCO = "cache"
+MAX_ARQUIVOS_CACHE_DISCO = 20
+
+
+def hash_conteudo(arquivo):
+    """
+    Hash (blake2b) do conteúdo de um arquivo enviado pelo Streamlit, de um
+    objeto com read()/seek() ou de um caminho no disco.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    if hasattr(arquivo, "getvalue"):
+        h.update(arquivo.getvalue())
+    elif hasattr(arquivo, "read"):
+        posicao = arquivo.tell()
+        arquivo.seek(0)
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO_HASH), b""):
+            h.update(bloco)
+        arquivo.seek(posicao)
+    else:
+        with open(arquivo, "rb") as f:
+            for bloco in iter(lambda: f.read(TAMANHO_BLOCO_HASH), b""):
+                h.update(bloco)
+    return h.hexdigest()
+
+
+def tamanho_em_bytes(valor):
+    """Memória aproximada de DataFrames, bytes e coleções deles."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, (bytes, bytearray)):
+        return len(valor)
+    if isinstance(valor, dict):
+        return sum(tamanho_em_bytes(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sum(tamanho_em_bytes(v) for v in valor)
+    return 0
+
+
+def copiar(valor):
+    """Cópia dos DataFrames, para que quem usa o valor não altere o que está no cache."""
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return valor.copy()
+    if isinstance(valor, dict):
+        return {k: copiar(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return type(valor)(copiar(v) for v in valor)
+    return valor
+
+
+class CacheLRU:
+    """
+    Cache limitado por quantidade de itens e por memória; quando passa de um
+    dos limites, sai o item usado há mais tempo. Com `max_idade` (segundos),
+    itens guardados há mais tempo que isso também saem. Com `copiar_na_saida`,
+    os valores são copiados na saída (ver copiar); sem ele, quem usa o valor
+    só pode lê-lo.
+    """
+
+    def __init__(self, max_itens=8, max_bytes=None, max_idade=None, relogio=time.monotonic, copiar_na_saida=True):
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self.max_idade = max_idade
+        self.relogio = relogio
+        self.copiar_na_saida = copiar_na_saida
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._trava = threading.Lock()
+
+    def __len__(self):
+        return len(self._itens)
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    def obter(self, chave):
+        """Valor guardado em `chave` (copiado, com `copiar_na_saida`) ou None."""
+        with self._trava:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            if self._expirou(item):
+                self._remover(chave)
+                return None
+            self._itens.move_to_end(chave)
+            return self._saida(item[0])
+
+    def guardar(self, chave, valor):
+        tamanho = tamanho_em_bytes(valor)
+        with self._trava:
+            if chave in self._itens:
+                self._remover(chave)
+            self._itens[chave] = (valor, tamanho, self.relogio())
+            self._bytes += tamanho
+            self._despejar()
+
+    def _saida(self, valor):
+        return copiar(valor) if self.copiar_na_saida else valor
+
+    def _expirou(self, item):
+        return self.max_idade is not None and self.relogio() - item[2] > self.max_idade
+
+    def _remover(self, chave):
+        _, tamanho, _ = self._itens.pop(chave)
+        self._bytes -= tamanho
+        logging.debug("Cache: item %s despejado (%d bytes)", chave, tamanho)
+
+    def _despejar(self):
+        for chave in [chave for chave, item in self._itens.items() if self._expirou(item)]:
+            self._remover(chave)
+        while self._itens and (
+            len(self._itens) > self.max_itens
+            or (self.max_bytes is not None and self._bytes > self.max_bytes and len(self._itens) > 1)
+        ):
+            self._remover(next(iter(self._itens)))
+
+    def obter_ou_calcular(self, chave, calcular):
+        """Valor em `chave`; se não houver, chama calcular(), guarda e devolve (copiado, com `copiar_na_saida`)."""
+        valor = self.obter(chave)
+        if valor is not None:
+            logging.info("Cache: %s reaproveitado", chave[0] if isinstance(chave, tuple) else chave)
+            return valor
+        valor = calcular()
+        self.guardar(chave, valor)
+        return self._saida(valor)
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+            self._bytes = 0
+
+
+# Planilhas já lidas e limpas, por etapa e hash do arquivo. Copiadas na saída:
+# a conciliação altera o ERP que recebe (ex.: a coluna Usada do Santander)
+PLANILHAS = CacheLRU(max_itens=8, max_bytes=2 * 1024 ** 3)
+
+# Conciliações prontas, por arquivos, adquirente e parâmetros; expiram em 2 horas.
+# As páginas só exibem e baixam o resultado, então ele sai sem cópia a cada reexecução
+RESULTADOS = CacheLRU(max_itens=16, max_bytes=1024 ** 3, max_idade=2 * 60 * 60, copiar_na_saida=False)
+
+
+def carregar_limpo(arquivo, etapa, carregar, limpar=None, versao=None):
+    """
+    Lê `arquivo` com carregar(arquivo) e aplica limpar(df), uma única vez por
+    conteúdo de arquivo e `etapa` (ex.: "erp", "cielo"). Nas reexecuções
+    seguintes devolve uma cópia do DataFrame já limpo. Com `versao` (versão
+    da limpeza), o resultado também é guardado em disco.
+    """
+    hash_arquivo = hash_conteudo(arquivo)
+
+    def calcular():
+        caminho = None
+        if versao is not None:
+            caminho = caminho_cache_disco(etapa, hash_arquivo, versao)
+
+        # Com o cache em disco, a leitura é a do arquivo .arrow já limpo
+        with etapa_medida(f"Leitura ({etapa})"):
+            df = ler_cache_disco(caminho) if caminho is not None else None
+            if df is not None:
+                return df
+            df = carregar(arquivo)
+        if limpar is not None:
+            with etapa_medida(f"Limpeza ({etapa})"):
+                df = limpar(df)
+        if caminho is not None:
+            gravar_cache_disco(caminho, df)
+        return df
+
+    return PLANILHAS.obter_ou_calcular((etapa, hash_arquivo), calcular)
+
+
+# =========================
+# Cache em disco (Arrow IPC)
+# =========================
+def caminho_cache_disco(etapa, hash_arquivo, versao, pasta=None):
+    pasta = pasta or os.environ.get("CONCILIAFACIL_CACHE_PASTA", PASTA_CACHE_DISCO)
+    return os.path.join(pasta, f"{etapa}-{hash_arquivo}-v{versao}.arrow")
+
+
+def ler_cache_disco(caminho):
+    """DataFrame guardado em `caminho` (lido com memory map) ou None."""
+    if pa is None or not os.path.exists(caminho):
+        return None
+    try:
+        tabela = feather.read_table(caminho, memory_map=True)
+        df = tabela.to_pandas()
+    except (OSError, pa.ArrowException) as e:
+        logging.warning("Cache em disco ilegível (%s): %s", caminho, e)
+        return None
+    os.utime(caminho)
+    logging.info("Cache em disco: %s reaproveitado", os.path.basename(caminho))
+    return df
+
+
+def gravar_cache_disco(caminho, df):
+    """
+    Grava `df` em `caminho` sem compressão (para o memory map funcionar);
+    a escrita vai para um arquivo temporário e só depois toma o lugar do final.
+    O temporário tem nome único: as sessões do Streamlit são threads do
+    mesmo processo e podem gravar o mesmo ERP ao mesmo tempo.
+    """
+    if pa is None:
+        return
+    try:
+        tabela = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowException, TypeError, ValueError) as e:
+        logging.warning("DataFrame não pôde ir para o cache em disco: %s", e)
+        return
+
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    temporario = None
+    try:
+        descritor, temporario = tempfile.mkstemp(dir=pasta or ".", suffix=".tmp")
+        os.close(descritor)
+        feather.write_feather(tabela, temporario, compression="uncompressed")
+        os.replace(temporario, caminho)
+    except OSError as e:
+        logging.warning("Falha ao gravar cache em disco (%s): %s", caminho, e)
+        if temporario is not None and os.path.exists(temporario):
+            os.remove(temporario)
+        return
+    limpar_cache_disco(pasta)
+
+
+def limpar_cache_disco(pasta, max_arquivos=MAX_ARQUIVOS_CACHE_DISCO):
+    """Mantém só os `max_arquivos` usados mais recentemente na pasta do cache."""
+    arquivos = [
+        os.path.join(pasta, nome) for nome in os.listdir(pasta or ".") if nome.endswith(".arrow")
+    ]
+    arquivos.sort(key=os.path.getmtime, reverse=True)
+    for caminho in arquivos[max_arquivos:]:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+def chave_resultado(adquirente, arquivo_erp, arquivo_extrato, *parametros):
+    """
+    Chave de RESULTADOS: adquirente, hash dos arquivos, VERSAO_MOTOR e os
+    parâmetros que mudam o resultado (tolerâncias, atribuição global...).
+    `arquivo_extrato` pode ser uma lista de extratos (ver lote.py); a ordem
+    conta, porque decide quem fica com um título disputado.
+    """
+    if isinstance(arquivo_extrato, (list, tuple)):
+        hash_extrato = tuple(hash_conteudo(arquivo) for arquivo in arquivo_extrato)
+    else:
+        hash_extrato = hash_conteudo(arquivo_extrato)
+    return (
+        f"resultado {adquirente.lower()}",
+        hash_conteudo(arquivo_erp),
+        hash_extrato,
+        VERSAO_MOTOR,
+        parametros,
+    )
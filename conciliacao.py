@@ -0,0 +1,970 @@
+"""
+Motor de conciliação compartilhado por Santander, Cielo e Credshop.
+
+Cada adquirente é descrito por um PerfilAdquirente (colunas, pesos da
+pontuação, Pessoa do Título esperada, tolerâncias e forma de seleção) e
+todos passam pelo mesmo núcleo:
+
+1. limpeza do ERP (limpar_erp);
+2. geração dos pares candidatos (linha do extrato, posição do ERP) pelo
+   índice de janela de data;
+3. pontuação em lote, com chaves idênticas resolvidas sem rapidfuzz e a
+   similaridade fuzzy calculada em lote fora do laço do interpretador;
+4. seleção gulosa, independente por linha ou por atribuição global.
+
+Extratos grandes têm as etapas 2 e 3 divididas em partições, num pool de
+processos (pontuar_em_particoes); a seleção continua num processo só.
+
+Este módulo não depende do Streamlit.
+"""
+
+import csv
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pa_compute
+    import pyarrow.csv as pa_csv
+except ImportError:  # pragma: no cover - pyarrow é opcional
+    pa = None
+
+from indices import IndiceJanela, NS_POR_DIA, datas_em_ns
+from instrumentacao import etapa
+from registro import abrir_rastro
+
+
+# Maior componente (linhas x títulos) resolvida com matriz densa; acima disso
+# a componente é resolvida pela ordem global de pontuação
+LIMITE_COMPONENTE_DENSA = 4_000_000
+
+# Linhas do extrato processadas por vez na geração e pontuação dos pares
+LINHAS_POR_BLOCO = 5000
+
+# A partir de quantas linhas do extrato a pontuação é dividida entre processos
+# (ver pontuar_em_particoes), e quantas partições cada processo recebe
+LINHAS_PARA_PARTICIONAR = 50_000
+PARTICOES_POR_PROCESSO = 4
+
+# Threads da similaridade fuzzy (-1: uma por núcleo); 1 nos processos de pool (ver limitar_threads)
+WORKERS_SIMILARIDADE = -1
+
+# Versão do motor; aumentar sempre que uma mudança alterar o resultado da
+# conciliação, para que os resultados em cache (cache.RESULTADOS) não sejam reaproveitados
+VERSAO_MOTOR = 3
+
+# Colunas do extrato já padronizadas pela limpeza de cada adquirente
+COLUNA_DATA = "DATA DA VENDA"
+COLUNA_VALOR = "VALOR DA PARCELA"
+COLUNA_PARCELA = "PARCELA"
+COLUNA_TOTAL = "TOTAL_PARCELAS"
+
+
+# =========================
+# Perfis dos adquirentes
+# =========================
+@dataclass(frozen=True)
+class PerfilAdquirente:
+    """Como as linhas de um adquirente são comparadas com os títulos do ERP."""
+
+    nome: str
+    pessoa_titulo: str
+    coluna_nsu: str
+    coluna_autorizacao: str = None
+    colunas_obrigatorias: tuple = ()
+    peso_dias: int = 10
+    peso_valor: int = 100
+    penalidade_pessoa: int = 101
+    tolerancia_dias: int = 5
+    tolerancia_valor: float = 0.20
+    dias_pelo_modulo: bool = False          # abs(diferença).days em vez de abs(diferença.days)
+    qualquer_chave_exata: bool = False      # Autorização OU NSU idênticos zeram as duas similaridades
+    codigos_numericos: tuple = ("Autorização", "NSU")  # colunas do ERP comparadas sem zeros à esquerda
+    selecao_gulosa: bool = True             # ordem do arquivo sem repetir títulos; senão, melhor por linha
+    casas_pontuacao: int = 0
+    colunas_resultado: tuple = ()           # (coluna no resultado, coluna no ERP)
+    status_conciliado: str = "Conciliado"
+    status_nao_conciliado: str = "Não conciliado"
+    outros_status: tuple = ()               # status dados depois da conciliação (categorias da coluna Status)
+
+    def categorias_status(self):
+        """Valores possíveis da coluna Status (categórica) do resultado."""
+        return [self.status_conciliado, self.status_nao_conciliado, *self.outros_status]
+
+    def colunas_codigo(self):
+        """Pares (coluna do extrato, coluna do ERP) comparados por similaridade."""
+        colunas = []
+        if self.coluna_autorizacao is not None:
+            colunas.append((self.coluna_autorizacao, "Autorização"))
+        colunas.append((self.coluna_nsu, "NSU"))
+        return colunas
+
+
+PERFIL_CIELO = PerfilAdquirente(
+    nome="Cielo",
+    pessoa_titulo="Cielo",
+    coluna_autorizacao="AUTORIZAÇÃO",
+    coluna_nsu="NSU/DOC",
+    colunas_obrigatorias=("AUTORIZAÇÃO", "NSU/DOC"),
+    colunas_resultado=(
+        ("Autorização ERP", "Autorização"),
+        ("NSU ERP", "NSU"),
+        ("Chave ERP", "Chave"),
+        ("Valor ERP", "Valor"),
+        ("Emissão ERP", "Emissão"),
+        ("Parcela ERP", "Numero da Parcela"),
+        ("Total Parcelas ERP", "Total Parcelas"),
+        ("Pessoa do Título", "Pessoa do Título"),
+    ),
+)
+
+PERFIL_CREDSHOP = PerfilAdquirente(
+    nome="Credshop",
+    pessoa_titulo="Credishop",
+    coluna_nsu="NSU/DOC",
+    colunas_obrigatorias=("NSU/DOC",),
+    colunas_resultado=(
+        ("NSU ERP", "NSU"),
+        ("Chave ERP", "Chave"),
+        ("Valor ERP", "Valor"),
+        ("Emissão ERP", "Emissão"),
+        ("Parcela ERP", "Numero da Parcela"),
+        ("Total Parcelas ERP", "Total Parcelas"),
+        ("Pessoa do Título", "Pessoa do Título"),
+    ),
+)
+
+PERFIL_SANTANDER = PerfilAdquirente(
+    nome="Santander",
+    pessoa_titulo="Getnet Adquirencia E Servicos Para Meios de Pagamento S.a.",
+    coluna_autorizacao="AUTORIZAÇÃO",
+    coluna_nsu="NÚMERO COMPROVANTE DE VENDA (NSU)",
+    peso_dias=100,
+    dias_pelo_modulo=True,
+    qualquer_chave_exata=True,
+    codigos_numericos=("Autorização",),
+    selecao_gulosa=False,
+    casas_pontuacao=2,
+    colunas_resultado=(
+        ("Autorização ERP", "Autorização"),
+        ("NSU ERP", "NSU"),
+        ("Chave ERP", "Chave"),
+        ("Valor ERP", "Valor"),
+    ),
+    status_conciliado="Conciliado por Similaridade",
+    status_nao_conciliado="Não Conciliado",
+    outros_status=("Valor Duplicado Menor Score",),
+)
+
+PERFIS = {perfil.nome.lower(): perfil for perfil in (PERFIL_SANTANDER, PERFIL_CIELO, PERFIL_CREDSHOP)}
+
+
+# =========================
+# Carga e limpeza do ERP
+# =========================
+# Colunas do ERP usadas na conciliação; as demais colunas do CSV não são lidas
+COLUNAS_ERP = ["Chave", "Numero", "Emissão", "Valor", "Autorização", "NSU", "Pessoa do Título"]
+
+FORMATO_DATA_ERP = "%d/%m/%Y"
+
+
+def colunas_do_csv(caminho, sep=";", encoding="latin1"):
+    """Nomes das colunas (primeira linha) de um CSV em disco ou já aberto, sem mudar a posição de leitura."""
+    if hasattr(caminho, "read"):
+        posicao = caminho.tell()
+        linha = caminho.readline()
+        caminho.seek(posicao)
+    else:
+        with open(caminho, "rb") as arquivo:
+            linha = arquivo.readline()
+    if isinstance(linha, bytes):
+        linha = linha.decode(encoding)
+    return next(csv.reader(io.StringIO(linha), delimiter=sep), [])
+
+
+def carregar_erp(caminho):
+    """
+    Lê o CSV do ERP (separado por ';', latin1) só com as COLUNAS_ERP,
+    Autorização, NSU e Numero como texto, Valor já como float e Chave como
+    número. Usa o leitor de CSV do pyarrow (em paralelo) quando disponível e
+    cai no pd.read_csv se ele não estiver instalado ou não aceitar o arquivo.
+    """
+    colunas = [coluna for coluna in colunas_do_csv(caminho) if coluna in COLUNAS_ERP]
+
+    if pa is not None:
+        posicao = caminho.tell() if hasattr(caminho, "read") else None
+        try:
+            return _carregar_erp_pyarrow(caminho, colunas)
+        except (pa.ArrowInvalid, UnicodeDecodeError) as e:
+            logging.info("Leitor pyarrow não aceitou o ERP (%s); usando pd.read_csv", e)
+            if posicao is not None:
+                caminho.seek(posicao)
+
+    return pd.read_csv(
+        caminho, sep=";", encoding="latin1", usecols=colunas,
+        dtype={"NSU": str, "Autorização": str, "Numero": str},
+    )
+
+
+def _carregar_erp_pyarrow(caminho, colunas):
+    tipos = {
+        "Chave": pa.int64(),
+        "Valor": pa.float64(),
+        "Numero": pa.string(),
+        "Emissão": pa.string(),
+        "Autorização": pa.string(),
+        "NSU": pa.string(),
+        "Pessoa do Título": pa.string(),
+    }
+    tabela = pa_csv.read_csv(
+        caminho,
+        read_options=pa_csv.ReadOptions(encoding="latin1", use_threads=True),
+        parse_options=pa_csv.ParseOptions(delimiter=";"),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=colunas,
+            column_types={coluna: tipos[coluna] for coluna in colunas},
+            decimal_point=",",
+            strings_can_be_null=True,
+        ),
+    )
+    return tabela.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def converter_decimal(serie):
+    """Converte valores com vírgula decimal ("1234,56") para float; colunas já numéricas só mudam de tipo."""
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float)
+    return pd.to_numeric(serie.astype(str).str.replace(",", ".", regex=False), errors="coerce")
+
+
+def converter_data(serie):
+    """
+    Datas do ERP, lidas direto no FORMATO_DATA_ERP. Se algum valor estiver
+    em outro formato, a coluna inteira é lida com inferência (dia primeiro);
+    valores inválidos viram NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    datas = pd.to_datetime(serie, format=FORMATO_DATA_ERP, errors="coerce")
+    if (datas.isna() & serie.notna()).any():
+        datas = pd.to_datetime(serie, dayfirst=True, errors="coerce")
+    return datas
+
+
+def extrair_parcelas(numeros):
+    """Parcela e total de parcelas do "Numero" do ERP ("123-2/6"); 1 quando ausentes."""
+    texto = numeros.astype(str)
+    if pa is not None:
+        partes = pa_compute.extract_regex(pa.array(texto, type=pa.string()), r"-(?P<parcela>\d+)/(?P<total>\d+)")
+        return tuple(
+            pa_compute.cast(pa_compute.struct_field(partes, campo), pa.float64()).fill_null(1).to_numpy().astype(int)
+            for campo in ("parcela", "total")
+        )
+
+    parcelas = texto.str.extract(r"-(\d+)/(\d+)")
+    return tuple(parcelas[i].astype(float).fillna(1).astype(int).to_numpy() for i in (0, 1))
+
+
+# Versão da limpeza do ERP; aumentar sempre que limpar_erp mudar, para
+# invalidar as cópias já limpas guardadas em disco (ver cache.carregar_limpo)
+VERSAO_LIMPEZA_ERP = 3
+
+# Colunas de texto com poucos valores distintos, guardadas como category
+# depois da limpeza (ERP e extratos; ver compactar_tipos)
+COLUNAS_CATEGORICAS = ["Pessoa do Título", "TIPO DE LANÇAMENTO", "BANDEIRA / MODALIDADE", "EC CENTRALIZADOR"]
+
+
+def compactar_tipos(df, parcelas=()):
+    """
+    Tipos menores para um DataFrame já limpo: category nas
+    COLUNAS_CATEGORICAS presentes e, nas colunas `parcelas`, o menor inteiro
+    que comporta os valores (int8 na prática). Altera e retorna `df`.
+    """
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype("category")
+    for coluna in parcelas:
+        if pd.api.types.is_integer_dtype(df[coluna]):
+            df[coluna] = pd.to_numeric(df[coluna], downcast="integer")
+    return df
+
+
+def limpar_erp(df):
+    """Limpeza única do ERP, usada pelos três adquirentes."""
+    try:
+        df = df.copy()
+
+        df["Emissão"] = converter_data(df["Emissão"])
+        df["Numero da Parcela"], df["Total Parcelas"] = extrair_parcelas(df["Numero"])
+        df["Valor"] = converter_decimal(df["Valor"])
+        df["Chave"] = pd.to_numeric(df["Chave"], errors="coerce").astype("Int64")
+        compactar_tipos(df, parcelas=["Numero da Parcela", "Total Parcelas"])
+
+    except Exception as e:
+        logging.error("Erro ao limpar dados ERP: %s", e, exc_info=True)
+        raise
+
+    return df
+
+
+def normalizar_codigos(valores, numericos=False):
+    """
+    Texto comparável de Autorização/NSU: sem espaços, sem o ".0" de números
+    lidos como float e vazio quando ausente. Com `numericos`, zeros à esquerda
+    são ignorados.
+    """
+    serie = pd.Series(valores, dtype=object)
+    texto = serie.astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+    if numericos:
+        texto = texto.str.replace(r"^0+(\d)", r"\1", regex=True)
+    texto[serie.isna().to_numpy()] = ""
+    return texto.to_numpy(dtype=object)
+
+
+# =========================
+# Pontuação e seleção
+# =========================
+def similaridade_em_lote(textos_a, textos_b, workers=None):
+    """fuzz.ratio entre textos_a[k] e textos_b[k] para todo k, usando várias threads."""
+    if len(textos_a) == 0:
+        return np.empty(0, dtype=float)
+    if workers is None:
+        workers = WORKERS_SIMILARIDADE
+    resultado = process.cpdist(
+        list(textos_a), list(textos_b), scorer=fuzz.ratio, dtype=np.float64, workers=workers
+    )
+    return resultado.reshape(-1)
+
+
+def inicios_por_linha(linhas, total_linhas):
+    """Início da fatia de pares de cada linha (pares ordenados por linha)."""
+    return np.searchsorted(linhas, np.arange(total_linhas + 1), side="left")
+
+
+def pares_a_calcular(linhas, limites, pontuacoes, total_linhas, folga=np.inf):
+    """
+    Máscara dos pares que precisam de similaridade fuzzy.
+
+    `pontuacoes` traz NaN nos pares ainda não pontuados e `limites` a parte da
+    pontuação que não depende da similaridade. Um par cujo limite já passa da
+    melhor pontuação conhecida da sua linha não tem como vencer e é podado.
+
+    `folga` é o máximo que a similaridade pode somar a um par: nenhum par
+    pontua acima de (menor limite da linha + folga), então pares com limite
+    acima disso também são podados.
+    """
+    conhecidas = ~np.isnan(pontuacoes)
+    cotas = np.full(total_linhas, np.inf)
+    np.minimum.at(cotas, linhas[conhecidas], pontuacoes[conhecidas])
+    if np.isfinite(folga):
+        # Margem para o arredondamento da soma das parcelas da pontuação
+        np.minimum.at(cotas, linhas, limites + folga + 1e-6)
+    return ~conhecidas & ~(limites > cotas[linhas])
+
+
+def podar_por_distancia(linhas, posicoes, distancias, total_linhas, folga=np.inf, k=None):
+    """
+    Máscara dos pares que seguem para a similaridade, olhando só a parte
+    numérica da pontuação (`distancias`). Saem os pares acima de (menor
+    distância da linha + folga), que nunca vencem a melhor pontuação por
+    linha, e, com `k`, os que passam dos k mais próximos da linha (no empate,
+    ficam os de menor posição no ERP). Os pares não precisam estar ordenados.
+    """
+    manter = np.ones(len(linhas), dtype=bool)
+    if len(linhas) == 0:
+        return manter
+
+    if np.isfinite(folga):
+        cotas = np.full(total_linhas, np.inf)
+        np.minimum.at(cotas, linhas, distancias)
+        manter &= ~(distancias > cotas[linhas] + folga + 1e-6)
+
+    if k is not None:
+        idx = np.flatnonzero(manter)
+        ordem = idx[np.lexsort((posicoes[idx], distancias[idx], linhas[idx]))]
+        inicios = np.searchsorted(linhas[ordem], linhas[ordem], side="left")
+        manter[:] = False
+        manter[ordem[np.arange(len(ordem)) - inicios < k]] = True
+    return manter
+
+
+def selecionar_melhor_por_linha(linhas, pontuacoes, total_linhas):
+    """
+    Índice do par de menor pontuação de cada linha (-1 se a linha não tem
+    pares). Em empate vence o primeiro par, como nos laços originais.
+    """
+    escolhas = np.full(total_linhas, -1, dtype=np.intp)
+    if len(linhas) == 0:
+        return escolhas
+
+    pontuacoes = np.where(np.isnan(pontuacoes), np.inf, pontuacoes)
+    ordem = np.lexsort((np.arange(len(linhas)), pontuacoes, linhas))
+    primeiros = np.ones(len(ordem), dtype=bool)
+    primeiros[1:] = linhas[ordem[1:]] != linhas[ordem[:-1]]
+    melhores = ordem[primeiros]
+    melhores = melhores[np.isfinite(pontuacoes[melhores])]
+    escolhas[linhas[melhores]] = melhores
+    return escolhas
+
+
+def selecionar_guloso(linhas, posicoes, pontuacoes, limites, total_linhas, total_erp, completar):
+    """
+    Percorre as linhas na ordem do arquivo e dá a cada uma o par disponível de
+    menor pontuação, marcando o título do ERP como usado.
+
+    Pares podados (NaN em `pontuacoes`) só são calculados por `completar` quando
+    o melhor par conhecido da linha já foi usado por uma linha anterior e eles
+    voltam a ter chance de vencer. Retorna (escolhas por linha, usadas).
+    """
+    usadas = np.zeros(total_erp, dtype=bool)
+    escolhas = np.full(total_linhas, -1, dtype=np.intp)
+    inicios = inicios_por_linha(linhas, total_linhas)
+
+    for i in np.flatnonzero(np.diff(inicios)):
+        ini, fim = inicios[i], inicios[i + 1]
+        disponiveis = ~usadas[posicoes[ini:fim]]
+        if not disponiveis.any():
+            continue
+
+        fatia = pontuacoes[ini:fim]
+        pendentes = disponiveis & np.isnan(fatia)
+        if pendentes.any():
+            conhecidas = np.where(disponiveis & ~pendentes, fatia, np.inf)
+            if not conhecidas.min() < limites[ini:fim][pendentes].min():
+                idx = ini + np.flatnonzero(pendentes)
+                pontuacoes[idx] = completar(idx)
+                fatia = pontuacoes[ini:fim]
+
+        candidatas = np.where(disponiveis & ~np.isnan(fatia), fatia, np.inf)
+        j = int(np.argmin(candidatas))
+        if np.isfinite(candidatas[j]):
+            escolhas[i] = ini + j
+            usadas[posicoes[ini + j]] = True
+
+    return escolhas, usadas
+
+
+def selecionar_atribuicao_global(linhas, posicoes, pontuacoes, total_linhas, total_erp):
+    """
+    Emparelhamento bipartido de custo mínimo entre linhas do extrato e títulos
+    do ERP: concilia o maior número possível de linhas e, entre essas soluções,
+    a de menor pontuação total. Nenhum título é usado duas vezes, então não há
+    duplicados para limpar depois.
+
+    O grafo de candidatos é quebrado em componentes conexas, que já saem
+    separadas por parcela/total e por janela de data, e cada componente é
+    resolvida isoladamente. `pontuacoes` precisa estar completa (sem poda).
+    Retorna (escolhas por linha, usadas) como selecionar_guloso.
+    """
+    usadas = np.zeros(total_erp, dtype=bool)
+    escolhas = np.full(total_linhas, -1, dtype=np.intp)
+    if len(linhas) == 0:
+        return escolhas, usadas
+
+    grafo = coo_matrix(
+        (np.ones(len(linhas)), (linhas, total_linhas + posicoes)),
+        shape=(total_linhas + total_erp, total_linhas + total_erp),
+    )
+    _, rotulos = connected_components(grafo, directed=False)
+    componente = rotulos[linhas]
+
+    ordem = np.argsort(componente, kind="stable")
+    quebras = np.flatnonzero(np.diff(componente[ordem])) + 1
+    for pares in np.split(ordem, quebras):
+        if len(pares) == 1:
+            escolhidos = pares
+        else:
+            escolhidos = _atribuir_componente(linhas[pares], posicoes[pares], pontuacoes[pares], pares)
+        escolhas[linhas[escolhidos]] = escolhidos
+        usadas[posicoes[escolhidos]] = True
+
+    return escolhas, usadas
+
+
+def _atribuir_componente(linhas, posicoes, pontuacoes, pares):
+    """Resolve uma componente e devolve os índices (em `pares`) dos pares escolhidos."""
+    linhas_comp, lin = np.unique(linhas, return_inverse=True)
+    posicoes_comp, col = np.unique(posicoes, return_inverse=True)
+
+    if len(linhas_comp) * len(posicoes_comp) > LIMITE_COMPONENTE_DENSA:
+        # Componente grande demais para a matriz densa: segue a ordem global de pontuação
+        linha_livre = np.ones(len(linhas_comp), dtype=bool)
+        titulo_livre = np.ones(len(posicoes_comp), dtype=bool)
+        escolhidos = []
+        for k in np.lexsort((pares, pontuacoes)):
+            if linha_livre[lin[k]] and titulo_livre[col[k]]:
+                linha_livre[lin[k]] = titulo_livre[col[k]] = False
+                escolhidos.append(pares[k])
+        return np.asarray(escolhidos, dtype=np.intp)
+
+    # Cada par real vale "pontuação - grande": a quantidade de pares vem antes da soma
+    grande = (np.max(pontuacoes) + 1) * (min(len(linhas_comp), len(posicoes_comp)) + 1)
+    custos = np.zeros((len(linhas_comp), len(posicoes_comp)))
+    indice_par = np.full(custos.shape, -1, dtype=np.intp)
+    custos[lin, col] = pontuacoes - grande
+    indice_par[lin, col] = pares
+
+    linhas_sol, colunas_sol = linear_sum_assignment(custos)
+    escolhidos = indice_par[linhas_sol, colunas_sol]
+    return escolhidos[escolhidos >= 0]
+
+
+# =========================
+# Núcleo de conciliação
+# =========================
+class _BaseErp:
+    """Estruturas do ERP montadas uma única vez por conciliação."""
+
+    def __init__(self, df_erp, perfil):
+        self.indice = IndiceJanela(df_erp["Emissão"], df_erp["Valor"], df_erp["Numero da Parcela"], df_erp["Total Parcelas"])
+        self.emissao_ns, _ = datas_em_ns(df_erp["Emissão"])
+        self.valores = df_erp["Valor"].to_numpy(dtype=float)
+        if "Pessoa do Título" in df_erp.columns:
+            self.penalidade = np.where(df_erp["Pessoa do Título"] != perfil.pessoa_titulo, perfil.penalidade_pessoa, 0)
+        else:
+            self.penalidade = np.zeros(len(df_erp), dtype=int)
+        self.codigos = [
+            normalizar_codigos(df_erp[coluna_erp], coluna_erp in perfil.codigos_numericos)
+            for _, coluna_erp in perfil.colunas_codigo()
+        ]
+        # Cada código soma no máximo 100 (similaridade zero) à pontuação
+        self.folga = 100 * len(self.codigos)
+        self.perfil = perfil
+
+    def partes_numericas(self, linhas, posicoes, venda_ns, valores_extrato):
+        """(dias, diferença de valor, base, penalidade) de cada par: a pontuação sem a similaridade."""
+        dias = np.abs(np.floor_divide(self.emissao_ns[posicoes] - venda_ns[linhas], NS_POR_DIA))
+        valor_dif = np.abs(self.valores[posicoes] - valores_extrato[linhas])
+        base = dias * self.perfil.peso_dias + valor_dif * self.perfil.peso_valor
+        return dias, valor_dif, base, self.penalidade[posicoes]
+
+
+class _Pares:
+    """Pares candidatos (linha do extrato, posição do ERP) e as partes da sua pontuação."""
+
+    def __init__(self, linhas, posicoes, erp, venda_ns, valores_extrato, codigos_extrato, perfil):
+        self.linhas = linhas
+        self.posicoes = posicoes
+        self.dias, self.valor_dif, self.base, self.penalidade = erp.partes_numericas(linhas, posicoes, venda_ns, valores_extrato)
+        self.limites = self.base + self.penalidade
+        self.folga = erp.folga
+
+        self.codigos = [(cod_erp[posicoes], cod_ext[linhas]) for cod_erp, cod_ext in zip(erp.codigos, codigos_extrato)]
+        # Código ausente dos dois lados conta como idêntico, como na comparação original por texto ("nan" == "nan")
+        self.exatas_por_codigo = [a == b for a, b in self.codigos]
+        if perfil.qualquer_chave_exata:
+            exatas = np.logical_or.reduce(self.exatas_por_codigo)
+            self.exatas_por_codigo = [exatas] * len(self.codigos)
+        else:
+            exatas = np.logical_and.reduce(self.exatas_por_codigo)
+
+        # Chaves idênticas valem similaridade 100 e já têm a pontuação final
+        self.pontuacoes = np.full(len(linhas), np.nan)
+        self.pontuacoes[exatas] = self.limites[exatas]
+
+    def completar(self, idx):
+        """Pontuação final dos pares `idx`, com a similaridade fuzzy calculada em lote."""
+        pontuacao = self.base[idx]
+        for (cod_erp, cod_ext), exatas in zip(self.codigos, self.exatas_por_codigo):
+            a, b = cod_erp[idx], cod_ext[idx]
+            similaridade = np.full(len(idx), 100.0)
+            fuzzy = ~exatas[idx]
+            similaridade[fuzzy] = similaridade_em_lote(a[fuzzy], b[fuzzy])
+            similaridade[(a == "") != (b == "")] = 0.0
+            pontuacao = pontuacao + (100 - similaridade)
+        return pontuacao + self.penalidade[idx]
+
+    def calcular_restantes(self, total_linhas, podar=True):
+        """Completa os pares sem pontuação; com `podar`, só os que ainda podem vencer na linha."""
+        if podar:
+            idx = np.flatnonzero(pares_a_calcular(self.linhas, self.limites, self.pontuacoes, total_linhas, self.folga))
+        else:
+            idx = np.flatnonzero(np.isnan(self.pontuacoes))
+        self.pontuacoes[idx] = self.completar(idx)
+
+    @classmethod
+    def juntar(cls, blocos):
+        """Concatena os pares de vários blocos (linhas já em numeração global)."""
+        juntos = object.__new__(cls)
+        juntos.folga = blocos[0].folga
+        for nome in ("linhas", "posicoes", "dias", "valor_dif", "base", "penalidade", "limites", "pontuacoes"):
+            setattr(juntos, nome, np.concatenate([getattr(b, nome) for b in blocos]))
+        juntos.codigos = [
+            tuple(np.concatenate(partes) for partes in zip(*[b.codigos[k] for b in blocos]))
+            for k in range(len(blocos[0].codigos))
+        ]
+        juntos.exatas_por_codigo = [
+            np.concatenate([b.exatas_por_codigo[k] for b in blocos])
+            for k in range(len(blocos[0].exatas_por_codigo))
+        ]
+        return juntos
+
+    def subconjunto(self, idx):
+        """Só os pares `idx`, nessa ordem."""
+        parte = object.__new__(type(self))
+        parte.folga = self.folga
+        for nome in ("linhas", "posicoes", "dias", "valor_dif", "base", "penalidade", "limites", "pontuacoes"):
+            setattr(parte, nome, getattr(self, nome)[idx])
+        parte.codigos = [(cod_erp[idx], cod_ext[idx]) for cod_erp, cod_ext in self.codigos]
+        parte.exatas_por_codigo = [exatas[idx] for exatas in self.exatas_por_codigo]
+        return parte
+
+
+def conciliar(df_extrato, df_erp, perfil, tolerancia_dias=None, tolerancia_valor=None,
+              atribuicao_global=False, incluir_detalhes=False, ao_progredir=None,
+              linhas_por_bloco=LINHAS_POR_BLOCO, max_candidatos=None, rastro=None, processos=None):
+    """
+    Concilia o extrato de um adquirente com o ERP segundo o `perfil`.
+
+    Retorna (df_resultado, usadas): o extrato com as colunas de resultado do
+    perfil, Status e Pontuação (e DIF_DIAS/DIF_VALOR com `incluir_detalhes`),
+    e a máscara dos títulos do ERP escolhidos. `ao_progredir(feitas, total)`
+    é chamado a cada bloco de linhas pontuado.
+
+    Com `max_candidatos`, cada linha fica só com os títulos mais próximos
+    pela parte numérica da pontuação (dias, valor e Pessoa do Título) antes
+    da similaridade fuzzy; útil em janelas largas, onde quase todo o ERP vira
+    candidato. `rastro` (um
+    registro.RastroDecisoes) grava uma amostra das decisões; quando omitido,
+    vem de registro.abrir_rastro.
+
+    Com `processos` > 1 os pares são gerados e pontuados em partições, num
+    pool de processos (ver pontuar_em_particoes); o resultado é o mesmo.
+    Quando omitido, extratos a partir de LINHAS_PARA_PARTICIONAR linhas usam
+    um processo por núcleo.
+    """
+    if tolerancia_dias is None:
+        tolerancia_dias = perfil.tolerancia_dias
+    if tolerancia_valor is None:
+        tolerancia_valor = perfil.tolerancia_valor
+
+    total = len(df_extrato)
+    sem_dados = _linhas_sem_dados(df_extrato, perfil)
+    if sem_dados.any():
+        logging.warning("⚠️ %d linhas da %s ignoradas por dados ausentes.", int(sem_dados.sum()), perfil.nome)
+
+    # Gulosa e global precisam de todos os pares; a seleção independente resolve bloco a bloco
+    acumular = atribuicao_global or perfil.selecao_gulosa
+    parametros = (perfil, tolerancia_dias, tolerancia_valor, atribuicao_global, max_candidatos, linhas_por_bloco)
+    processos = _processos_para(total, processos)
+    with etapa("Pontuação dos pares"):
+        if processos > 1:
+            pares, candidatos = pontuar_em_particoes(df_extrato, df_erp, *parametros, processos, ao_progredir)
+        else:
+            pares, candidatos = pontuar_pares(df_extrato, df_erp, *parametros, ao_progredir)
+
+    escolhidas = np.full(total, -1, dtype=np.intp)
+    pontuacao = np.full(total, np.nan)
+    dias = np.zeros(total, dtype=np.int64)
+    valor_dif = np.full(total, np.nan)
+
+    def registrar(pares, escolhas):
+        com_par = np.flatnonzero(escolhas >= 0)
+        selecionados = escolhas[com_par]
+        linhas = pares.linhas[selecionados]
+        escolhidas[linhas] = pares.posicoes[selecionados]
+        pontuacao[linhas] = pares.pontuacoes[selecionados]
+        dias[linhas] = pares.dias[selecionados]
+        valor_dif[linhas] = pares.valor_dif[selecionados]
+
+    usadas = np.zeros(len(df_erp), dtype=bool)
+    if pares is not None:
+        with etapa("Seleção dos pares"):
+            if not acumular:
+                # Na seleção independente já vem só o par escolhido de cada linha
+                registrar(pares, np.arange(len(pares.linhas)))
+                usadas[escolhidas[escolhidas >= 0]] = True
+            elif atribuicao_global:
+                escolhas, usadas = selecionar_atribuicao_global(pares.linhas, pares.posicoes, pares.pontuacoes, total, len(df_erp))
+                registrar(pares, escolhas)
+            else:
+                escolhas, usadas = selecionar_guloso(
+                    pares.linhas, pares.posicoes, pares.pontuacoes, pares.limites, total, len(df_erp), pares.completar
+                )
+                registrar(pares, escolhas)
+
+    conciliadas = escolhidas >= 0
+    logging.info("✅ %s: %d de %d linhas conciliadas.", perfil.nome, int(conciliadas.sum()), total)
+
+    if rastro is None:
+        rastro = abrir_rastro(perfil.nome)
+    if rastro is not None:
+        _gravar_rastro(rastro, df_erp, perfil, tolerancia_dias, tolerancia_valor, atribuicao_global,
+                       escolhidas, pontuacao, dias, valor_dif, candidatos)
+
+    return _montar_resultado(df_extrato, df_erp, perfil, escolhidas, pontuacao, dias, valor_dif, incluir_detalhes), usadas
+
+
+def _linhas_sem_dados(df_extrato, perfil):
+    """Linhas sem alguma das colunas obrigatórias do perfil; nunca recebem candidatos."""
+    sem_dados = np.zeros(len(df_extrato), dtype=bool)
+    for coluna in perfil.colunas_obrigatorias:
+        sem_dados |= df_extrato[coluna].isna().to_numpy()
+    return sem_dados
+
+
+def pontuar_pares(df_extrato, df_erp, perfil, tolerancia_dias, tolerancia_valor, atribuicao_global=False,
+                  max_candidatos=None, linhas_por_bloco=LINHAS_POR_BLOCO, ao_progredir=None):
+    """
+    Gera e pontua os pares candidatos, de `linhas_por_bloco` em
+    `linhas_por_bloco` linhas. Retorna (pares, candidatos por linha), com
+    pares None se nenhuma linha tem candidato. Na seleção gulosa ou global,
+    `pares` traz todos os pares (pontuados como a seleção precisa); na
+    seleção independente, só o par escolhido de cada linha.
+    """
+    total = len(df_extrato)
+    erp = _BaseErp(df_erp, perfil)
+
+    venda_ns, _ = datas_em_ns(df_extrato[COLUNA_DATA])
+    valores_extrato = df_extrato[COLUNA_VALOR].to_numpy(dtype=float)
+    codigos_extrato = [
+        normalizar_codigos(df_extrato[coluna], coluna_erp in perfil.codigos_numericos)
+        for coluna, coluna_erp in perfil.colunas_codigo()
+    ]
+    sem_dados = _linhas_sem_dados(df_extrato, perfil)
+
+    acumular = atribuicao_global or perfil.selecao_gulosa
+    blocos = []
+    candidatos = np.zeros(total, dtype=np.int64)
+
+    for inicio in range(0, total, linhas_por_bloco):
+        fim = min(inicio + linhas_por_bloco, total)
+        bloco = df_extrato.iloc[inicio:fim]
+        # Quando os pares vão ser podados, só os que sobram são ordenados
+        podar = not acumular or max_candidatos is not None
+        linhas, posicoes = erp.indice.pares(
+            bloco[COLUNA_DATA], bloco[COLUNA_VALOR], bloco[COLUNA_PARCELA], bloco[COLUNA_TOTAL],
+            tolerancia_dias, tolerancia_valor, dias_pelo_modulo=perfil.dias_pelo_modulo, ordenar=not podar
+        )
+        linhas = linhas + inicio
+        manter = ~sem_dados[linhas]
+        linhas, posicoes = linhas[manter], posicoes[manter]
+        candidatos += np.bincount(linhas, minlength=total)
+
+        # Antes de olhar os códigos, descarta pelos dias/valor os títulos que não têm como vencer
+        # (seleção independente) e os que passam dos `max_candidatos` mais próximos
+        if podar:
+            *_, base, penalidade = erp.partes_numericas(linhas, posicoes, venda_ns, valores_extrato)
+            proximos = podar_por_distancia(linhas - inicio, posicoes, base + penalidade, fim - inicio,
+                                           folga=np.inf if acumular else erp.folga, k=max_candidatos)
+            linhas, posicoes = linhas[proximos], posicoes[proximos]
+            ordem = np.lexsort((posicoes, linhas))
+            linhas, posicoes = linhas[ordem], posicoes[ordem]
+
+        pares = _Pares(linhas, posicoes, erp, venda_ns, valores_extrato, codigos_extrato, perfil)
+
+        if acumular:
+            blocos.append(pares)
+        else:
+            pares.calcular_restantes(total)
+            escolhas = selecionar_melhor_por_linha(pares.linhas, pares.pontuacoes, total)
+            blocos.append(pares.subconjunto(escolhas[escolhas >= 0]))
+
+        if ao_progredir is not None:
+            ao_progredir(fim, total)
+
+    if not blocos:
+        return None, candidatos
+    pares = _Pares.juntar(blocos)
+    if acumular:
+        # Na atribuição global todo par pode entrar na solução ótima, então nada é podado
+        pares.calcular_restantes(total, podar=not atribuicao_global)
+    return pares, candidatos
+
+
+# =========================
+# Conciliação em partições
+# =========================
+def _processos_para(total, processos):
+    """Processos usados para pontuar um extrato de `total` linhas (ver conciliar)."""
+    if processos is None:
+        # Dentro de um processo de pool (lote.py ou outra partição) não se abre outro pool
+        if total < LINHAS_PARA_PARTICIONAR or multiprocessing.parent_process() is not None:
+            return 1
+        processos = os.cpu_count() or 1
+    return max(1, processos)
+
+
+def contexto_processos():
+    """forkserver onde existe: o fork direto de um processo com threads (Streamlit) pode travar."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def particoes_do_extrato(df_extrato, n_particoes):
+    """
+    Divide as linhas do extrato em até `n_particoes` partições de tamanho
+    parecido, sem separar linhas de mesma (PARCELA, TOTAL_PARCELAS, semana
+    da venda). Linhas sem data ou parcela, que nunca têm candidatos, ficam
+    de fora. Retorna arrays de linhas em ordem crescente.
+    """
+    venda_ns, validas = datas_em_ns(df_extrato[COLUNA_DATA])
+    parcelas = pd.to_numeric(df_extrato[COLUNA_PARCELA], errors="coerce").to_numpy(dtype=float)
+    totais = pd.to_numeric(df_extrato[COLUNA_TOTAL], errors="coerce").to_numpy(dtype=float)
+    linhas = np.flatnonzero(validas & ~np.isnan(parcelas) & ~np.isnan(totais))
+    if len(linhas) == 0:
+        return []
+
+    semanas = venda_ns[linhas] // (7 * NS_POR_DIA)
+    ordem = np.lexsort((semanas, totais[linhas], parcelas[linhas]))
+    linhas, semanas = linhas[ordem], semanas[ordem]
+    p, t = parcelas[linhas], totais[linhas]
+    unidades = np.flatnonzero((p[1:] != p[:-1]) | (t[1:] != t[:-1]) | (semanas[1:] != semanas[:-1])) + 1
+
+    # Cada corte cai na primeira troca de unidade depois de k/n das linhas
+    alvos = np.arange(1, n_particoes) * len(linhas) / n_particoes
+    cortes = np.unique(unidades[np.minimum(np.searchsorted(unidades, alvos), len(unidades) - 1)]) if len(unidades) else []
+    return [np.sort(parte) for parte in np.split(linhas, cortes) if len(parte)]
+
+
+def _colunas_extrato(perfil):
+    colunas = [COLUNA_DATA, COLUNA_VALOR, COLUNA_PARCELA, COLUNA_TOTAL]
+    colunas += [coluna for coluna, _ in perfil.colunas_codigo()] + list(perfil.colunas_obrigatorias)
+    return list(dict.fromkeys(colunas))
+
+
+def _colunas_erp(df_erp, perfil):
+    colunas = ["Emissão", "Valor", "Numero da Parcela", "Total Parcelas", "Pessoa do Título"]
+    colunas += [coluna_erp for _, coluna_erp in perfil.colunas_codigo()]
+    return [coluna for coluna in dict.fromkeys(colunas) if coluna in df_erp.columns]
+
+
+def pontuar_em_particoes(df_extrato, df_erp, perfil, tolerancia_dias, tolerancia_valor, atribuicao_global=False,
+                         max_candidatos=None, linhas_por_bloco=LINHAS_POR_BLOCO, processos=2, ao_progredir=None):
+    """
+    Mesmo retorno de pontuar_pares, com o trabalho dividido num pool de
+    `processos` processos. Cada partição (particoes_do_extrato) leva só a
+    fatia do ERP que pode casar com ela: os títulos da mesma parcela/total
+    com emissão entre a primeira venda menos a tolerância de dias e a última
+    mais a tolerância. As fatias de semanas vizinhas se sobrepõem nessa
+    folga, e um título pode aparecer em mais de uma partição.
+
+    A pontuação e a poda de um par dependem só da sua linha, e as fatias
+    mantêm a ordem do ERP, então cada linha recebe exatamente os pares da
+    execução serial. As disputas de títulos entre partições são resolvidas
+    depois, pela seleção (gulosa, global ou por linha) sobre os pares
+    juntados na ordem serial (linha, posição no ERP).
+    """
+    total = len(df_extrato)
+    particoes = particoes_do_extrato(df_extrato, processos * PARTICOES_POR_PROCESSO)
+    if len(particoes) <= 1:
+        return pontuar_pares(df_extrato, df_erp, perfil, tolerancia_dias, tolerancia_valor,
+                             atribuicao_global, max_candidatos, linhas_por_bloco, ao_progredir)
+
+    indice = IndiceJanela(df_erp["Emissão"], df_erp["Valor"], df_erp["Numero da Parcela"], df_erp["Total Parcelas"])
+    venda_ns, _ = datas_em_ns(df_extrato[COLUNA_DATA])
+    parcelas = pd.to_numeric(df_extrato[COLUNA_PARCELA], errors="coerce").to_numpy(dtype=float)
+    totais = pd.to_numeric(df_extrato[COLUNA_TOTAL], errors="coerce").to_numpy(dtype=float)
+    margem = (tolerancia_dias + 1) * NS_POR_DIA
+    extrato = df_extrato[_colunas_extrato(perfil)]
+    erp = df_erp[_colunas_erp(df_erp, perfil)]
+
+    tarefas = []
+    for linhas in particoes:
+        janelas = pd.DataFrame({"p": parcelas[linhas], "t": totais[linhas], "venda": venda_ns[linhas]})
+        limites = janelas.groupby(["p", "t"])["venda"].agg(["min", "max"])
+        posicoes = [
+            indice.janela(p, t, inicio - margem, fim + margem)[0]
+            for (p, t), inicio, fim in zip(limites.index, limites["min"], limites["max"])
+        ]
+        posicoes = np.sort(np.concatenate(posicoes)) if posicoes else np.empty(0, dtype=np.intp)
+        tarefas.append((
+            extrato.iloc[linhas].reset_index(drop=True), linhas,
+            erp.iloc[posicoes].reset_index(drop=True), posicoes,
+            perfil, tolerancia_dias, tolerancia_valor, atribuicao_global, max_candidatos, linhas_por_bloco,
+        ))
+    logging.info("%s: %d linhas em %d partições, %d processos", perfil.nome, total, len(tarefas), processos)
+
+    candidatos = np.zeros(total, dtype=np.int64)
+    blocos = []
+    feitas = total - sum(len(linhas) for linhas in particoes)
+    with ProcessPoolExecutor(max_workers=processos, mp_context=contexto_processos(),
+                             initializer=limitar_threads) as pool:
+        for pares, linhas, candidatos_particao in pool.map(_pontuar_particao, tarefas):
+            candidatos[linhas] = candidatos_particao
+            if pares is not None:
+                blocos.append(pares)
+            feitas += len(linhas)
+            if ao_progredir is not None:
+                ao_progredir(feitas, total)
+
+    if not blocos:
+        return None, candidatos
+    pares = _Pares.juntar(blocos)
+    return pares.subconjunto(np.lexsort((pares.posicoes, pares.linhas))), candidatos
+
+
+def limitar_threads():
+    """Inicialização dos processos de pool: os processos já ocupam os núcleos, então a similaridade roda numa thread só."""
+    global WORKERS_SIMILARIDADE
+    WORKERS_SIMILARIDADE = 1
+
+
+def _pontuar_particao(tarefa):
+    df_extrato, linhas, df_erp, posicoes_erp, *parametros = tarefa
+    pares, candidatos = pontuar_pares(df_extrato, df_erp, *parametros)
+    if pares is not None:
+        # De volta à numeração do extrato e do ERP inteiros
+        pares.linhas = linhas[pares.linhas]
+        pares.posicoes = posicoes_erp[pares.posicoes]
+    return pares, linhas, candidatos
+
+
+def _gravar_rastro(rastro, df_erp, perfil, tolerancia_dias, tolerancia_valor, atribuicao_global,
+                   escolhidas, pontuacao, dias, valor_dif, candidatos):
+    """Grava no rastro as decisões das linhas amostradas."""
+    chaves = df_erp["Chave"].to_numpy(dtype=object) if "Chave" in df_erp.columns else None
+    registros = []
+    for linha in rastro.amostrar(len(escolhidas)):
+        posicao = int(escolhidas[linha])
+        conciliada = posicao >= 0
+        registros.append({
+            "perfil": perfil.nome,
+            "tolerancia_dias": tolerancia_dias,
+            "tolerancia_valor": tolerancia_valor,
+            "atribuicao_global": atribuicao_global,
+            "linha": int(linha),
+            "candidatos": int(candidatos[linha]),
+            "conciliada": conciliada,
+            "posicao_erp": posicao if conciliada else None,
+            "chave_erp": chaves[posicao] if conciliada and chaves is not None and pd.notna(chaves[posicao]) else None,
+            "pontuacao": float(pontuacao[linha]) if conciliada else None,
+            "dif_dias": int(dias[linha]) if conciliada else None,
+            "dif_valor": float(valor_dif[linha]) if conciliada else None,
+        })
+    rastro.gravar(registros)
+
+
+def _montar_resultado(df_extrato, df_erp, perfil, escolhidas, pontuacao, dias, valor_dif, incluir_detalhes):
+    """Copia o extrato e acrescenta as colunas de resultado a partir das posições escolhidas."""
+    df = df_extrato.copy()
+    conciliadas = escolhidas >= 0
+
+    for destino, origem in perfil.colunas_resultado:
+        if origem in df_erp.columns and isinstance(df_erp[origem].dtype, (pd.Int64Dtype, pd.CategoricalDtype)):
+            # Chaves (Int64) e categorias mantêm o tipo do ERP; linhas sem par ficam vazias
+            df[destino] = df_erp[origem].array.take(escolhidas, allow_fill=True)
+            continue
+        valores = np.full(len(df), None, dtype=object)
+        if origem in df_erp.columns:
+            valores[conciliadas] = df_erp[origem].to_numpy(dtype=object)[escolhidas[conciliadas]]
+        df[destino] = valores
+
+    if incluir_detalhes:
+        df["DIF_DIAS"] = np.where(conciliadas, dias, None)
+        df["DIF_VALOR"] = np.where(conciliadas, valor_dif, None)
+    df["Status"] = pd.Categorical.from_codes(np.where(conciliadas, 0, 1), categories=perfil.categorias_status())
+    df["Pontuação"] = np.where(conciliadas, np.round(pontuacao, perfil.casas_pontuacao), 999)
+    return df
@@ -0,0 +1,224 @@
+"""
+Conciliação pela linha de comando, sem o Streamlit.
+
+Roda a mesma leitura, limpeza, conciliação e exportação das páginas do app
+para um arquivo do ERP e um extrato de adquirente e mostra quanto tempo
+levou cada etapa. Serve para as execuções agendadas (ex.: de madrugada),
+sem navegador: o Streamlit nem chega a ser importado.
+
+Uso:
+    python conciliafacil.py cielo ERP.csv extrato_cielo.xlsx
+    python conciliafacil.py santander ERP.csv extrato.xlsx -o saida --formato xlsx csv chaves
+    python conciliafacil.py santander ERP.csv loja1.xlsx loja2.xlsx loja3.xlsx -j 4
+
+Com vários extratos, eles são conciliados em paralelo e juntados numa
+planilha consolidada (ver lote.py).
+
+O ERP limpo fica no cache em disco (ver cache.py), então a segunda
+execução com o mesmo ERP, mesmo para outro adquirente, pula a leitura.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from cache import carregar_limpo
+from conciliacao import VERSAO_LIMPEZA_ERP, carregar_erp, limpar_erp
+from exportacao import exportar_excel, gerar_arquivo_chaves, gerar_csv_zip, gerar_parquet_zip, nome_de_arquivo, pa
+from lote import ADQUIRENTES, conciliar_extrato, conciliar_lote, preparar_extrato, unidade_do_progresso
+from progresso import Progresso
+from registro import configurar_registro
+
+FORMATOS = ("xlsx", "csv", "parquet", "chaves")
+
+
+class Cronometro:
+    """Tempo de cada etapa, na ordem em que rodaram."""
+
+    def __init__(self, relogio=time.perf_counter):
+        self.relogio = relogio
+        self.etapas = []
+
+    @contextmanager
+    def etapa(self, nome):
+        inicio = self.relogio()
+        try:
+            yield
+        finally:
+            duracao = self.relogio() - inicio
+            self.etapas.append((nome, duracao))
+            logging.info("Etapa %s: %.2fs", nome, duracao)
+
+    def total(self):
+        return sum(duracao for _, duracao in self.etapas)
+
+    def tabela(self):
+        """Texto com uma linha por etapa e o total, para o terminal."""
+        largura = max([len(nome) for nome, _ in self.etapas] + [len("Total")])
+        linhas = [f"{nome:<{largura}}  {duracao:8.2f}s" for nome, duracao in self.etapas]
+        linhas.append(f"{'Total':<{largura}}  {self.total():8.2f}s")
+        return "\n".join(linhas)
+
+
+def progresso_terminal(descricao, unidade="linhas"):
+    """Progresso no stderr quando ele é um terminal; mudo nas execuções agendadas."""
+    if not sys.stderr.isatty():
+        return Progresso(descricao, unidade=unidade)
+
+    def saida(fracao, texto):
+        sys.stderr.write(f"\r{texto}\033[K")
+        sys.stderr.flush()
+
+    return Progresso(descricao, saida=saida, ao_concluir=lambda: sys.stderr.write("\r\033[K"), unidade=unidade)
+
+
+def conciliar_arquivos(adquirente, arquivo_erp, arquivos_extrato, atribuicao_global=False,
+                       usar_cache=True, processos=None, cronometro=None, ao_progredir=None, **opcoes):
+    """
+    Lê, limpa e concilia `arquivo_erp` com os extratos `arquivos_extrato` do
+    `adquirente`. Retorna o mesmo dicionário do gerar_resultado do módulo do
+    adquirente ("conciliados", "nao_conciliados", "relatorio", "abas"...),
+    consolidado quando há mais de um extrato. `opcoes` vão para o
+    gerar_resultado (ex.: busca_por_codigo do Santander).
+    """
+    cronometro = cronometro or Cronometro()
+
+    with cronometro.etapa("Leitura do ERP"):
+        if usar_cache:
+            df_erp = carregar_limpo(arquivo_erp, "erp", carregar_erp, limpar_erp, VERSAO_LIMPEZA_ERP)
+        else:
+            df_erp = limpar_erp(carregar_erp(arquivo_erp))
+
+    if len(arquivos_extrato) > 1:
+        with cronometro.etapa(f"Leitura e conciliação de {len(arquivos_extrato)} extratos"):
+            return conciliar_lote(
+                adquirente, df_erp, arquivos_extrato,
+                atribuicao_global=atribuicao_global, processos=processos, ao_progredir=ao_progredir, **opcoes,
+            )
+
+    with cronometro.etapa("Leitura do extrato"):
+        df_extrato = preparar_extrato(adquirente, arquivos_extrato[0])
+
+    with cronometro.etapa("Conciliação"):
+        return conciliar_extrato(
+            adquirente, df_extrato, df_erp, atribuicao_global=atribuicao_global, ao_progredir=ao_progredir, **opcoes
+        )
+
+
+def exportar(resultado, adquirente, pasta, formatos, cronometro=None):
+    """Grava as abas do resultado em `pasta` nos `formatos` pedidos; retorna os caminhos."""
+    cronometro = cronometro or Cronometro()
+    os.makedirs(pasta, exist_ok=True)
+    sufixo = nome_de_arquivo(adquirente)
+    abas = resultado["abas"]
+    caminhos = []
+
+    with cronometro.etapa("Exportação"):
+        if "xlsx" in formatos:
+            caminho = os.path.join(pasta, f"Conciliação_final_{sufixo}.xlsx")
+            if not exportar_excel(caminho, abas):
+                logging.warning("Coluna 'Chave ERP' não encontrada na aba Conciliados")
+            caminhos.append(caminho)
+        if "csv" in formatos:
+            caminhos.append(_gravar(os.path.join(pasta, f"conciliacao_{sufixo}_csv.zip"), gerar_csv_zip(abas)))
+        if "parquet" in formatos:
+            if pa is None:
+                logging.warning("pyarrow não está instalado; formato parquet ignorado.")
+            else:
+                caminhos.append(
+                    _gravar(os.path.join(pasta, f"conciliacao_{sufixo}_parquet.zip"), gerar_parquet_zip(abas))
+                )
+        if "chaves" in formatos:
+            df_chaves = abas.get("Conciliados")
+            if df_chaves is not None and "Chave ERP" in df_chaves.columns:
+                caminhos.append(
+                    _gravar(os.path.join(pasta, f"chaves_erp_{sufixo}.txt"), gerar_arquivo_chaves(df_chaves["Chave ERP"]))
+                )
+    return caminhos
+
+
+def _gravar(caminho, conteudo):
+    with open(caminho, "wb") as arquivo:
+        arquivo.write(conteudo)
+    return caminho
+
+
+def ler_argumentos(argumentos=None):
+    parser = argparse.ArgumentParser(
+        prog="conciliafacil",
+        description="Concilia o extrato de um adquirente com o ERP, sem a interface do Streamlit.",
+    )
+    parser.add_argument("adquirente", choices=sorted(ADQUIRENTES), help="adquirente do extrato")
+    parser.add_argument("erp", help="arquivo CSV exportado do ERP")
+    parser.add_argument(
+        "extratos", nargs="+", metavar="extrato",
+        help="extratos do adquirente (XLSX da Cielo e do Santander, CSV da CredShop)",
+    )
+    parser.add_argument("-o", "--pasta", default=".", help="pasta dos arquivos gerados (padrão: atual)")
+    parser.add_argument(
+        "--formato", nargs="+", choices=FORMATOS, default=["xlsx"],
+        help="arquivos gerados: xlsx (padrão), csv e parquet (um .zip por formato) e chaves (.txt)",
+    )
+    parser.add_argument(
+        "--atribuicao-global", action="store_true",
+        help="escolhe os pares pela menor pontuação total (mesma opção da barra lateral)",
+    )
+    parser.add_argument(
+        "--busca-por-codigo", action="store_true",
+        help="só santander: depois das duas passadas, concilia as sobras pela Autorização parecida",
+    )
+    parser.add_argument(
+        "-j", "--processos", type=int, default=None,
+        help="processos para vários extratos (padrão: um por núcleo)",
+    )
+    parser.add_argument("--sem-cache", action="store_true", help="não usa nem grava o cache em disco do ERP")
+    parser.add_argument("-v", "--verboso", action="store_true", help="mostra o log também no terminal")
+    return parser.parse_args(argumentos)
+
+
+def main(argumentos=None):
+    args = ler_argumentos(argumentos)
+    opcoes = {}
+    if args.busca_por_codigo:
+        if args.adquirente != "santander":
+            print("❌ --busca-por-codigo só vale para o santander", file=sys.stderr)
+            return 2
+        opcoes["busca_por_codigo"] = True
+    configurar_registro(console=args.verboso)
+
+    for caminho in (args.erp, *args.extratos):
+        if not os.path.isfile(caminho):
+            print(f"❌ Arquivo não encontrado: {caminho}", file=sys.stderr)
+            return 2
+
+    cronometro = Cronometro()
+    progresso = progresso_terminal("🔄 Conciliando", unidade_do_progresso(args.extratos))
+    try:
+        resultado = conciliar_arquivos(
+            args.adquirente, args.erp, args.extratos,
+            atribuicao_global=args.atribuicao_global, usar_cache=not args.sem_cache, processos=args.processos,
+            cronometro=cronometro, ao_progredir=progresso, **opcoes,
+        )
+        progresso.concluir()
+        caminhos = exportar(resultado, args.adquirente, args.pasta, args.formato, cronometro)
+    except Exception as e:
+        progresso.concluir()
+        logging.error("Erro na conciliação pela linha de comando: %s", e, exc_info=True)
+        print(f"❌ Erro: {e}", file=sys.stderr)
+        return 1
+
+    conciliados, nao_conciliados = resultado["conciliados"], resultado["nao_conciliados"]
+    print(f"✅ Conciliados: {len(conciliados)} títulos (R$ {conciliados['VALOR LÍQUIDO'].sum():,.2f})")
+    print(f"⚠ Não conciliados: {len(nao_conciliados)} títulos (R$ {nao_conciliados['VALOR LÍQUIDO'].sum():,.2f})")
+    for caminho in caminhos:
+        print(f"📥 {caminho}")
+    print()
+    print(cronometro.tabela())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
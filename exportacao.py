@@ -0,0 +1,332 @@
+"""
+Relatório e planilha final da conciliação, comuns aos três adquirentes.
+
+A planilha é escrita numa única passada, linha a linha, por um escritor de
+memória constante: xlsxwriter (modo constant_memory) quando instalado ou o
+openpyxl em modo write_only. Os blocos "Grupo N" do Resumo saem direto do
+DataFrame, sem reabrir o arquivo. gerar_planilha devolve a planilha em
+bytes, sem passar pelo diretório de trabalho (que é compartilhado entre as
+sessões do Streamlit).
+
+Para resultados grandes há também CSV e Parquet por aba (num .zip) e um
+arquivo simples com as chaves ERP conciliadas, uma por linha, para a
+importação no ERP.
+"""
+
+import io
+import logging
+import unicodedata
+import zipfile
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+try:
+    import xlsxwriter
+except ImportError:  # pragma: no cover - xlsxwriter é opcional
+    xlsxwriter = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pa_compute
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow é opcional
+    pa = None
+
+from instrumentacao import etapa
+
+
+TAMANHO_GRUPO_CHAVES = 2000
+
+# Linhas convertidas por vez ao escrever uma aba (a memória não cresce com o tamanho da aba)
+LINHAS_POR_LOTE = 10_000
+
+FORMATO_DATA = "yyyy-mm-dd hh:mm:ss"
+
+# CSV no padrão do Excel brasileiro, como o CSV do ERP
+SEPARADOR_CSV = ";"
+DECIMAL_CSV = ","
+FORMATO_DATA_CSV = "%d/%m/%Y"
+
+
+def gerar_relatorio(secoes, outros=None):
+    """
+    Monta o DataFrame do relatório. `secoes` é uma lista de (título, df) com
+    as colunas VALOR LÍQUIDO e VALOR DA PARCELA; `outros` é uma lista opcional
+    de (descrição, valor) exibida na seção OUTROS.
+    """
+    relatorio_dados = [["RELATÓRIO DE CONCILIAÇÃO", "", ""]]
+
+    for n, (titulo, df) in enumerate(secoes):
+        if n > 0:
+            relatorio_dados.append(["", "", ""])
+        relatorio_dados += [
+            [titulo, "", ""],
+            ["- Valor Líquido Total", "", f"R$ {df['VALOR LÍQUIDO'].sum():,.2f}"],
+            ["- Valor da Parcela Total", "", f"R$ {df['VALOR DA PARCELA'].sum():,.2f}"],
+            ["- Quantidade de Títulos", "", f"{len(df)}"],
+        ]
+
+    if outros:
+        relatorio_dados += [["", "", ""], ["OUTROS", "", ""]]
+        relatorio_dados += [[f"- {descricao}", "", f"R$ {valor:,.2f}"] for descricao, valor in outros]
+
+    return pd.DataFrame(relatorio_dados, columns=["Categoria", "Descrição", "Valor"])
+
+
+def exportar_excel(caminho, abas, aba_chaves="Conciliados", coluna_chave="Chave ERP", aba_resumo="Resumo"):
+    """
+    Grava as `abas` ({nome: DataFrame}, na ordem) em `caminho` (arquivo ou
+    objeto como BytesIO) e acrescenta à aba de resumo os blocos "Grupo N"
+    com as chaves ERP conciliadas, de TAMANHO_GRUPO_CHAVES em
+    TAMANHO_GRUPO_CHAVES. Retorna False se a coluna de chave não existir na
+    aba `aba_chaves` (a planilha é gravada sem os blocos).
+    """
+    blocos = []
+    df_chaves = abas.get(aba_chaves)
+    if df_chaves is not None and coluna_chave in df_chaves.columns:
+        blocos = blocos_de_chaves(df_chaves[coluna_chave])
+    else:
+        logging.warning("Coluna '%s' não encontrada na aba %s", coluna_chave, aba_chaves)
+
+    with etapa("Escrita do Excel"):
+        escritor = _EscritorXlsxwriter(caminho) if xlsxwriter is not None else _EscritorOpenpyxl(caminho)
+        try:
+            for nome, df in abas.items():
+                escritor.nova_aba(nome)
+                escritor.cabecalho([str(coluna) for coluna in df.columns])
+                for inicio in range(0, len(df), LINHAS_POR_LOTE):
+                    for linha in _linhas(df.iloc[inicio:inicio + LINHAS_POR_LOTE]):
+                        escritor.linha(linha)
+
+                # === BLOCOS DE CHAVE ERP NA ABA RESUMO (uma linha em branco depois do resumo) ===
+                if nome == aba_resumo and blocos:
+                    escritor.linha([])
+                    for n, texto in enumerate(blocos, start=1):
+                        escritor.linha([f"Grupo {n}", texto])
+        finally:
+            escritor.fechar()
+
+    return df_chaves is not None and coluna_chave in df_chaves.columns
+
+
+def gerar_planilha(abas, **opcoes):
+    """
+    Planilha de exportar_excel em bytes, pronta para o st.download_button.
+    Retorna (conteúdo, blocos_gravados), com blocos_gravados igual ao
+    retorno de exportar_excel.
+    """
+    # Os bytes ficam no resultado em cache para o download, então a planilha é montada já em memória
+    arquivo = io.BytesIO()
+    blocos_gravados = exportar_excel(arquivo, abas, **opcoes)
+    return arquivo.getvalue(), blocos_gravados
+
+
+def blocos_de_chaves(chaves):
+    """Chaves (sem vazios) como texto, unidas por ", " em blocos de TAMANHO_GRUPO_CHAVES."""
+    textos = textos_de_chaves(chaves)
+    return [", ".join(textos[i:i + TAMANHO_GRUPO_CHAVES]) for i in range(0, len(textos), TAMANHO_GRUPO_CHAVES)]
+
+
+def textos_de_chaves(chaves):
+    """Chaves ERP não vazias como aparecem na planilha."""
+    textos = [_texto_da_chave(chave) for chave in chaves.dropna().tolist()]
+    return [texto for texto in textos if texto != ""]
+
+
+def _texto_da_chave(chave):
+    # Como a chave aparece na planilha: 123.0 vira "123"
+    if isinstance(chave, float) and chave.is_integer():
+        return str(int(chave))
+    return str(chave)
+
+
+# =========================
+# CSV, Parquet e arquivo de chaves
+# =========================
+def gerar_arquivo_chaves(chaves):
+    """Chaves ERP conciliadas, uma por linha (texto UTF-8), para importar no ERP."""
+    return "".join(f"{texto}\n" for texto in textos_de_chaves(chaves)).encode("utf-8")
+
+
+def gerar_csv_zip(abas, ignorar=("Resumo",)):
+    """
+    .zip com um CSV (separado por ';', vírgula decimal, UTF-8 com BOM para o
+    Excel) para cada aba fora de `ignorar`. Cada CSV é escrito direto no .zip,
+    pelo escritor de CSV do pyarrow quando instalado ou pelo to_csv em lotes.
+    """
+    def gravar(zf):
+        for nome, df in abas.items():
+            if nome in ignorar:
+                continue
+            with zf.open(f"{nome_de_arquivo(nome)}.csv", "w") as destino:
+                if pa is not None:
+                    destino.write("\ufeff".encode("utf-8"))
+                    pa_csv.write_csv(_tabela_csv(df), destino, pa_csv.WriteOptions(delimiter=SEPARADOR_CSV))
+                    continue
+                with io.TextIOWrapper(destino, encoding="utf-8-sig", newline="") as texto:
+                    df.to_csv(
+                        texto, sep=SEPARADOR_CSV, decimal=DECIMAL_CSV, date_format=FORMATO_DATA_CSV,
+                        index=False, chunksize=LINHAS_POR_LOTE,
+                    )
+
+    return _zip_em_bytes(gravar, zipfile.ZIP_DEFLATED)
+
+
+def gerar_parquet_zip(abas, ignorar=("Resumo",)):
+    """.zip com um Parquet para cada aba fora de `ignorar` (requer pyarrow)."""
+    if pa is None:
+        raise ImportError("pyarrow não está instalado; exportação Parquet indisponível.")
+
+    def gravar(zf):
+        for nome, df in abas.items():
+            if nome in ignorar:
+                continue
+            with zf.open(f"{nome_de_arquivo(nome)}.parquet", "w") as destino:
+                pq.write_table(_tabela_arrow(df), destino)
+
+    # Parquet já vem comprimido; o .zip só agrupa os arquivos
+    return _zip_em_bytes(gravar, zipfile.ZIP_STORED)
+
+
+def nome_de_arquivo(aba):
+    """Nome de aba como nome de arquivo: "Não conciliados" -> "nao_conciliados"."""
+    sem_acento = unicodedata.normalize("NFKD", aba).encode("ascii", "ignore").decode("ascii")
+    return "_".join(sem_acento.lower().split())
+
+
+def _zip_em_bytes(gravar, compressao):
+    arquivo = io.BytesIO()
+    with zipfile.ZipFile(arquivo, "w", compressao) as zf:
+        gravar(zf)
+    return arquivo.getvalue()
+
+
+def _tabela_arrow(df):
+    """Tabela Arrow de `df`; colunas object com tipos misturados (ex.: int e texto) vão como texto."""
+    colunas = {}
+    for nome, serie in df.items():
+        try:
+            colunas[str(nome)] = pa.array(serie, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            colunas[str(nome)] = pa.array(serie.map(lambda valor: None if pd.isna(valor) else str(valor)), type=pa.string())
+    return pa.table(colunas)
+
+
+def _tabela_csv(df):
+    """Tabela Arrow de `df` com números decimais e datas já formatados como no CSV."""
+    tabela = _tabela_arrow(df)
+    colunas = []
+    for coluna in tabela.columns:
+        if pa.types.is_floating(coluna.type):
+            coluna = pa_compute.replace_substring(pa_compute.cast(coluna, pa.string()), ".", DECIMAL_CSV)
+        elif pa.types.is_timestamp(coluna.type) or pa.types.is_date(coluna.type):
+            coluna = pa_compute.strftime(coluna, format=FORMATO_DATA_CSV)
+        colunas.append(coluna)
+    return pa.table(colunas, names=tabela.column_names)
+
+
+def _linhas(df):
+    """Linhas de `df` como listas de valores Python, com None no lugar de NaN/NaT/NA."""
+    colunas = [
+        serie.astype(object).where(serie.notna(), None).tolist()
+        for _, serie in df.items()
+    ]
+    return zip(*colunas)
+
+
+class _EscritorXlsxwriter:
+    def __init__(self, caminho):
+        self.livro = xlsxwriter.Workbook(caminho, {
+            "constant_memory": True,
+            "default_date_format": FORMATO_DATA,
+            "nan_inf_to_errors": True,
+            "strings_to_formulas": False,
+            "strings_to_urls": False,
+        })
+        self.formato_cabecalho = self.livro.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+        self.aba = None
+        self.proxima = 0
+
+    def nova_aba(self, nome):
+        self.aba = self.livro.add_worksheet(nome)
+        self.proxima = 0
+
+    def cabecalho(self, nomes):
+        self.aba.write_row(self.proxima, 0, nomes, self.formato_cabecalho)
+        self.proxima += 1
+
+    def linha(self, valores):
+        self.aba.write_row(self.proxima, 0, valores)
+        self.proxima += 1
+
+    def fechar(self):
+        self.livro.close()
+
+
+class _EscritorOpenpyxl:
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.livro = Workbook(write_only=True)
+        self.aba = None
+
+    def nova_aba(self, nome):
+        self.aba = self.livro.create_sheet(nome)
+
+    def cabecalho(self, nomes):
+        fino = Side(style="thin")
+        celulas = []
+        for nome in nomes:
+            celula = WriteOnlyCell(self.aba, value=nome)
+            celula.font = Font(bold=True)
+            celula.border = Border(left=fino, right=fino, top=fino, bottom=fino)
+            celula.alignment = Alignment(horizontal="center", vertical="top")
+            celulas.append(celula)
+        self.aba.append(celulas)
+
+    def linha(self, valores):
+        self.aba.append(valores)
+
+    def fechar(self):
+        self.livro.save(self.caminho)
+
+
+def mostrar_outros_formatos(abas, adquirente, aba_chaves="Conciliados", coluna_chave="Chave ERP"):
+    """
+    Botões do Streamlit para baixar as abas em CSV e Parquet e o arquivo de
+    chaves ERP. Cada arquivo só é gerado quando o botão é clicado.
+    """
+    import streamlit as st
+
+    sufixo = nome_de_arquivo(adquirente)
+    with st.expander("📦 Outros formatos"):
+        st.download_button(
+            label="📄 CSV por aba (.zip)",
+            data=lambda: gerar_csv_zip(abas),
+            file_name=f"conciliacao_{sufixo}_csv.zip",
+            mime="application/zip",
+            on_click="ignore",
+            key=f"{sufixo}_csv",
+        )
+        if pa is not None:
+            st.download_button(
+                label="🧱 Parquet por aba (.zip)",
+                data=lambda: gerar_parquet_zip(abas),
+                file_name=f"conciliacao_{sufixo}_parquet.zip",
+                mime="application/zip",
+                on_click="ignore",
+                key=f"{sufixo}_parquet",
+            )
+        df_chaves = abas.get(aba_chaves)
+        if df_chaves is not None and coluna_chave in df_chaves.columns:
+            st.download_button(
+                label="🔑 Chaves ERP conciliadas (.txt)",
+                data=lambda: gerar_arquivo_chaves(df_chaves[coluna_chave]),
+                file_name=f"chaves_erp_{sufixo}.txt",
+                mime="text/plain",
+                on_click="ignore",
+                key=f"{sufixo}_chaves",
+            )
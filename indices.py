@@ -0,0 +1,229 @@
+"""
+Estruturas de busca usadas pela conciliação.
+
+Os índices são montados uma única vez sobre o ERP: o IndiceJanela é
+consultado para todas as linhas do extrato de uma vez e o IndiceQGramas a
+cada linha, evitando varrer o ERP inteiro a cada linha.
+"""
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+
+NS_POR_DIA = 86_400_000_000_000
+
+
+def datas_em_ns(datas):
+    """Converte datas para int64 em nanossegundos e devolve a máscara das datas válidas."""
+    serie = pd.to_datetime(pd.Series(datas), errors="coerce")
+    valores = serie.to_numpy(dtype="datetime64[ns]")
+    return valores.view("int64"), ~np.isnat(valores)
+
+
+# =========================
+# Índice por janela de data
+# =========================
+class IndiceJanela:
+    """
+    Agrupa os títulos do ERP por (parcela, total de parcelas) e ordena cada
+    grupo pela data de emissão. A janela de datas é encontrada por busca
+    binária e a tolerância de valor é aplicada só sobre a fatia resultante.
+    """
+
+    def __init__(self, datas, valores, parcelas, totais):
+        datas_ns, validas = datas_em_ns(datas)
+        valores = np.asarray(valores, dtype=float)
+        parcelas = np.asarray(parcelas)
+        totais = np.asarray(totais)
+
+        # Títulos sem data de emissão nunca entram em uma janela
+        posicoes = np.flatnonzero(validas)
+        ordem = np.lexsort((datas_ns[posicoes], totais[posicoes], parcelas[posicoes]))
+        posicoes = posicoes[ordem]
+
+        self._grupos = {}
+        if len(posicoes) == 0:
+            return
+
+        p = parcelas[posicoes]
+        t = totais[posicoes]
+        quebras = np.flatnonzero((p[1:] != p[:-1]) | (t[1:] != t[:-1])) + 1
+        inicios = np.concatenate(([0], quebras))
+        fins = np.concatenate((quebras, [len(posicoes)]))
+
+        for inicio, fim in zip(inicios, fins):
+            pos_grupo = posicoes[inicio:fim]
+            self._grupos[(int(p[inicio]), int(t[inicio]))] = (
+                pos_grupo,
+                datas_ns[pos_grupo],
+                valores[pos_grupo],
+            )
+
+    def janela(self, parcela, total, inicio_ns, fim_ns):
+        """Retorna (posições, valores) do grupo com emissão em [inicio_ns, fim_ns)."""
+        grupo = self._grupos.get((int(parcela), int(total)))
+        if grupo is None:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=float)
+
+        pos_grupo, datas_grupo, valores_grupo = grupo
+        lo = np.searchsorted(datas_grupo, inicio_ns, side="left")
+        hi = np.searchsorted(datas_grupo, fim_ns, side="left")
+        return pos_grupo[lo:hi], valores_grupo[lo:hi]
+
+    def pares(self, datas, valores, parcelas, totais, tolerancia_dias, tolerancia_valor, dias_pelo_modulo=False, ordenar=True):
+        """
+        Gera de uma vez todos os pares (linha do extrato, posição do ERP) que
+        atendem à janela de data, à tolerância de valor e à parcela/total.
+        Os pares saem ordenados por linha e, dentro da linha, pela ordem do ERP
+        (com `ordenar=False` saem agrupados por parcela/total, sem ordenação).
+
+        Com `dias_pelo_modulo` a diferença é medida como abs(diferença).days
+        (filtro do Santander); sem ele, como abs(diferença.days) (Cielo/Credshop).
+        """
+        datas_ns, validas = datas_em_ns(datas)
+        valores = np.asarray(valores, dtype=float)
+        parcelas = pd.Series(parcelas).to_numpy()
+        totais = pd.Series(totais).to_numpy()
+        validas &= ~pd.isna(parcelas) & ~pd.isna(totais)
+
+        if dias_pelo_modulo:
+            inicios = datas_ns - (tolerancia_dias + 1) * NS_POR_DIA + 1
+        else:
+            inicios = datas_ns - tolerancia_dias * NS_POR_DIA
+        fins = datas_ns + (tolerancia_dias + 1) * NS_POR_DIA
+
+        linhas_validas = np.flatnonzero(validas)
+        grupos_extrato = pd.Series(linhas_validas).groupby(
+            [parcelas[linhas_validas].astype(int), totais[linhas_validas].astype(int)], sort=False
+        ).indices
+
+        todas_linhas, todas_posicoes = [], []
+        for chave, idx in grupos_extrato.items():
+            grupo = self._grupos.get((int(chave[0]), int(chave[1])))
+            if grupo is None:
+                continue
+            pos_grupo, datas_grupo, valores_grupo = grupo
+            linhas = linhas_validas[idx]
+
+            lo = np.searchsorted(datas_grupo, inicios[linhas], side="left")
+            hi = np.searchsorted(datas_grupo, fins[linhas], side="left")
+            quantidades = hi - lo
+            if quantidades.sum() == 0:
+                continue
+
+            # Expande cada janela [lo, hi) em índices individuais do grupo
+            linhas_rep = np.repeat(linhas, quantidades)
+            deslocamento = np.repeat(lo - np.cumsum(quantidades) + quantidades, quantidades)
+            indices_grupo = np.arange(len(linhas_rep)) + deslocamento
+
+            mascara = np.abs(valores_grupo[indices_grupo] - valores[linhas_rep]) <= tolerancia_valor
+            todas_linhas.append(linhas_rep[mascara])
+            todas_posicoes.append(pos_grupo[indices_grupo[mascara]])
+
+        if not todas_linhas:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+        linhas = np.concatenate(todas_linhas)
+        posicoes = np.concatenate(todas_posicoes)
+        if not ordenar:
+            return linhas, posicoes
+        ordem = np.lexsort((posicoes, linhas))
+        return linhas[ordem], posicoes[ordem]
+
+
+# =========================
+# Índice de q-gramas (busca aproximada)
+# =========================
+class IndiceQGramas:
+    """
+    Busca aproximada de códigos (Autorização, NSU...) por fuzz.ratio.
+
+    Os textos distintos são indexados por q-grama (listas invertidas) e por
+    tamanho. Um texto só é pontuado pelo rapidfuzz se o tamanho e a
+    quantidade de q-gramas em comum permitirem atingir o corte; os demais
+    nunca são tocados. O resultado é o mesmo de process.extract com
+    scorer=fuzz.ratio sobre a coluna inteira, filtrado pelo corte.
+    """
+
+    def __init__(self, textos, q=2):
+        self.q = q
+        codigos, unicos = pd.factorize(pd.Series(textos, dtype=object).astype(str), sort=False)
+        self.textos = np.asarray(unicos, dtype=object)
+        self.codigos = codigos
+        self.tamanhos = np.array([len(t) for t in self.textos], dtype=np.int64)
+
+        ordem = np.argsort(codigos, kind="stable")
+        quebras = np.searchsorted(codigos[ordem], np.arange(len(self.textos) + 1))
+        self._posicoes = [ordem[quebras[k]:quebras[k + 1]] for k in range(len(self.textos))]
+        self._por_texto = {texto: k for k, texto in enumerate(self.textos)}
+
+        listas = {}
+        for k, texto in enumerate(self.textos):
+            for grama in self._gramas(texto):
+                listas.setdefault(grama, []).append(k)
+        self._listas = {grama: np.asarray(ids, dtype=np.intp) for grama, ids in listas.items()}
+
+        ordem_tamanho = np.argsort(self.tamanhos, kind="stable")
+        limites = np.searchsorted(self.tamanhos[ordem_tamanho], np.arange(self.tamanhos.max(initial=0) + 2))
+        self._por_tamanho = [ordem_tamanho[limites[t]:limites[t + 1]] for t in range(len(limites) - 1)]
+
+    def _gramas(self, texto):
+        """q-gramas do texto com bordas, numerados por ocorrência (multiconjunto vira conjunto)."""
+        texto = "\x02" * (self.q - 1) + texto + "\x03" * (self.q - 1)
+        vistos = {}
+        gramas = []
+        for i in range(len(texto) - self.q + 1):
+            grama = texto[i:i + self.q]
+            n = vistos.get(grama, 0)
+            vistos[grama] = n + 1
+            gramas.append((grama, n))
+        return gramas
+
+    def posicoes(self, texto):
+        """Todas as posições com exatamente esse texto."""
+        k = self._por_texto.get(texto)
+        return self._posicoes[k] if k is not None else np.empty(0, dtype=np.intp)
+
+    def candidatos(self, consulta, corte=80):
+        """Ids dos textos distintos que ainda podem ter fuzz.ratio >= corte com `consulta`."""
+        tamanho = len(consulta)
+        listas = [self._listas[g] for g in self._gramas(consulta) if g in self._listas]
+        comuns = np.bincount(np.concatenate(listas), minlength=len(self.textos)) if listas else np.zeros(len(self.textos), dtype=np.int64)
+
+        # ratio = 100 * (1 - indel / (la + lb)); cada inserção/remoção desfaz no máximo q gramas
+        fracao = (100 - corte) / 100
+        menor = int(np.ceil(tamanho * (1 - fracao) / (1 + fracao) - 1e-9))
+        maior = int(np.floor(tamanho * (1 + fracao) / (1 - fracao) + 1e-9)) if fracao < 1 else self.tamanhos.max(initial=0)
+
+        ids = []
+        for t in range(max(menor, 0), min(maior, len(self._por_tamanho) - 1) + 1):
+            grupo = self._por_tamanho[t]
+            if len(grupo) == 0:
+                continue
+            edicoes = int(np.floor(fracao * (tamanho + t) + 1e-9))
+            minimo = max(tamanho, t) + self.q - 1 - self.q * edicoes
+            ids.append(grupo if minimo <= 0 else grupo[comuns[grupo] >= minimo])
+        return np.concatenate(ids) if ids else np.empty(0, dtype=np.intp)
+
+    def buscar(self, consulta, limite=10, corte=80):
+        """
+        (posições, pontuações) das até `limite` posições de maior fuzz.ratio
+        com `consulta` e pontuação >= corte, em ordem decrescente de
+        pontuação e, no empate, de posição.
+        """
+        consulta = str(consulta)
+        ids = self.candidatos(consulta, corte)
+        if len(ids) == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=float)
+
+        pontuacoes = process.cdist([consulta], list(self.textos[ids]), scorer=fuzz.ratio, dtype=np.float64)[0]
+        aprovados = pontuacoes >= corte
+        ids, pontuacoes = ids[aprovados], pontuacoes[aprovados]
+        if len(ids) == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=float)
+
+        posicoes = np.concatenate([self._posicoes[k] for k in ids])
+        pontuacoes = np.repeat(pontuacoes, [len(self._posicoes[k]) for k in ids])
+        ordem = np.lexsort((posicoes, -pontuacoes))[:limite]
+        return posicoes[ordem], pontuacoes[ordem]
@@ -0,0 +1,247 @@
+"""
+Medição das etapas da conciliação: tempo, memória e perfil opcional.
+
+Os módulos marcam as etapas com `with etapa("Primeira passada"):`. Fora de
+uma medição (linha de comando, benchmarks) isso não faz nada. Dentro de
+medir(), cada etapa registra a duração e a memória residente (RSS) do
+processo no fim e no pico, amostrada por uma thread com o psutil. A medição
+ativa fica num ContextVar, então as etapas das sessões do Streamlit (uma
+thread cada) não se misturam; a memória, porém, é a do processo inteiro e
+inclui o que as outras sessões estiverem usando.
+
+Com `perfil=True`, medir() também roda o cProfile e guarda o .pstats para
+baixar. Só um perfil roda por vez no processo (no Python 3.12+ o
+sys.monitoring só aceita um profiler); enquanto outra sessão captura, a
+medição segue sem perfil e avisa.
+
+Etapas que rodam em outros processos (vários extratos em lote.py) aparecem
+só pelo tempo total do lote.
+"""
+
+import contextvars
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - psutil é opcional
+    psutil = None
+
+
+# Segundos entre duas amostras de memória durante a medição
+INTERVALO_AMOSTRAS = 0.05
+
+# Funções mostradas no resumo do perfil (ordenadas pelo tempo acumulado)
+LINHAS_PERFIL = 30
+
+MB = 1024 * 1024
+
+# A memória é do processo inteiro (todas as sessões do Streamlit), não só desta conciliação
+COLUNA_RSS_FIM = "RSS do processo no fim (MB)"
+COLUNA_PICO = "Pico do processo (MB)"
+
+_medicao_ativa = contextvars.ContextVar("medicao_ativa", default=None)
+
+# Livre quando nenhuma medição do processo está rodando o cProfile
+_trava_perfil = threading.Lock()
+
+AVISO_PERFIL_OCUPADO = "Outra conciliação está capturando o perfil; esta rodou sem o cProfile."
+
+
+def rss_atual():
+    """Memória residente do processo, em bytes (None sem psutil)."""
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+class Medicao:
+    """Etapas medidas, na ordem em que começaram, e as amostras de memória (ver medir)."""
+
+    def __init__(self, intervalo=INTERVALO_AMOSTRAS, relogio=time.perf_counter):
+        self.intervalo = intervalo
+        self.relogio = relogio
+        self.etapas = []        # (nome, nível, início, fim, RSS no fim)
+        self.amostras = []      # (instante, RSS)
+        self.perfil = None
+        self.aviso = None
+        self._nivel = 0
+        self._parar = threading.Event()
+        self._amostrador = None
+
+    @contextmanager
+    def etapa(self, nome):
+        indice = len(self.etapas)
+        self.etapas.append((nome, self._nivel, self.relogio(), None, None))
+        self._nivel += 1
+        try:
+            yield
+        finally:
+            self._nivel -= 1
+            self._amostrar()
+            nome, nivel, inicio, _, _ = self.etapas[indice]
+            self.etapas[indice] = (nome, nivel, inicio, self.relogio(), self.amostras[-1][1] if self.amostras else None)
+
+    def iniciar(self, perfil=False):
+        if psutil is not None:
+            self._amostrar()
+            self._amostrador = threading.Thread(target=self._amostrar_ate_parar, name="amostras-rss", daemon=True)
+            self._amostrador.start()
+        if perfil:
+            self._iniciar_perfil()
+
+    def _iniciar_perfil(self):
+        if not _trava_perfil.acquire(blocking=False):
+            self.aviso = AVISO_PERFIL_OCUPADO
+            return
+        self.perfil = cProfile.Profile()
+        try:
+            self.perfil.enable()
+        except ValueError:
+            # Outro profiler (fora desta medição) já está ativo no processo
+            self.perfil = None
+            _trava_perfil.release()
+            self.aviso = AVISO_PERFIL_OCUPADO
+
+    def parar(self):
+        if self.perfil is not None:
+            self.perfil.disable()
+            _trava_perfil.release()
+        if self._amostrador is not None:
+            self._parar.set()
+            self._amostrador.join()
+            self._amostrar()
+
+    def _amostrar(self):
+        rss = rss_atual()
+        if rss is not None:
+            self.amostras.append((self.relogio(), rss))
+
+    def _amostrar_ate_parar(self):
+        while not self._parar.wait(self.intervalo):
+            self._amostrar()
+
+    def pico(self, inicio=None, fim=None):
+        """Maior RSS amostrado entre `inicio` e `fim` (a medição inteira quando omitidos)."""
+        rss = [r for t, r in self.amostras if (inicio is None or t >= inicio) and (fim is None or t <= fim)]
+        return max(rss) if rss else None
+
+    def tabela(self):
+        """Uma linha por etapa (subetapas recuadas) com segundos, RSS do processo no fim e pico, em MB."""
+        linhas = []
+        for nome, nivel, inicio, fim, rss_fim in self.etapas:
+            fim = self.relogio() if fim is None else fim
+            pico = self.pico(inicio, fim)
+            linhas.append({
+                "Etapa": "   " * (nivel - 1) + "↳ " + nome if nivel else nome,
+                "Segundos": round(fim - inicio, 3),
+                COLUNA_RSS_FIM: None if rss_fim is None else round(rss_fim / MB),
+                COLUNA_PICO: None if pico is None else round(pico / MB),
+            })
+        return pd.DataFrame(linhas, columns=["Etapa", "Segundos", COLUNA_RSS_FIM, COLUNA_PICO])
+
+    def resumo(self):
+        """Dicionário guardável em cache: tabela, pico geral, aviso e, com perfil, o .pstats e o texto dele."""
+        resumo = {"etapas": self.tabela(), "pico_mb": None, "perfil": None, "perfil_texto": None, "aviso": self.aviso}
+        pico = self.pico()
+        if pico is not None:
+            resumo["pico_mb"] = round(pico / MB)
+        if self.perfil is not None:
+            self.perfil.create_stats()
+            # Mesmo conteúdo de Profile.dump_stats; abre com pstats.Stats(caminho)
+            resumo["perfil"] = marshal.dumps(self.perfil.stats)
+            texto = io.StringIO()
+            pstats.Stats(self.perfil, stream=texto).sort_stats("cumulative").print_stats(LINHAS_PERFIL)
+            resumo["perfil_texto"] = texto.getvalue()
+        return resumo
+
+
+@contextmanager
+def medir(perfil=False):
+    """Liga uma Medicao para as etapas marcadas dentro do bloco; com `perfil`, roda o cProfile junto."""
+    medicao = Medicao()
+    token = _medicao_ativa.set(medicao)
+    medicao.iniciar(perfil)
+    try:
+        yield medicao
+    finally:
+        medicao.parar()
+        _medicao_ativa.reset(token)
+
+
+@contextmanager
+def etapa(nome):
+    """Marca uma etapa da medição ativa; sem medição ativa, não faz nada."""
+    medicao = _medicao_ativa.get()
+    if medicao is None:
+        yield
+        return
+    with medicao.etapa(nome):
+        yield
+
+
+def medir_resultado(calcular, perfil=False):
+    """Roda calcular() dentro de medir() e guarda o resumo em resultado["desempenho"]."""
+    with medir(perfil) as medicao:
+        resultado = calcular()
+    resultado["desempenho"] = medicao.resumo()
+    return resultado
+
+
+# =========================
+# Painel no Streamlit
+# =========================
+def painel_desempenho(chave):
+    """
+    Expansor "Desempenho" recolhido na barra lateral, com a opção de capturar
+    o cProfile. Retorna (painel, capturar_perfil); o painel é preenchido
+    depois da conciliação por mostrar_desempenho.
+    """
+    import streamlit as st
+
+    painel = st.sidebar.expander("⏱️ Desempenho", expanded=False)
+    capturar_perfil = painel.toggle(
+        "Capturar perfil (cProfile)",
+        key=chave,
+        help="Roda a conciliação com o cProfile e oferece o arquivo .pstats para baixar.",
+    )
+    return painel, capturar_perfil
+
+
+def mostrar_desempenho(painel, desempenho, adquirente):
+    """Tabela das etapas, memória e, se capturado, o perfil para baixar."""
+    import streamlit as st
+
+    with painel:
+        if not desempenho:
+            st.caption("Sem medição para esta conciliação.")
+            return
+
+        if desempenho.get("aviso"):
+            st.info(desempenho["aviso"])
+        st.dataframe(desempenho["etapas"], hide_index=True)
+        rss = rss_atual()
+        if rss is not None:
+            st.caption(
+                f"Memória do processo (inclui as outras sessões) · pico na conciliação: "
+                f"{desempenho['pico_mb']} MB · agora: {rss / MB:.0f} MB"
+            )
+        else:
+            st.caption("Instale o psutil para medir a memória.")
+
+        if desempenho["perfil"] is not None:
+            st.download_button(
+                label="📥 Baixar perfil (.pstats)",
+                data=desempenho["perfil"],
+                file_name=f"perfil_{adquirente.lower()}.pstats",
+                mime="application/octet-stream",
+                key=f"perfil_{adquirente.lower()}",
+            )
+            st.code(desempenho["perfil_texto"], language=None)
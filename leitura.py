@@ -0,0 +1,120 @@
+"""
+Leitura das planilhas Excel dos adquirentes (Cielo e Santander).
+
+Os extratos trazem algumas linhas de banner antes do cabeçalho, e a
+quantidade dessas linhas muda de tempos em tempos. ler_planilha percorre a
+aba linha a linha (openpyxl em modo somente leitura ou, se instalado, o
+python-calamine, bem mais rápido), acha o cabeçalho pelos nomes das colunas
+e guarda só as colunas pedidas, já com os tipos das células.
+"""
+
+import datetime
+
+import pandas as pd
+from openpyxl import load_workbook
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # pragma: no cover - python-calamine é opcional
+    CalamineWorkbook = None
+
+
+# Linhas percorridas à procura do cabeçalho antes de desistir
+MAX_LINHAS_CABECALHO = 50
+
+MOTOR_PADRAO = "calamine" if CalamineWorkbook is not None else "openpyxl"
+
+
+def normalizar_nome(valor):
+    """Nome de coluna comparável: texto sem espaços nas pontas e em minúsculas."""
+    if valor is None:
+        return ""
+    return str(valor).strip().lower()
+
+
+def ler_planilha(arquivo, colunas, aba=None, texto=(), max_linhas_cabecalho=MAX_LINHAS_CABECALHO, motor=None):
+    """
+    DataFrame com as `colunas` (nessa ordem e com esses nomes) da aba `aba`
+    (a primeira quando omitida). O cabeçalho é a primeira linha, entre as
+    `max_linhas_cabecalho` primeiras, que contém todas as `colunas`
+    (sem diferenciar maiúsculas nem espaços nas pontas). As colunas em
+    `texto` são convertidas para str. Linhas vazias no final são ignoradas.
+    """
+    linhas = _linhas(arquivo, aba, motor or MOTOR_PADRAO)
+    try:
+        posicoes = _encontrar_cabecalho(linhas, colunas, max_linhas_cabecalho)
+
+        valores = [[] for _ in colunas]
+        preenchidas = 0
+        for linha in linhas:
+            for lista, posicao in zip(valores, posicoes):
+                lista.append(_valor(linha[posicao]) if posicao < len(linha) else None)
+            if any(valor is not None and valor != "" for valor in linha):
+                preenchidas = len(valores[0])
+    finally:
+        linhas.close()
+
+    dados = {}
+    for coluna, lista in zip(colunas, valores):
+        del lista[preenchidas:]
+        if coluna in texto:
+            lista = [None if valor is None else str(valor) for valor in lista]
+        dados[coluna] = lista
+    return pd.DataFrame(dados, columns=list(colunas))
+
+
+def _encontrar_cabecalho(linhas, colunas, max_linhas_cabecalho):
+    """Posição de cada coluna na linha de cabeçalho; consome as linhas até ela."""
+    procuradas = [normalizar_nome(coluna) for coluna in colunas]
+    for n, linha in enumerate(linhas):
+        nomes = [normalizar_nome(valor) for valor in linha]
+        if all(nome in nomes for nome in procuradas):
+            return [nomes.index(nome) for nome in procuradas]
+        if n + 1 >= max_linhas_cabecalho:
+            break
+    raise ValueError(
+        f"❌ Cabeçalho não encontrado nas primeiras {max_linhas_cabecalho} linhas "
+        f"(colunas esperadas: {', '.join(colunas)})."
+    )
+
+
+def _valor(valor):
+    """Célula como o pd.read_excel entregaria: inteiros sem ".0", datas como datetime e vazio como None."""
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    if type(valor) is datetime.date:
+        return datetime.datetime(valor.year, valor.month, valor.day)
+    if isinstance(valor, str) and valor == "":
+        return None
+    return valor
+
+
+def _linhas(arquivo, aba, motor):
+    if hasattr(arquivo, "seek"):
+        arquivo.seek(0)
+    if motor == "calamine":
+        if CalamineWorkbook is None:
+            raise ImportError("python-calamine não está instalado; use motor='openpyxl'.")
+        return _linhas_calamine(arquivo, aba)
+    return _linhas_openpyxl(arquivo, aba)
+
+
+def _linhas_openpyxl(arquivo, aba):
+    wb = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        ws = wb[aba] if aba is not None else wb.worksheets[0]
+        yield from ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _linhas_calamine(arquivo, aba):
+    if hasattr(arquivo, "read"):
+        wb = CalamineWorkbook.from_filelike(arquivo)
+    else:
+        wb = CalamineWorkbook.from_path(arquivo)
+    try:
+        planilha = wb.get_sheet_by_name(aba) if aba is not None else wb.get_sheet_by_index(0)
+        yield from planilha.iter_rows()
+    finally:
+        wb.close()
@@ -0,0 +1,277 @@
+"""
+Conciliação de vários extratos de um adquirente contra o mesmo ERP.
+
+No fechamento do mês chega um extrato por loja e por semana. O ERP é lido e
+limpo uma vez só; os extratos são limpos e conciliados em paralelo num pool
+de processos, cada processo com a sua cópia do ERP (entregue uma vez, na
+criação do processo).
+
+Um título do ERP só pode ser usado por um extrato, e o resultado é o mesmo
+da conciliação em sequência: cada extrato contra o ERP sem os títulos usados
+pelos extratos anteriores. Como os extratos rodam ao mesmo tempo, cada
+rodada concilia os pendentes supondo que os anteriores ainda pendentes usam
+as mesmas chaves da rodada passada (nenhuma, na primeira). Na ordem dos
+arquivos, um extrato é aceito quando foi conciliado exatamente sem as
+chaves dos extratos anteriores já aceitos. Os outros voltam para a rodada
+seguinte, mas só são conciliados de novo se as chaves que precisam tirar
+do ERP mudaram. O primeiro pendente é sempre aceito, então cada rodada
+aceita pelo menos um extrato.
+
+Não basta olhar se as chaves escolhidas colidem: tirar um título do ERP
+pode mudar a escolha de outro extrato mesmo sem disputa (limite de
+candidatos da segunda passada do Santander, empates na atribuição global).
+Quando os extratos não disputam títulos (o caso comum), tudo é aceito na
+segunda rodada, com cada extrato (menos o primeiro) conciliado duas vezes,
+e o tempo cresce com os núcleos, não com a quantidade de arquivos.
+"""
+
+import importlib
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from cache import carregar_limpo
+from conciliacao import contexto_processos, limitar_threads
+from exportacao import gerar_relatorio
+from instrumentacao import etapa
+
+
+# Adquirente -> (módulo, função que lê o extrato, função que limpa o extrato)
+ADQUIRENTES = {
+    "cielo": ("cielo", "carregar_cielo", "limpar_cielo"),
+    "credshop": ("credshop", "carregar_credshop", "preparar_credshop"),
+    "santander": ("santander", "carregar_santander", "limpar_santander"),
+}
+
+# Seções do Resumo consolidado: (título, chave do resultado), na ordem dos módulos
+SECOES_RELATORIO = [
+    ("CONCILIADO", "conciliados"),
+    ("NÃO CONCILIADO", "nao_conciliados"),
+    ("CANCELAMENTO DE VENDA", "cancelamentos"),
+]
+
+COLUNA_ARQUIVO = "Arquivo"
+ABA_POR_ARQUIVO = "Por arquivo"
+
+
+def preparar_extrato(adquirente, arquivo):
+    """Extrato do `adquirente` lido e limpo pelas funções do módulo dele (com cache.carregar_limpo)."""
+    nome_modulo, carregar, limpar = ADQUIRENTES[adquirente]
+    modulo = importlib.import_module(nome_modulo)
+    return carregar_limpo(arquivo, adquirente, getattr(modulo, carregar), getattr(modulo, limpar))
+
+
+def conciliar_extrato(adquirente, df_extrato, df_erp, reservadas=(), atribuicao_global=False, ao_progredir=None,
+                      **opcoes):
+    """
+    gerar_resultado do módulo do adquirente contra o ERP sem as chaves
+    `reservadas`; `opcoes` são repassadas a ele (ex.: busca_por_codigo do Santander).
+    """
+    modulo = importlib.import_module(ADQUIRENTES[adquirente][0])
+    # Sempre um DataFrame novo: a conciliação do Santander altera o ERP que recebe
+    df_erp = df_erp[~df_erp["Chave"].isin(list(reservadas))]
+    return modulo.gerar_resultado(
+        df_extrato, df_erp, atribuicao_global=atribuicao_global, ao_progredir=ao_progredir, **opcoes
+    )
+
+
+def unidade_do_progresso(arquivos):
+    """Unidade contada pelo ao_progredir de conciliar_lote: extratos quando são vários, senão linhas."""
+    return "extratos" if len(arquivos) > 1 else "linhas"
+
+
+def chaves_usadas(resultado):
+    """Chaves do ERP conciliadas em um resultado."""
+    chaves = pd.to_numeric(resultado["conciliados"]["Chave ERP"], errors="coerce").dropna()
+    return set(chaves.astype("int64").tolist())
+
+
+def nome_do_arquivo(arquivo):
+    return getattr(arquivo, "name", None) or os.path.basename(str(arquivo))
+
+
+def conciliar_lote(adquirente, df_erp, arquivos, atribuicao_global=False, processos=None, ao_progredir=None,
+                   **opcoes):
+    """
+    Concilia cada extrato de `arquivos` (caminhos ou arquivos enviados pelo
+    Streamlit) com o ERP limpo e junta tudo com consolidar. Com um arquivo
+    só, devolve o resultado dele sem mudanças. `processos` é o tamanho do
+    pool (padrão: um por núcleo, no máximo um por arquivo); com 1, roda
+    tudo neste processo, um extrato depois do outro. `ao_progredir` recebe
+    (extratos concluídos, total) ou, com um arquivo só, o progresso das
+    linhas. `opcoes` vão para o gerar_resultado de cada extrato.
+    """
+    arquivos = list(arquivos)
+    if len(arquivos) == 1:
+        df_extrato = preparar_extrato(adquirente, arquivos[0])
+        return conciliar_extrato(
+            adquirente, df_extrato, df_erp, atribuicao_global=atribuicao_global, ao_progredir=ao_progredir, **opcoes
+        )
+
+    processos = processos or min(len(arquivos), os.cpu_count() or 1)
+    with etapa(f"Lote de {len(arquivos)} extratos"):
+        if processos <= 1:
+            resultados = _conciliar_em_sequencia(adquirente, df_erp, arquivos, atribuicao_global, ao_progredir, opcoes)
+        else:
+            resultados = _conciliar_em_paralelo(
+                adquirente, df_erp, arquivos, atribuicao_global, processos, ao_progredir, opcoes
+            )
+    with etapa("Consolidação"):
+        return consolidar(resultados, [nome_do_arquivo(arquivo) for arquivo in arquivos])
+
+
+def _conciliar_em_sequencia(adquirente, df_erp, arquivos, atribuicao_global, ao_progredir, opcoes):
+    """Um extrato depois do outro, cada um sem os títulos usados pelos anteriores."""
+    resultados = []
+    reservadas = set()
+    for n, arquivo in enumerate(arquivos, start=1):
+        df_extrato = preparar_extrato(adquirente, arquivo)
+        resultado = conciliar_extrato(adquirente, df_extrato, df_erp, reservadas, atribuicao_global, **opcoes)
+        reservadas |= chaves_usadas(resultado)
+        resultados.append(resultado)
+        if ao_progredir is not None:
+            ao_progredir(n, len(arquivos))
+    return resultados
+
+
+def _conciliar_em_paralelo(adquirente, df_erp, arquivos, atribuicao_global, processos, ao_progredir, opcoes):
+    """Rodadas no pool até todos os extratos serem aceitos (ver o topo do módulo)."""
+    total = len(arquivos)
+    with ProcessPoolExecutor(
+        max_workers=processos,
+        mp_context=contexto_processos(),
+        initializer=_iniciar_processo,
+        initargs=(adquirente, df_erp),
+    ) as pool:
+        extratos = list(pool.map(_preparar_no_processo, [_para_processo(arquivo) for arquivo in arquivos]))
+
+        resultados = [None] * total
+        # Último resultado de cada pendente: (resultado, chaves tiradas do ERP, chaves usadas)
+        tentativas = {}
+        reservadas = set()
+        pendentes = list(range(total))
+        rodada = 0
+        while pendentes:
+            rodada += 1
+            futuros = {}
+            previstas = set(reservadas)
+            for i in pendentes:
+                anterior = tentativas.get(i)
+                if anterior is None or anterior[1] != previstas:
+                    futuros[i] = (
+                        pool.submit(_conciliar_no_processo, extratos[i], sorted(previstas), atribuicao_global, opcoes),
+                        frozenset(previstas),
+                    )
+                # Supõe que o extrato usa as chaves da tentativa anterior (nenhuma na primeira)
+                if anterior is not None:
+                    previstas |= anterior[2]
+            for i, (futuro, sem_chaves) in futuros.items():
+                resultado = futuro.result()
+                tentativas[i] = (resultado, sem_chaves, chaves_usadas(resultado))
+
+            proximos = []
+            for i in pendentes:
+                resultado, sem_chaves, usadas = tentativas[i]
+                if proximos or sem_chaves != reservadas:
+                    proximos.append(i)
+                    continue
+                resultados[i] = resultado
+                reservadas |= usadas
+                del tentativas[i]
+            if proximos:
+                logging.info(
+                    "Lote: rodada %d (%d conciliações) deixou %d extrato(s) pendentes",
+                    rodada, len(futuros), len(proximos),
+                )
+            pendentes = proximos
+            if ao_progredir is not None:
+                ao_progredir(total - len(pendentes), total)
+    return resultados
+
+
+def consolidar(resultados, nomes):
+    """
+    Junta os resultados dos extratos `nomes` num resultado só: cada aba vira
+    a concatenação das abas de mesmo nome, com a coluna Arquivo na frente;
+    o Resumo é refeito com os totais de todos os extratos; a aba "Por
+    arquivo" traz os totais de cada extrato.
+    """
+    if len(resultados) == 1:
+        return resultados[0]
+
+    consolidado = {}
+    for _, chave in SECOES_RELATORIO:
+        if chave in resultados[0]:
+            consolidado[chave] = _juntar([resultado[chave] for resultado in resultados], nomes)
+
+    # Itens da seção OUTROS (ex.: aluguel de maquineta no Santander) somados por descrição
+    outros = {}
+    for resultado in resultados:
+        for descricao, valor in resultado.get("outros", []):
+            outros[descricao] = outros.get(descricao, 0) + valor
+    relatorio = gerar_relatorio(
+        [(titulo, consolidado[chave]) for titulo, chave in SECOES_RELATORIO if chave in consolidado],
+        outros=list(outros.items()),
+    )
+
+    abas = {}
+    for resultado in resultados:
+        for nome_aba in resultado["abas"]:
+            if nome_aba in abas:
+                continue
+            if nome_aba == "Resumo":
+                abas[nome_aba] = relatorio
+                continue
+            com_aba = [(r["abas"][nome_aba], nome) for r, nome in zip(resultados, nomes) if nome_aba in r["abas"]]
+            abas[nome_aba] = _juntar([df for df, _ in com_aba], [nome for _, nome in com_aba])
+    abas[ABA_POR_ARQUIVO] = pd.DataFrame({
+        COLUNA_ARQUIVO: nomes,
+        "Conciliados": [len(r["conciliados"]) for r in resultados],
+        "Não conciliados": [len(r["nao_conciliados"]) for r in resultados],
+        "Valor líquido conciliado": [r["conciliados"]["VALOR LÍQUIDO"].sum() for r in resultados],
+        "Valor líquido não conciliado": [r["nao_conciliados"]["VALOR LÍQUIDO"].sum() for r in resultados],
+    })
+
+    consolidado["relatorio"] = relatorio
+    consolidado["abas"] = abas
+    consolidado["outros"] = list(outros.items())
+    return consolidado
+
+
+def _juntar(dfs, nomes):
+    partes = [df.assign(**{COLUNA_ARQUIVO: nome})[[COLUNA_ARQUIVO, *df.columns]] for df, nome in zip(dfs, nomes)]
+    return pd.concat(partes, ignore_index=True)
+
+
+# =========================
+# Pool de processos
+# =========================
+_processo = {}
+
+
+def _iniciar_processo(adquirente, df_erp):
+    limitar_threads()
+    _processo["adquirente"] = adquirente
+    _processo["erp"] = df_erp
+
+
+def _para_processo(arquivo):
+    """Arquivo enviado pelo Streamlit vira (nome, bytes), que pode ir para outro processo."""
+    if hasattr(arquivo, "getvalue"):
+        return nome_do_arquivo(arquivo), arquivo.getvalue()
+    return arquivo
+
+
+def _preparar_no_processo(arquivo):
+    if isinstance(arquivo, tuple):
+        nome, conteudo = arquivo
+        arquivo = io.BytesIO(conteudo)
+        arquivo.name = nome
+    return preparar_extrato(_processo["adquirente"], arquivo)
+
+
+def _conciliar_no_processo(df_extrato, reservadas, atribuicao_global, opcoes):
+    return conciliar_extrato(_processo["adquirente"], df_extrato, _processo["erp"], reservadas, atribuicao_global, **opcoes)
@@ -0,0 +1,101 @@
+"""
+Relato de progresso das conciliações.
+
+Os motores chamam `ao_progredir(feitas, total)` sempre que avançam; o
+Progresso decide quando isso vira uma mensagem para a interface (no máximo
+a cada `intervalo` segundos ou a cada `passo` do total), com a taxa (linhas/s,
+ou a `unidade` contada) e o tempo restante. Sem destino (execução sem Streamlit) ele não faz nada.
+"""
+
+import time
+
+
+def formatar_duracao(segundos):
+    """Duração curta para o texto da barra: "42s", "3min 05s", "1h 02min"."""
+    segundos = int(round(segundos))
+    if segundos < 60:
+        return f"{segundos}s"
+    minutos, segundos = divmod(segundos, 60)
+    if minutos < 60:
+        return f"{minutos}min {segundos:02d}s"
+    horas, minutos = divmod(minutos, 60)
+    return f"{horas}h {minutos:02d}min"
+
+
+class Progresso:
+    """
+    Repassa o progresso para `saida(fracao, texto)` de forma limitada.
+
+    Pode ser passado diretamente como `ao_progredir`. A última chamada
+    (feitas == total) é sempre enviada; `concluir()` chama `ao_concluir`,
+    por exemplo para apagar a barra.
+    """
+
+    def __init__(self, descricao="🔄 Conciliando", saida=None, ao_concluir=None,
+                 intervalo=0.25, passo=0.05, relogio=time.monotonic, unidade="linhas"):
+        self.descricao = descricao
+        self.unidade = unidade
+        self.saida = saida
+        self.ao_concluir = ao_concluir
+        self.intervalo = intervalo
+        self.passo = passo
+        self.relogio = relogio
+        self.inicio = relogio()
+        self._ultimo_envio = None
+        self._ultima_fracao = 0.0
+
+    def __call__(self, feitas, total):
+        if self.saida is None:
+            return
+
+        agora = self.relogio()
+        fracao = min(feitas / total, 1.0) if total else 1.0
+        if self._ultimo_envio is not None and fracao < 1.0:
+            if agora - self._ultimo_envio < self.intervalo and fracao - self._ultima_fracao < self.passo:
+                return
+
+        self._ultimo_envio = agora
+        self._ultima_fracao = fracao
+        self.saida(fracao, self.texto(feitas, total, agora - self.inicio))
+
+    def texto(self, feitas, total, decorrido):
+        """Descrição com contagem, taxa por segundo e tempo restante estimado."""
+        texto = f"{self.descricao} ({feitas}/{total})"
+        if decorrido <= 0 or feitas <= 0:
+            return texto
+
+        taxa = feitas / decorrido
+        # Uma casa decimal para taxas baixas (ex.: extratos por segundo)
+        taxa_texto = f"{taxa:,.0f}".replace(",", ".") if taxa >= 10 else f"{taxa:.1f}".replace(".", ",")
+        texto += f" · {taxa_texto} {self.unidade}/s"
+        if feitas < total:
+            texto += f" · restam ~{formatar_duracao((total - feitas) / taxa)}"
+        return texto
+
+    def concluir(self):
+        if self.ao_concluir is not None:
+            self.ao_concluir()
+
+
+def progresso_streamlit(descricao="🔄 Conciliando", **opcoes):
+    """
+    Progresso ligado a um st.progress quando há uma sessão do Streamlit
+    rodando; fora dela (linha de comando, testes) devolve um Progresso mudo.
+    """
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return Progresso(descricao, **opcoes)
+
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return Progresso(descricao, **opcoes)
+
+    import streamlit as st
+
+    barra = st.progress(0, text=descricao)
+    return Progresso(
+        descricao,
+        saida=lambda fracao, texto: barra.progress(fracao, text=texto),
+        ao_concluir=barra.empty,
+        **opcoes,
+    )
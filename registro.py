@@ -0,0 +1,117 @@
+"""
+Logging da aplicação e rastro opcional das decisões de conciliação.
+
+configurar_registro() liga o logger raiz a uma fila: quem registra só
+enfileira o evento, e a gravação no arquivo (com rotação) e no console
+acontece numa thread separada (QueueListener). O nível padrão é INFO e pode
+ser trocado pela variável de ambiente CONCILIAFACIL_LOG.
+
+O rastro é um JSONL por execução com uma amostra das linhas do extrato e o
+par escolhido para cada uma. Ele é ligado por CONCILIAFACIL_RASTRO (fração
+amostrada, ex.: 0.01) e pode ficar ligado em produção.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+import numpy as np
+
+
+ARQUIVO_LOG = "conciliacao.log"
+TAMANHO_MAXIMO_LOG = 10 * 1024 * 1024
+ARQUIVOS_ANTIGOS_LOG = 5
+FORMATO_LOG = "%(asctime)s - %(levelname)s - %(message)s"
+
+PASTA_RASTROS = "rastros"
+
+_ouvinte = None
+
+
+def configurar_registro(nivel=None, arquivo=ARQUIVO_LOG, console=True):
+    """Configura o logger raiz uma única vez por processo; chamadas seguintes não fazem nada."""
+    global _ouvinte
+    if _ouvinte is not None:
+        return
+
+    nivel = nivel or os.environ.get("CONCILIAFACIL_LOG", "INFO")
+    formato = logging.Formatter(FORMATO_LOG)
+
+    destinos = []
+    if arquivo:
+        arquivo_log = logging.handlers.RotatingFileHandler(
+            arquivo, maxBytes=TAMANHO_MAXIMO_LOG, backupCount=ARQUIVOS_ANTIGOS_LOG, encoding="utf-8", delay=True
+        )
+        destinos.append(arquivo_log)
+    if console:
+        destinos.append(logging.StreamHandler())
+    for destino in destinos:
+        destino.setFormatter(formato)
+
+    fila = queue.SimpleQueue()
+    raiz = logging.getLogger()
+    raiz.setLevel(nivel)
+    raiz.addHandler(logging.handlers.QueueHandler(fila))
+
+    _ouvinte = logging.handlers.QueueListener(fila, *destinos, respect_handler_level=True)
+    _ouvinte.start()
+    atexit.register(_ouvinte.stop)
+
+
+# =========================
+# Rastro das decisões
+# =========================
+class RastroDecisoes:
+    """
+    Grava em `caminho` (JSONL) as decisões de uma fração `taxa` das linhas do
+    extrato. A amostra depende só de `semente` e do total de linhas, então
+    a mesma execução sempre rastreia as mesmas linhas.
+    """
+
+    def __init__(self, caminho, taxa, semente=0):
+        self.caminho = caminho
+        self.taxa = taxa
+        self.semente = semente
+
+    def amostrar(self, total):
+        """Posições (0..total-1) das linhas rastreadas."""
+        sorteio = np.random.default_rng(self.semente).random(total)
+        return np.flatnonzero(sorteio < self.taxa)
+
+    def gravar(self, registros):
+        pasta = os.path.dirname(self.caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        with open(self.caminho, "a", encoding="utf-8") as arquivo:
+            for registro in registros:
+                arquivo.write(json.dumps(registro, ensure_ascii=False, default=_json_padrao) + "\n")
+        logging.info("Rastro de %d decisões gravado em %s", len(registros), self.caminho)
+
+
+def _json_padrao(valor):
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return str(valor)
+
+
+def abrir_rastro(nome, taxa=None, pasta=None):
+    """
+    Rastro da execução atual ou None quando desligado. `taxa` e `pasta` vêm
+    de CONCILIAFACIL_RASTRO e CONCILIAFACIL_RASTRO_PASTA quando omitidos.
+    """
+    if taxa is None:
+        try:
+            taxa = float(os.environ.get("CONCILIAFACIL_RASTRO", 0))
+        except ValueError:
+            logging.warning("CONCILIAFACIL_RASTRO inválido; rastro desligado.")
+            return None
+    if taxa <= 0:
+        return None
+
+    pasta = pasta or os.environ.get("CONCILIAFACIL_RASTRO_PASTA", PASTA_RASTROS)
+    nome_arquivo = f"{nome.lower()}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl"
+    return RastroDecisoes(os.path.join(pasta, nome_arquivo), min(taxa, 1.0))
@@ -2,655 +2,526 @@
 import pandas as pd
 import logging
 import numpy as np
-import streamlit as st
-import os
-import sys
-from rapidfuzz import process, fuzz
-from openpyxl import load_workbook
-from pandas import ExcelWriter
-
-def main():
-# Configuração de logging
-    logging.basicConfig(
-        level=logging.DEBUG,  # ou DEBUG para mais detalhes
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        handlers=[
-            logging.FileHandler("conciliacao.log", encoding="utf-8"),  # grava em arquivo
-            logging.StreamHandler()  # mostra no console
-        ]
+from cache import RESULTADOS, carregar_limpo, chave_resultado
+from conciliacao import (
+    PERFIL_SANTANDER, VERSAO_LIMPEZA_ERP, carregar_erp, compactar_tipos, conciliar, limpar_erp, normalizar_codigos,
+)
+from exportacao import gerar_planilha, gerar_relatorio, mostrar_outros_formatos
+from indices import IndiceQGramas
+from instrumentacao import etapa, medir_resultado, mostrar_desempenho, painel_desempenho
+from leitura import ler_planilha
+from lote import conciliar_lote, unidade_do_progresso
+from progresso import progresso_streamlit
+from registro import configurar_registro
+
+
+COLUNAS_SANTANDER = ["EC CENTRALIZADOR", "DATA DE VENCIMENTO", "TIPO DE LANÇAMENTO", "PARCELAS", "AUTORIZAÇÃO", "NÚMERO COMPROVANTE DE VENDA (NSU)", "DATA DA VENDA", "VALOR DA PARCELA", "VALOR LÍQUIDO", "BANDEIRA / MODALIDADE"]
+
+# Lançamentos que não são vendas e não entram na conciliação
+LANCAMENTOS_IGNORADOS = ["Cancelamento/Chargeback", "Aluguel/Tarifa", "Pagamento Realizado", "Saldo Anterior"]
+
+# Segunda passada (30 dias, sem limite de valor): títulos mais próximos por
+# dias/valor que cada linha ainda compara por similaridade de código
+CANDIDATOS_SEGUNDA_PASSADA = 50
+TOLERANCIA_DIAS_SEGUNDA_PASSADA = 30
+TOLERANCIA_VALOR_SEGUNDA_PASSADA = 100000.00
+
+# Busca por código (opcional): Autorização parecida, sem janela de data e valor
+STATUS_POR_CODIGO = "Conciliado por Código"
+CORTE_BUSCA_POR_CODIGO = 80
+
+# Colunas das abas Conciliados e Não conciliados da planilha final
+COLUNAS_CONCILIADOS = [
+    "DATA DE VENCIMENTO", "Pessoa do Título",
+    "AUTORIZAÇÃO", "NÚMERO COMPROVANTE DE VENDA (NSU)", "DATA DA VENDA",
+    "VALOR DA PARCELA", "Valor bruto", "VALOR LÍQUIDO",
+    "PARCELA", "TOTAL_PARCELAS", "Autorização ERP", "NSU ERP",
+    "Chave ERP", "Valor ERP", "Status", "Pontuação"
+]
+COLUNAS_NAO_CONCILIADOS = [
+    "EC CENTRALIZADOR", "DATA DE VENCIMENTO", "Pessoa do Título",
+    "AUTORIZAÇÃO", "NÚMERO COMPROVANTE DE VENDA (NSU)", "DATA DA VENDA",
+    "VALOR DA PARCELA", "Valor bruto", "VALOR LÍQUIDO",
+    "PARCELA", "TOTAL_PARCELAS", "Autorização ERP", "NSU ERP",
+    "Chave ERP", "Valor ERP", "DIF_DIAS", "DIF_VALOR", "Status", "Pontuação"
+]
+
+
+# Função de carregamento
+def carregar_planilha(caminho):
+    if caminho.name.endswith(".csv"):
+        return carregar_erp(caminho)
+    else:
+        return carregar_santander(caminho)
+
+
+def carregar_santander(caminho):
+    """Aba "Detalhado" do extrato Santander (XLSX) só com as COLUNAS_SANTANDER."""
+    # A aba tem linhas de banner antes do cabeçalho; ler_planilha acha o cabeçalho pelas colunas
+    return ler_planilha(
+        caminho, COLUNAS_SANTANDER, aba="Detalhado", texto=["NÚMERO COMPROVANTE DE VENDA (NSU)"]
     )
 
 
-    def resource_path(relative_path):
-        """ Get absolute path to resource, works for dev and for PyInstaller """
-        try:
-            # PyInstaller creates a temp folder and stores path in _MEIPASS
-            base_path = sys._MEIPASS
-        except Exception:
-            base_path = os.path.abspath(".")
-
-        return os.path.join(base_path, relative_path)
-
-
-    # Função de carregamento
-    def carregar_planilha(caminho):
-        if caminho.name.endswith(".csv"):
-            return pd.read_csv(caminho, sep=";", encoding="latin1", dtype={"NSU": str})
-        else:
-            return pd.read_excel(caminho, sheet_name="Detalhado", dtype={"NÚMERO COMPROVANTE DE VENDA (NSU)": str})
-        
-    # --- BARRA LATERAL ---
-    # --- BARRA LATERAL ---
-    with st.sidebar:
-        st.markdown("# App Conciliação Bancária")
-        
-        # Seção de upload com tratamento de None
-        st.markdown("### Carregar planilhas")
-        caminho_erp = st.file_uploader("ERP (CSV)", type=["csv"], key="erp_uploader")
-        caminho_santander = st.file_uploader("Santander (XLSX)", type=["xlsx"], key="santander_uploader")
-
-    # --- ÁREA PRINCIPAL ---
-
-    if caminho_erp is None or caminho_santander is None:
-        st.subheader("Bem-vindo ao Sistema de Conciliação")
-        st.markdown("""
-        <div style='text-align: center; margin-bottom: 20px;'>
-            <p>Este sistema realiza a conciliação automática entre:</p>
-            <p>•  Santander</p>
-            <p>• ERP</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        st.warning("⚠️ Por favor, faça upload de ambos os arquivos para iniciar a conciliação")
-        
-        
-        st.stop()
-    try:
-        with st.spinner('📂 Carregando planilhas...'):
-            df_erp = carregar_planilha(caminho_erp)
-            df_santander = carregar_planilha(caminho_santander)
-    except Exception as e:
-        st.error(f"❌ Erro ao carregar arquivos: {str(e)}")
-        st.stop()
-
-    # --- Processamento
-    with st.spinner('🔧 Processando dados do Santander...'):
-        def limpar_santander(df):
-            df = df.iloc[6:].reset_index(drop=False)
-            df.columns = df.iloc[0]
-            df = df[1:].reset_index(drop=True)
-            return df
-
-    df_santander = limpar_santander(df_santander)
-    df_santander = df_santander.filter(items=["EC CENTRALIZADOR", "DATA DE VENCIMENTO", "TIPO DE LANÇAMENTO", "PARCELAS", "AUTORIZAÇÃO", "NÚMERO COMPROVANTE DE VENDA (NSU)", "DATA DA VENDA", "VALOR DA PARCELA", "VALOR LÍQUIDO", "BANDEIRA / MODALIDADE"])
+# =========================
+# Limpeza do Santander
+# =========================
+def limpar_santander(df):
+    df = df.filter(items=COLUNAS_SANTANDER).copy()
 
     #Convertendo colunas para número
-    df_santander["VALOR LÍQUIDO"] = pd.to_numeric(df_santander["VALOR LÍQUIDO"], errors="coerce")
-    df_santander["VALOR DA PARCELA"] = pd.to_numeric(df_santander["VALOR DA PARCELA"], errors="coerce")
-
+    df["VALOR LÍQUIDO"] = pd.to_numeric(df["VALOR LÍQUIDO"], errors="coerce")
+    df["VALOR DA PARCELA"] = pd.to_numeric(df["VALOR DA PARCELA"], errors="coerce")
 
     #Convertendo parcelas para números inteiros
-    df_santander[["PARCELA", "TOTAL_PARCELAS"]] = df_santander["PARCELAS"].str.extract(r"(\d+)\s+de\s+(\d+)") #Agora na planilha santander, o campo parcela vem em apenas 1 celula precisando separar em colunas.
-    df_santander["PARCELA"] = pd.to_numeric(df_santander["PARCELA"], errors="coerce")
-    df_santander["PARCELA"] = df_santander["PARCELA"].fillna(1).astype(int) #Essa linha converte o número da parcela do tipo float para interger porém quando a venda é no débito o mesmo vem zerado. Sendo assim optou-se por preencher esse campo como valor 1, o mesmo ocorre para quantidade de parcelas
-    df_santander["TOTAL_PARCELAS"] = pd.to_numeric(df_santander["TOTAL_PARCELAS"], errors="coerce")
-    df_santander["TOTAL_PARCELAS"] = df_santander["TOTAL_PARCELAS"].fillna(1).astype(int)
+    df[["PARCELA", "TOTAL_PARCELAS"]] = df["PARCELAS"].str.extract(r"(\d+)\s+de\s+(\d+)") #Agora na planilha santander, o campo parcela vem em apenas 1 celula precisando separar em colunas.
+    df["PARCELA"] = pd.to_numeric(df["PARCELA"], errors="coerce")
+    df["PARCELA"] = df["PARCELA"].fillna(1).astype(int) #Essa linha converte o número da parcela do tipo float para interger porém quando a venda é no débito o mesmo vem zerado. Sendo assim optou-se por preencher esse campo como valor 1, o mesmo ocorre para quantidade de parcelas
+    df["TOTAL_PARCELAS"] = pd.to_numeric(df["TOTAL_PARCELAS"], errors="coerce")
+    df["TOTAL_PARCELAS"] = df["TOTAL_PARCELAS"].fillna(1).astype(int)
 
     #Convertendo Data do pagamento e Data do lançamento para data
-    df_santander["DATA DA VENDA"] = pd.to_datetime(df_santander["DATA DA VENDA"], format="%d/%m/%Y", errors="coerce")
-    df_santander["DATA DE VENCIMENTO"] = pd.to_datetime(df_santander["DATA DE VENCIMENTO"], format="%d/%m/%Y", errors="coerce")
-
-    #Separando os valores de aluguel de máquina e cancelamento dos valores da GETNET.
-    df_cancelamento_venda = df_santander[df_santander["TIPO DE LANÇAMENTO"] == "Cancelamento/Chargeback"]
-    df_aluguel_maquina = df_santander[df_santander["TIPO DE LANÇAMENTO"] == "Aluguel/Tarifa"]
-
-    #Atualizando a tabela df_santander para todos os valores sem o aluguel de máquina, sem cancelamento e sem valores em branco
-    df_santander = df_santander[df_santander["TIPO DE LANÇAMENTO"] != "Cancelamento/Chargeback"]
-    df_santander = df_santander[df_santander["TIPO DE LANÇAMENTO"] != "Aluguel/Tarifa"]
-    df_santander = df_santander[df_santander["TIPO DE LANÇAMENTO"] != "Pagamento Realizado"]
-    df_santander = df_santander[df_santander["TIPO DE LANÇAMENTO"] != "Saldo Anterior"]
-    df_santander = df_santander[df_santander["TIPO DE LANÇAMENTO"].notna()]
-
-
-    #Totalizadores
-    valor_total_bruto = df_santander["VALOR DA PARCELA"].sum()
-    quantidade_titulos_santander = df_santander["VALOR DA PARCELA"].count()
-    valor_total_liquido =  df_santander["VALOR LÍQUIDO"].sum()
-    valor_aluguel_maquina = df_aluguel_maquina["VALOR LÍQUIDO"].sum()
-    valor_cancelamento_venda = df_cancelamento_venda["VALOR LÍQUIDO"].sum()
-    quantidade_titulos_cancelados = df_cancelamento_venda["VALOR LÍQUIDO"].count()
-    valor_recebido_conta = valor_total_liquido - abs(valor_aluguel_maquina) - abs(valor_cancelamento_venda)
-
-
-    #Selecionando as colunas desejadas
-    with st.spinner('🛠️ Processando dados do ERP...'):
-        df_erp = df_erp.filter(items=["1o. Agrupamento", "Chave", "Numero", "NSU", "Autorização", "Emissão", "Correção", "Valor", "Vr Corrigido", "Pessoa do Título"])
-    #Convertendo colunas para os tipos corretos
-    #Convertendo colunas para número
-    df_erp["Valor"] = df_erp["Valor"].str.replace(",", ".", regex=True)
-    df_erp["Valor"] = pd.to_numeric(df_erp["Valor"], errors="coerce")
-    df_erp["Vr Corrigido"] = df_erp["Vr Corrigido"].str.replace(",", ".", regex=True)
-    df_erp["Vr Corrigido"] = pd.to_numeric(df_erp["Vr Corrigido"], errors="coerce")
-    #Convertendo colunas para data
-    df_erp["Emissão"] = pd.to_datetime(df_erp["Emissão"], format="%d/%m/%Y", errors="coerce")
-    df_erp["Correção"] = pd.to_datetime(df_erp["Correção"], format="%d/%m/%Y", errors="coerce")
-    #Transformando o campo Numero em Parcela e Total de Parcelas
-    # Criar as novas colunas extraindo os valores corretos da coluna "Numero"
-    df_erp["chcriacao"] = df_erp["Numero"].str.split("-").str[0]  # Antes do "-"
-    df_erp["Parcela"] = df_erp["Numero"].str.split("-").str[1].str.split("/").str[0]  # Entre "-" e "/"
-    df_erp["Total_Parcelas"] = df_erp["Numero"].str.split("/").str[1]  # Após "/"
-
-    # Converter as colunas de parcela para inteiro
-    df_erp["Parcela"] = pd.to_numeric(df_erp["Parcela"], errors="coerce").fillna(1).astype(int)
-    df_erp["Total_Parcelas"] = pd.to_numeric(df_erp["Total_Parcelas"], errors="coerce").fillna(1).astype(int)
-    df_erp = df_erp.filter(items=["1o. Agrupamento", "Chave", "chcriacao", "Parcela", "Total_Parcelas", "NSU", "Autorização", "Emissão", "Correção", "Valor", "Vr Corrigido", "Pessoa do Título"])
-
-    #Selecionando apenas os títulos da industria
-    df_erp_loja = df_erp[~df_erp["1o. Agrupamento"].isin(["LE SFR Indústria Ltda", "LE Protendidos"])].copy()
-
-
-
-    #Funções Conciliar por valor e data e conciliando buscando autorizações parecidas
-    with st.spinner('🔍 Realizando conciliação...'):
-        def conciliar_por_data_e_valores(row, df_erp_base):
-
-        # 1️ Filtra por datas com até 5 dias de diferença
-            data_diferenca = (df_erp_base["Emissão"] - row["DATA DA VENDA"]).abs().dt.days
-
-
-            candidatos = df_erp_base[data_diferenca <= 5]
-
-
-        # 2️ Filtra por valor, parcela e total de parcelas
-            candidatos = candidatos[
-                ((candidatos["Valor"] - row["VALOR DA PARCELA"]).abs() <= 0.20) &
-                (candidatos["Parcela"] == row["PARCELA"]) &
-                (candidatos["Total_Parcelas"] == row["TOTAL_PARCELAS"])
-        ]
-
-            if not candidatos.empty:
-                linha = candidatos.iloc[0]
-
-                return pd.Series([
-                    linha["Autorização"],
-                    linha["Chave"],
-                    linha["Valor"],
-                    "Conciliado por Data e Valores",
-                10
-            ])                      
-            return pd.Series([None, None, None, "Não Conciliado", 99])
-
-    with st.spinner('🔎 Realizando conciliação...'):
-        def encontrar_melhor_correspondencia_com_pontuacao(row, df_origem, coluna_erp):
-            correspondencias = process.extract(
-                str(row["AUTORIZAÇÃO"]),
-                df_origem[coluna_erp].astype(str),
-                scorer=fuzz.ratio,
-                limit=10
-            )
-
-            correspondencias_validas = [(texto, score, idx) for texto, score, idx in correspondencias if score >= 80]
-
-
-
-            if not correspondencias_validas:
-                return pd.Series([None, None, None, "Não Conciliado", 99])
+    df["DATA DA VENDA"] = pd.to_datetime(df["DATA DA VENDA"], format="%d/%m/%Y", errors="coerce")
+    df["DATA DE VENCIMENTO"] = pd.to_datetime(df["DATA DE VENCIMENTO"], format="%d/%m/%Y", errors="coerce")
+    return compactar_tipos(df, parcelas=["PARCELA", "TOTAL_PARCELAS"])
+
+
+def separar_lancamentos(df):
+    """Separa (vendas, cancelamentos, aluguel de máquina) do extrato limpo."""
+    df_cancelamento_venda = df[df["TIPO DE LANÇAMENTO"] == "Cancelamento/Chargeback"].copy()
+    df_aluguel_maquina = df[df["TIPO DE LANÇAMENTO"] == "Aluguel/Tarifa"].copy()
+
+    #Atualizando a tabela para todos os valores sem o aluguel de máquina, sem cancelamento e sem valores em branco
+    df = df[~df["TIPO DE LANÇAMENTO"].isin(LANCAMENTOS_IGNORADOS) & df["TIPO DE LANÇAMENTO"].notna()].copy()
+    return df, df_cancelamento_venda, df_aluguel_maquina
+
+
+def chaves_de_cancelamento(df):
+    """
+    Partes da chave de cancelamento de cada linha: (AUTORIZAÇÃO normalizada,
+    valor absoluto em centavos como int64). Linhas sem autorização ou sem
+    valor ficam com centavos -1 e nunca se cruzam.
+    """
+    autorizacoes = normalizar_codigos(df["AUTORIZAÇÃO"], numericos=True)
+    centavos = np.rint(df["VALOR DA PARCELA"].abs().to_numpy(dtype=float) * 100)
+    validas = (autorizacoes != "") & np.isfinite(centavos)
+    return autorizacoes, np.where(validas, centavos, -1).astype(np.int64)
+
+
+def remover_cancelados(df_santander, df_cancelamento_venda):
+    """
+    Move para os cancelamentos as vendas canceladas: mesma AUTORIZAÇÃO e
+    mesmo valor absoluto (em centavos) de um Cancelamento/Chargeback. Cada
+    cancelamento anula uma única venda, a primeira ainda não anulada na
+    ordem do extrato. Retorna (vendas, cancelamentos).
+    """
+    aut_vendas, centavos_vendas = chaves_de_cancelamento(df_santander)
+    aut_canc, centavos_canc = chaves_de_cancelamento(df_cancelamento_venda)
+
+    # Autorização vira inteiro pelo mesmo dicionário nas duas planilhas; a chave junta os dois inteiros
+    codigos, _ = pd.factorize(np.concatenate([aut_vendas, aut_canc]))
+    centavos = np.concatenate([centavos_vendas, centavos_canc])
+    chaves = np.where(centavos >= 0, (codigos.astype(np.int64) << 40) | centavos, -1)
+    chave_venda, chave_canc = chaves[:len(df_santander)], chaves[len(df_santander):]
+
+    # Quantos cancelamentos cada chave tem e qual ocorrência da chave é cada venda
+    unicas, quantidades = np.unique(chave_canc[chave_canc >= 0], return_counts=True)
+    disponiveis = np.zeros(len(chave_venda), dtype=np.int64)
+    if len(unicas):
+        achou = np.minimum(np.searchsorted(unicas, chave_venda), len(unicas) - 1)
+        encontradas = (unicas[achou] == chave_venda) & (chave_venda >= 0)
+        disponiveis[encontradas] = quantidades[achou[encontradas]]
+    ocorrencia = pd.Series(chave_venda).groupby(chave_venda).cumcount().to_numpy()
+    filtro_cancelados = ocorrencia < disponiveis
+
+    df_cancelamento_venda = pd.concat([df_cancelamento_venda, df_santander[filtro_cancelados]], ignore_index=True)
+    df_santander = df_santander[~filtro_cancelados].copy()
+    logging.info("%d vendas removidas por cancelamento.", int(filtro_cancelados.sum()))
+    return df_santander, df_cancelamento_venda
+
+
+# =========================
+# Busca fuzzy por código
+# =========================
+NAO_ENCONTRADO = [None, None, None, PERFIL_SANTANDER.status_nao_conciliado, 999]
+
+
+def melhor_correspondencia_por_codigo(row, codigo, df_origem, coluna_erp, indice):
+    """
+    Procura `codigo` (o código da linha já normalizado) no IndiceQGramas
+    dos códigos do ERP: os até 10 mais parecidos com fuzz.ratio >=
+    CORTE_BUSCA_POR_CODIGO e todos os títulos com esses mesmos códigos.
+    Entre eles vence o de menor pontuação de divergências (valor, data,
+    parcela, total de parcelas).
+    """
+    if codigo == "":
+        return NAO_ENCONTRADO
+
+    posicoes, _ = indice.buscar(codigo, limite=10, corte=CORTE_BUSCA_POR_CODIGO)
+    logging.debug("Buscando correspondência para: %s (%d válidas)", codigo, len(posicoes))
+    if len(posicoes) == 0:
+        return NAO_ENCONTRADO
+
+    # Todos os títulos de cada código encontrado, na ordem de pontuação dos códigos
+    codigos = pd.unique(indice.textos[indice.codigos[posicoes]])
+    posicoes = np.concatenate([indice.posicoes(codigo) for codigo in codigos])
+
+    valores = df_origem["Valor"].to_numpy()[posicoes]
+    emissoes = pd.to_datetime(df_origem["Emissão"].to_numpy()[posicoes])
+    divergencias = [
+        ("Divergência de Valor", 15, np.abs(row["VALOR DA PARCELA"] - valores) > 0.10),
+        ("Divergência de Data", 5, np.abs((row["DATA DA VENDA"] - emissoes).days) > 1),
+        ("Divergência de Parcela", 10, df_origem["Numero da Parcela"].to_numpy()[posicoes] != row["PARCELA"]),
+        ("Divergência de Total de Parcelas", 15, df_origem["Total Parcelas"].to_numpy()[posicoes] != row["TOTAL_PARCELAS"]),
+    ]
+    pontuacao = sum(np.where(mascara, peso, 0) for _, peso, mascara in divergencias)
+
+    melhor = int(np.argmin(pontuacao))
+    status = [STATUS_POR_CODIGO] + [nome for nome, _, mascara in divergencias if mascara[melhor]]
+    linha_correspondente = df_origem.iloc[posicoes[melhor]]
+    melhor_resultado = [
+        linha_correspondente[coluna_erp],
+        linha_correspondente["Chave"],
+        linha_correspondente["Valor"],
+        " e ".join(status),
+        int(pontuacao[melhor]),
+    ]
+    logging.debug("Melhor resultado escolhido: %s", melhor_resultado)
+    return melhor_resultado
+
+
+def conciliar_por_codigo(df_extrato, df_erp_base, coluna_extrato="AUTORIZAÇÃO", coluna_erp="Autorização"):
+    """
+    Conciliação só pelo código aproximado: monta o IndiceQGramas dos códigos
+    do ERP uma vez e busca cada linha do extrato. Retorna um DataFrame com
+    (código ERP, Chave ERP, Valor ERP, Status, Pontuação) no índice do extrato.
+    """
+    numericos = coluna_erp in PERFIL_SANTANDER.codigos_numericos
+    df_erp_base = df_erp_base.reset_index(drop=True)
+    indice = IndiceQGramas(normalizar_codigos(df_erp_base[coluna_erp], numericos))
+    codigos = normalizar_codigos(df_extrato[coluna_extrato], numericos)
+    linhas = [
+        melhor_correspondencia_por_codigo(row, codigo, df_erp_base, coluna_erp, indice)
+        for (_, row), codigo in zip(df_extrato.iterrows(), codigos)
+    ]
+    return pd.DataFrame(
+        linhas, index=df_extrato.index, columns=[f"{coluna_erp} ERP", "Chave ERP", "Valor ERP", "Status", "Pontuação"]
+    )
 
-            melhor_resultado = None
-            menor_pontuacao = float("inf")
 
-            for melhor_correspondencia, melhor_pontuacao, _ in correspondencias_validas:
-                filtro = df_origem[df_origem[coluna_erp] == melhor_correspondencia]
+def conciliar_sobras_por_codigo(df_nao_conciliado, df_erp_disponivel):
+    """
+    Passada opcional depois da segunda: as linhas ainda "Não Conciliado"
+    procuram a Autorização parecida (conciliar_por_codigo) entre os títulos
+    que nenhuma passada usou, sem limite de dias ou valor. Quando duas
+    linhas acham o mesmo título, fica a de menor pontuação.
+    """
+    pendentes = df_nao_conciliado["Status"] == PERFIL_SANTANDER.status_nao_conciliado
+    usadas = df_nao_conciliado.loc[~pendentes, "Chave ERP"].dropna()
+    df_erp_livre = df_erp_disponivel[~df_erp_disponivel["Chave"].isin(usadas)]
+    if not pendentes.any() or df_erp_livre.empty:
+        return df_nao_conciliado
+
+    encontrados = conciliar_por_codigo(df_nao_conciliado[pendentes], df_erp_livre)
+    encontrados = encontrados[encontrados["Chave ERP"].notna()]
+    encontrados = encontrados.sort_values("Pontuação", kind="stable").drop_duplicates("Chave ERP")
+    if encontrados.empty:
+        return df_nao_conciliado
+    logging.info("🔎 Busca por código: %d linhas conciliadas pela Autorização.", len(encontrados))
+
+    titulos = df_erp_livre.drop_duplicates("Chave").set_index("Chave").loc[encontrados["Chave ERP"]]
+    linhas = df_nao_conciliado.loc[encontrados.index]
+    novos = [status for status in pd.unique(encontrados["Status"]) if status not in df_nao_conciliado["Status"].cat.categories]
+    df_nao_conciliado["Status"] = df_nao_conciliado["Status"].cat.add_categories(novos)
+
+    for coluna in ["Autorização ERP", "Chave ERP", "Valor ERP", "Status", "Pontuação"]:
+        df_nao_conciliado.loc[encontrados.index, coluna] = encontrados[coluna]
+    df_nao_conciliado.loc[encontrados.index, "NSU ERP"] = titulos["NSU"].to_numpy()
+    df_nao_conciliado.loc[encontrados.index, "DIF_DIAS"] = np.abs(
+        (linhas["DATA DA VENDA"].to_numpy() - titulos["Emissão"].to_numpy()) // np.timedelta64(1, "D")
+    )
+    df_nao_conciliado.loc[encontrados.index, "DIF_VALOR"] = np.abs(
+        linhas["VALOR DA PARCELA"].to_numpy() - titulos["Valor"].to_numpy()
+    )
+    return df_nao_conciliado
 
-                if filtro.empty:                
-                    continue
 
-                #  Itera sobre todas as linhas com o mesmo valor
-                for _, linha_correspondente in filtro.iterrows():
-                    valor_erp = linha_correspondente["Valor"]
-                    data_erp = linha_correspondente["Emissão"]
-                    parcela_erp = linha_correspondente["Parcela"]
-                    total_parcelas_erp = linha_correspondente["Total_Parcelas"]
-
-                    status = ["Conciliado"]
-                    pontuacao = 0
-
-                    if abs(row["VALOR DA PARCELA"] - valor_erp) > 0.10:
-                        status.append("Divergência de Valor")
-                        pontuacao += 15
-
-                    if abs((row["DATA DA VENDA"] - data_erp).days) > 1:
-                        status.append("Divergência de Data")
-                        pontuacao += 5
-
-                    if row["PARCELA"] != parcela_erp:
-                        status.append("Divergência de Parcela")
-                        pontuacao += 10
-
-                    if row["TOTAL_PARCELAS"] != total_parcelas_erp:
-                        status.append("Divergência de Total de Parcelas")
-                        pontuacao += 15
-
-
-                    if pontuacao < menor_pontuacao:
-                        menor_pontuacao = pontuacao
-                        melhor_resultado = (
-                            linha_correspondente[coluna_erp],
-                            linha_correspondente["Chave"],
-                            valor_erp,
-                            " e ".join(status) if len(status) > 1 else status[0],
-                            pontuacao
-                        )
+def marcar_duplicados_com_pior_score(df, chave_col="Chave ERP", status_col="Status", pontuacao_col="Pontuação"):
+    # 1️ Filtra linhas com chaves duplicadas
+    duplicadas = df[df.duplicated(subset=[chave_col], keep=False)].copy()
 
-            if melhor_resultado:
+    if duplicadas.empty:
+        return df
 
-                return pd.Series(melhor_resultado)
-            else:
 
-                return pd.Series([None, None, None, "Não Conciliado", 99])
-            
-        def encontrar_melhor_correspondencia_com_pontuacao_nsu(row, df_origem):
-            correspondencias = process.extract(
-                str(row["NÚMERO COMPROVANTE DE VENDA (NSU)"]),
-                df_origem["NSU"].astype(str),
-                scorer=fuzz.ratio,
-                limit=10
-            )
-
-            correspondencias_validas = [(texto, score, idx) for texto, score, idx in correspondencias if score >= 80]
-
-            print(f"\n Buscando correspondência para: {row['NÚMERO COMPROVANTE DE VENDA (NSU)']}")
-            print("Correspondências válidas (score >= 80):", correspondencias_validas)
-
-            if not correspondencias_validas:
-                return pd.Series([None, None, None, "Não Conciliado", 99])
-
-            melhor_resultado = None
-            menor_pontuacao = float("inf")
-
-            for melhor_correspondencia, melhor_pontuacao, _ in correspondencias_validas:
-                filtro = df_origem[df_origem["NSU"] == melhor_correspondencia]
-
-                if filtro.empty:
-                    print(f"⚠ Correspondência '{melhor_correspondencia}' não encontrada no DataFrame.")
-                    continue
-
-                #  Itera sobre todas as linhas com o mesmo valor
-                for _, linha_correspondente in filtro.iterrows():
-                    valor_erp = linha_correspondente["Valor"]
-                    data_erp = linha_correspondente["Emissão"]
-                    parcela_erp = linha_correspondente["Parcela"]
-                    total_parcelas_erp = linha_correspondente["Total_Parcelas"]
-
-                    status = ["Conciliado"]
-                    pontuacao = 0
-
-                    if abs(row["VALOR DA PARCELA"] - valor_erp) > 0.10:
-                        status.append("Divergência de Valor")
-                        pontuacao += 15
-
-                    if abs((row["DATA DA VENDA"] - data_erp).days) > 1:
-                        status.append("Divergência de Data")
-                        pontuacao += 5
-
-                    if row["PARCELA"] != parcela_erp:
-                        status.append("Divergência de Parcela")
-                        pontuacao += 10
-
-                    if row["TOTAL_PARCELAS"] != total_parcelas_erp:
-                        status.append("Divergência de Total de Parcelas")
-                        pontuacao += 15
-
-                    if pontuacao < menor_pontuacao:
-                        menor_pontuacao = pontuacao
-                        melhor_resultado = (
-                            linha_correspondente["NSU"],
-                            linha_correspondente["Chave"],
-                            valor_erp,
-                            " e ".join(status) if len(status) > 1 else status[0],
-                            pontuacao
-                        )
-
-            if melhor_resultado:
-                print(" Melhor resultado escolhido:", melhor_resultado)
-                return pd.Series(melhor_resultado)
-            else:
-                print(" Nenhuma correspondência com pontuação aceitável.")
-                return pd.Series([None, None, None, "Não Conciliado", 99])
-
-        def selecionar_melhor_por_pontuacao_com_autorizacao_e_nsu(row, df_erp_base, tolerancia_dias=5, tolerancia_valor=0.20, incluir_detalhes=False):
-            candidatos = df_erp_base[
-                (df_erp_base["Emissão"] - row["DATA DA VENDA"]).abs().dt.days <= tolerancia_dias
-            ]
-
-            candidatos = candidatos[
-                (candidatos["Valor"] - row["VALOR DA PARCELA"]).abs() <= tolerancia_valor
-            ]
-
-            candidatos = candidatos[
-                (candidatos["Parcela"] == row["PARCELA"]) &
-                (candidatos["Total_Parcelas"] == row["TOTAL_PARCELAS"])
-            ]
-
-            if candidatos.empty:
-                if incluir_detalhes:
-                    return pd.Series([None, None, None, None, None, None, "Não Conciliado", 999])
-                else:
-                    return pd.Series([None, None, None, None, "Não Conciliado", 999])
-
-            melhor_resultado = None
-            menor_pontuacao = float("inf")
-
-            for _, linha in candidatos.iterrows():
-                dias_dif = abs((linha["Emissão"] - row["DATA DA VENDA"]).days)
-                valor_dif = abs(linha["Valor"] - row["VALOR DA PARCELA"])
-
-                aut_sant = str(row["AUTORIZAÇÃO"]).strip()
-                aut_erp = str(linha["Autorização"]).strip()
-                nsu_sant = str(row["NÚMERO COMPROVANTE DE VENDA (NSU)"]).strip()
-                nsu_erp = str(linha["NSU"]).strip()
-
-                if aut_sant == aut_erp or nsu_sant == nsu_erp:
-                    sim_autorizacao = 100
-                    sim_nsu = 100
-                else:
-                    sim_autorizacao = fuzz.ratio(aut_sant, aut_erp)
-                    sim_nsu = fuzz.ratio(nsu_sant, nsu_erp)
-
-                pontuacao = dias_dif * 100 + valor_dif * 100 + (200 - (sim_autorizacao + sim_nsu))
-                if "Pessoa do Título" in linha and linha["Pessoa do Título"] != "Getnet Adquirencia E Servicos Para Meios de Pagamento S.a.":
-                    pontuacao += 101
-
-                if pontuacao < menor_pontuacao:
-                    menor_pontuacao = pontuacao
-                    melhor_resultado = (
-                        linha["Autorização"],
-                        linha["NSU"],
-                        linha["Chave"],
-                        linha["Valor"],
-                        dias_dif,
-                        valor_dif,
-                        "Conciliado por Similaridade",
-                        round(pontuacao, 2)
-                    )
-
-            if melhor_resultado:
-                if incluir_detalhes:
-                    return pd.Series(melhor_resultado)
-                else:
-                    return pd.Series(melhor_resultado[:4] + melhor_resultado[-2:])  # sem dias/valor
-            else:
-                if incluir_detalhes:
-                    return pd.Series([None, None, None, None, None, None, "Não Conciliado", 999])
-                else:
-                    return pd.Series([None, None, None, None, "Não Conciliado", 999])
-                
-        def marcar_duplicados_com_pior_score(df, chave_col="Chave ERP", status_col="Status", pontuacao_col="Pontuação"):
-            # 1️ Filtra linhas com chaves duplicadas
-            duplicadas = df[df.duplicated(subset=[chave_col], keep=False)].copy()
-
-            if duplicadas.empty:
-                return df
-
-
-            # 2️ Ordena pela pontuação crescente (menor pontuação é a melhor)
-            duplicadas_sorted = duplicadas.sort_values(pontuacao_col, ascending=True)
-
-            # 3️ Marca como duplicado todas as duplicatas exceto a com menor pontuação
-            duplicadas_marcadas = duplicadas_sorted.duplicated(subset=[chave_col], keep="first")
-
-            # 4️ Atualiza status e pontuação das duplicadas com pior score
-            df.loc[duplicadas_sorted[duplicadas_marcadas].index, status_col] = "Valor Duplicado Menor Score"
-            df.loc[duplicadas_sorted[duplicadas_marcadas].index, pontuacao_col] = 998
-
-
-            return df
+    # 2️ Ordena pela pontuação crescente (menor pontuação é a melhor)
+    duplicadas_sorted = duplicadas.sort_values(pontuacao_col, ascending=True)
 
+    # 3️ Marca como duplicado todas as duplicatas exceto a com menor pontuação
+    duplicadas_marcadas = duplicadas_sorted.duplicated(subset=[chave_col], keep="first")
 
-        #Remover da Planilha Santander os Títulos que foram cancelados
-        # 1️ Criar coluna auxiliar com valor absoluto da parcela
-        df_santander["VALOR_ABS"] = df_santander["VALOR DA PARCELA"].abs()
-        df_cancelamento_venda["VALOR_ABS"] = df_cancelamento_venda["VALOR DA PARCELA"].abs()
+    # 4️ Atualiza status e pontuação das duplicadas com pior score
+    df.loc[duplicadas_sorted[duplicadas_marcadas].index, status_col] = "Valor Duplicado Menor Score"
+    df.loc[duplicadas_sorted[duplicadas_marcadas].index, pontuacao_col] = 998
 
-        # 2️ Criar chave composta: AUTORIZAÇÃO + VALOR_ABS
-        df_santander["CHAVE_CONCILIACAO"] = df_santander["AUTORIZAÇÃO"].astype(str) + "_" + df_santander["VALOR_ABS"].astype(str)
-        df_cancelamento_venda["CHAVE_CONCILIACAO"] = df_cancelamento_venda["AUTORIZAÇÃO"].astype(str) + "_" + df_cancelamento_venda["VALOR_ABS"].astype(str)
 
-        # 3️ Verificar chaves em comum
-        chaves_comuns = set(df_santander["CHAVE_CONCILIACAO"]) & set(df_cancelamento_venda["CHAVE_CONCILIACAO"])
+    return df
 
-        # 4️ Filtrar as linhas da df_santander que estão na lista de cancelamentos
-        filtro_cancelados = df_santander["CHAVE_CONCILIACAO"].isin(df_cancelamento_venda["CHAVE_CONCILIACAO"])
 
-        # 5️ Copiar essas linhas
-        df_cancelados_encontrados = df_santander[filtro_cancelados].copy()
+#Marcar na planilha ERP o que já foi usado na conciliação para não ser usado novamente.
+def marcar_e_filtrar_chaves_utilizadas(df_erp, df_conciliado):
+    """Marca em df_erp["Usada"] as chaves já conciliadas e retorna (df_erp, df_erp_disponivel)."""
 
-        # 6️ Adicionar ao df_cancelamento_venda
-        df_cancelamento_venda = pd.concat([df_cancelamento_venda, df_cancelados_encontrados], ignore_index=True)
+    # Normaliza os valores para garantir comparação precisa
+    df_erp["Chave"] = pd.to_numeric(df_erp["Chave"], errors="coerce").astype("Int64")
+    df_conciliado["Chave ERP"] = pd.to_numeric(df_conciliado["Chave ERP"], errors="coerce").astype("Int64")
 
-        # 7️ Remover da df_santander
-        df_santander = df_santander[~filtro_cancelados].copy()
+    # Coleta as chaves que já foram utilizadas
+    chaves_utilizadas = df_conciliado["Chave ERP"].dropna().unique()
 
-        # 8️ Resultado final
+    # Marca no df_erp quais foram utilizadas
+    df_erp["Usada"] = df_erp["Chave"].isin(chaves_utilizadas)
 
-        df_primeira_conciliacao = df_santander
-        df_segunda_conciliacao = df_primeira_conciliacao.filter(items=["EC CENTRALIZADOR", "DATA DE VENCIMENTO", "TIPO DE LANÇAMENTO", "PARCELAS", "AUTORIZAÇÃO", "NÚMERO COMPROVANTE DE VENDA (NSU)", "DATA DA VENDA","VALOR DA PARCELA", "VALOR LÍQUIDO", "PARCELA", "TOTAL_PARCELAS"])
-        progress_bar = st.progress(0, text="🔄 Conciliando registros...")
-        resultados = []
+    # Filtra as que ainda estão disponíveis para nova conciliação
+    df_erp_disponivel = df_erp[~df_erp["Usada"]].copy()
 
-        total = len(df_segunda_conciliacao)
 
-        for i, (_, row) in enumerate(df_segunda_conciliacao.iterrows()):
-            resultado = selecionar_melhor_por_pontuacao_com_autorizacao_e_nsu(row, df_erp)
-            resultados.append(resultado)
-            
-            progresso = (i + 1) / total
-            progress_bar.progress(progresso, text=f"🔄 Conciliando ({i + 1}/{total}) registros...")
+    return df_erp, df_erp_disponivel
 
-        # Coloca os resultados de volta no DataFrame
-        df_segunda_conciliacao[["Autorização ERP", "NSU ERP", "Chave ERP", "Valor ERP", "Status", "Pontuação"]] = pd.DataFrame(resultados, index=df_segunda_conciliacao.index)
 
+# =========================
+# Conciliação em duas passadas
+# =========================
+def conciliar_santander_erp(df_santander, df_erp, atribuicao_global=False, ao_progredir=None, busca_por_codigo=False):
+    """
+    Primeira passada com as tolerâncias do perfil; as linhas sem par ou
+    duplicadas de pior pontuação vão para uma segunda passada mais larga
+    (30 dias, sem limite de valor) contra os títulos ainda disponíveis.
+    Com `busca_por_codigo`, o que sobra ainda passa pela busca da
+    Autorização aproximada (conciliar_sobras_por_codigo).
+    Retorna (df_conciliado, df_nao_conciliado, df_erp).
+    """
+    df_segunda_conciliacao = df_santander.filter(items=["EC CENTRALIZADOR", "DATA DE VENCIMENTO", "TIPO DE LANÇAMENTO", "PARCELAS", "AUTORIZAÇÃO", "NÚMERO COMPROVANTE DE VENDA (NSU)", "DATA DA VENDA","VALOR DA PARCELA", "VALOR LÍQUIDO", "PARCELA", "TOTAL_PARCELAS"])
+    with etapa("Primeira passada"):
+        df_segunda_conciliacao, _ = conciliar(
+            df_segunda_conciliacao, df_erp, PERFIL_SANTANDER,
+            atribuicao_global=atribuicao_global, ao_progredir=ao_progredir
+        )
 
-        df_terceira_conciliacao = df_segunda_conciliacao[df_segunda_conciliacao["Pontuação"] == 999].copy()
-        df_segunda_conciliacao = df_segunda_conciliacao[df_segunda_conciliacao["Pontuação"] != 999].copy()
-        df_segunda_conciliacao = marcar_duplicados_com_pior_score(df_segunda_conciliacao)
+    df_terceira_conciliacao = df_segunda_conciliacao[df_segunda_conciliacao["Pontuação"] == 999].copy()
+    df_segunda_conciliacao = df_segunda_conciliacao[df_segunda_conciliacao["Pontuação"] != 999].copy()
+    with etapa("Resolução de duplicados"):
+        # Na atribuição global nenhum título se repete; no modo padrão os duplicados de pior pontuação saem
+        if not atribuicao_global:
+            df_segunda_conciliacao = marcar_duplicados_com_pior_score(df_segunda_conciliacao)
         duplicados = df_segunda_conciliacao[df_segunda_conciliacao["Pontuação"] == 998].copy()
-        df_segunda_conciliacao = df_segunda_conciliacao[df_segunda_conciliacao["Pontuação"] != 998].copy()
-        df_terceira_conciliacao = pd.concat([df_terceira_conciliacao, duplicados], ignore_index=True)
+        df_conciliado = df_segunda_conciliacao[df_segunda_conciliacao["Pontuação"] != 998].copy()
+        df_nao_conciliado = pd.concat([df_terceira_conciliacao, duplicados], ignore_index=True)
 
+        df_erp, df_erp_disponivel = marcar_e_filtrar_chaves_utilizadas(df_erp, df_conciliado)
 
-        df_conciliado = df_segunda_conciliacao
-        df_nao_conciliado = df_terceira_conciliacao
+    with etapa("Segunda passada"):
+        df_nao_conciliado, _ = conciliar(
+            df_nao_conciliado, df_erp_disponivel, PERFIL_SANTANDER,
+            TOLERANCIA_DIAS_SEGUNDA_PASSADA, TOLERANCIA_VALOR_SEGUNDA_PASSADA,
+            incluir_detalhes=True, linhas_por_bloco=200, max_candidatos=CANDIDATOS_SEGUNDA_PASSADA
+        )
 
+    if busca_por_codigo:
+        with etapa("Busca por código"):
+            df_nao_conciliado = conciliar_sobras_por_codigo(df_nao_conciliado, df_erp_disponivel)
+    return df_conciliado, df_nao_conciliado, df_erp
 
-        #Marcar na planilha ERP o que já foi usado na conciliação para não ser usado novamente.
 
-        def marcar_e_filtrar_chaves_utilizadas(df_erp, df_conciliado):
-            """
-            """
+def gerar_resultado(df_santander, df_erp, atribuicao_global=False, ao_progredir=None, busca_por_codigo=False):
+    """
+    Separa os lançamentos do extrato Santander já limpo, tira os cancelados,
+    concilia com o ERP limpo (duas passadas) e monta o relatório e as abas
+    da planilha final. Retorna {"conciliados", "nao_conciliados",
+    "cancelamentos", "relatorio", "outros", "abas"}, sem passar pelo
+    Streamlit; "outros" são os itens da seção OUTROS do relatório.
+    """
+    with etapa("Separação de cancelamentos"):
+        df_santander, df_cancelamento_venda, df_aluguel_maquina = separar_lancamentos(df_santander)
+        valor_aluguel_maquina = df_aluguel_maquina["VALOR LÍQUIDO"].sum()
 
-            # Normaliza os valores para garantir comparação precisa
-            df_erp["Chave"] = pd.to_numeric(df_erp["Chave"], errors="coerce").astype("Int64")
-            df_conciliado["Chave ERP"] = pd.to_numeric(df_conciliado["Chave ERP"], errors="coerce").astype("Int64")
+        #Remover da Planilha Santander os Títulos que foram cancelados
+        df_santander, df_cancelamento_venda = remover_cancelados(df_santander, df_cancelamento_venda)
 
-            # Coleta as chaves que já foram utilizadas
-            chaves_utilizadas = df_conciliado["Chave ERP"].dropna().unique()
+    df_conciliado, df_nao_conciliado, df_erp = conciliar_santander_erp(
+        df_santander, df_erp, atribuicao_global=atribuicao_global, ao_progredir=ao_progredir,
+        busca_por_codigo=busca_por_codigo,
+    )
 
-            # Marca no df_erp quais foram utilizadas
-            df_erp["Usada"] = df_erp["Chave"].isin(chaves_utilizadas)
+    total_banco = (
+        df_conciliado["VALOR LÍQUIDO"].sum() +
+        df_nao_conciliado["VALOR LÍQUIDO"].sum() +
+        df_cancelamento_venda["VALOR LÍQUIDO"].sum() +
+        valor_aluguel_maquina
+    )
+    outros = [
+        ("Valor total de aluguel de máquineta", valor_aluguel_maquina),
+        ("Valor Total no Banco", total_banco),
+    ]
+    relatorio_df = gerar_relatorio(
+        [
+            ("CONCILIADO", df_conciliado),
+            ("NÃO CONCILIADO", df_nao_conciliado),
+            ("CANCELAMENTO DE VENDA", df_cancelamento_venda),
+        ],
+        outros=outros,
+    )
 
-            # Filtra as que ainda estão disponíveis para nova conciliação
-            df_erp_disponivel = df_erp[~df_erp["Usada"]].copy()
+    valor_bruto = df_erp[['Chave', 'Valor', 'Pessoa do Título']].rename(columns={'Valor': 'Valor bruto'})
+
+    def com_valor_bruto(df, colunas):
+        df = df.copy()
+        df["Chave ERP"] = pd.to_numeric(df["Chave ERP"], errors="coerce").astype("Int64")
+        return df.merge(valor_bruto, left_on='Chave ERP', right_on='Chave', how='left')[colunas]
+
+    abas = {
+        "Conciliados": com_valor_bruto(df_conciliado, COLUNAS_CONCILIADOS),
+        "Não conciliados": com_valor_bruto(df_nao_conciliado, COLUNAS_NAO_CONCILIADOS),
+        "Cancelamentos": df_cancelamento_venda,
+        "Aluguel e Tarifas": df_aluguel_maquina,
+        "Resumo": relatorio_df,
+    }
+    return {
+        "conciliados": df_conciliado,
+        "nao_conciliados": df_nao_conciliado,
+        "cancelamentos": df_cancelamento_venda,
+        "relatorio": relatorio_df,
+        "outros": outros,
+        "abas": abas,
+    }
 
 
-            return df_erp, df_erp_disponivel
+def main():
+    # O Streamlit só é importado pela interface: o resto do módulo roda sem ele (conciliafacil.py)
+    import streamlit as st
 
-        df_erp, df_erp_disponivel = marcar_e_filtrar_chaves_utilizadas(df_erp, df_conciliado)
+    configurar_registro()
 
-        df_nao_conciliado[["Autorização ERP", "NSU ERP", "Chave ERP", "Valor ERP", "DIF_DIAS", "DIF_VALOR", "Status", "Pontuação"]] = df_nao_conciliado.apply(
-            lambda row: selecionar_melhor_por_pontuacao_com_autorizacao_e_nsu(row, df_erp_disponivel, 30, 100000.00, True),
-            axis=1
+    # --- BARRA LATERAL ---
+    with st.sidebar:
+        st.markdown("# App Conciliação Bancária")
+        
+        # Seção de upload com tratamento de None
+        st.markdown("### Carregar planilhas")
+        caminho_erp = st.file_uploader("ERP (CSV)", type=["csv"], key="erp_uploader")
+        # Vários extratos (ex.: um por loja ou por semana) saem numa planilha consolidada
+        arquivos_santander = st.file_uploader(
+            "Santander (XLSX)", type=["xlsx"], key="santander_uploader", accept_multiple_files=True
+        )
+        atribuicao_global = st.checkbox(
+            "Atribuição global",
+            key="santander_atribuicao_global",
+            help="Escolhe os pares pela menor pontuação total em vez de resolver duplicados depois."
+        )
+        busca_por_codigo = st.checkbox(
+            "Busca por código",
+            key="santander_busca_por_codigo",
+            help="Depois das duas passadas, procura as linhas que sobraram pela Autorização parecida, sem limite de data e valor."
         )
 
+    # --- ÁREA PRINCIPAL ---
 
-    # Função para gerar o relatório formatado como DataFrame
-    with st.spinner('📊 Gerando relatório final...'):
-        def gerar_relatorio_df_formatado(df_conciliado, df_nao_conciliado, df_cancelamento_venda, valor_aluguel_maquina):
-            # Calcula os totais diretamente dos DataFrames originais
-            totais = {
-                'conciliado': {
-                    'liquido': df_conciliado["VALOR LÍQUIDO"].sum(),
-                    'parcela': df_conciliado["VALOR DA PARCELA"].sum(),
-                    'qtd': len(df_conciliado)
-                },
-                'nao_conciliado': {
-                    'liquido': df_nao_conciliado["VALOR LÍQUIDO"].sum(),
-                    'parcela': df_nao_conciliado["VALOR DA PARCELA"].sum(),
-                    'qtd': len(df_nao_conciliado)
-                },
-                'cancelado': {
-                    'liquido': df_cancelamento_venda["VALOR LÍQUIDO"].sum(),
-                    'parcela': df_cancelamento_venda["VALOR DA PARCELA"].sum(),
-                    'qtd': len(df_cancelamento_venda)
-                },
-                'aluguel': valor_aluguel_maquina,
-                'total_banco': df_conciliado["VALOR LÍQUIDO"].sum() + 
-                            df_nao_conciliado["VALOR LÍQUIDO"].sum() + 
-                            df_cancelamento_venda["VALOR LÍQUIDO"].sum() + 
-                            valor_aluguel_maquina
-            }
-
-            # Constroi a estrutura do relatório
-            relatorio_dados = [
-                ["RELATÓRIO DE CONCILIAÇÃO", "", ""],
-                ["CONCILIADO", "", ""],
-                ["- Valor Líquido Total", "", f"R$ {totais['conciliado']['liquido']:,.2f}"],
-                ["- Valor da Parcela Total", "", f"R$ {totais['conciliado']['parcela']:,.2f}"],
-                ["- Quantidade de Títulos", "", f"{totais['conciliado']['qtd']}"],
-                ["", "", ""],
-                ["NÃO CONCILIADO", "", ""],
-                ["- Valor Líquido Total", "", f"R$ {totais['nao_conciliado']['liquido']:,.2f}"],
-                ["- Valor da Parcela Total", "", f"R$ {totais['nao_conciliado']['parcela']:,.2f}"],
-                ["- Quantidade de Títulos", "", f"{totais['nao_conciliado']['qtd']}"],
-                ["", "", ""],
-                ["CANCELAMENTO DE VENDA", "", ""],
-                ["- Valor Líquido Total", "", f"R$ {totais['cancelado']['liquido']:,.2f}"],
-                ["- Valor da Parcela Total", "", f"R$ {totais['cancelado']['parcela']:,.2f}"],
-                ["- Quantidade de Títulos", "", f"{totais['cancelado']['qtd']}"],
-                ["", "", ""],
-                ["OUTROS", "", ""],
-                ["- Valor total de aluguel de máquineta", "", f"R$ {totais['aluguel']:,.2f}"],
-                ["- Valor Total no Banco", "", f"R$ {totais['total_banco']:,.2f}"]
-            ]
-
-            return pd.DataFrame(relatorio_dados, columns=["Categoria", "Descrição", "Valor"])
-        # --- Exibição de Resultados no Streamlit ---
-        st.header("Resultados da Conciliação")
-
-        # Gera o relatório
-
-        relatorio_df = gerar_relatorio_df_formatado(
-            df_conciliado, 
-            df_nao_conciliado, 
-            df_cancelamento_venda, 
-            valor_aluguel_maquina
-        )
+    if caminho_erp is None or not arquivos_santander:
+        st.subheader("Bem-vindo ao Sistema de Conciliação")
+        st.markdown("""
+        <div style='text-align: center; margin-bottom: 20px;'>
+            <p>Este sistema realiza a conciliação automática entre:</p>
+            <p>•  Santander</p>
+            <p>• ERP</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        st.warning("⚠️ Por favor, faça upload de ambos os arquivos para iniciar a conciliação")
+        
+        
+        st.stop()
+    painel, capturar_perfil = painel_desempenho("santander_perfil")
+    tolerancias = (
+        PERFIL_SANTANDER.tolerancia_dias, PERFIL_SANTANDER.tolerancia_valor,
+        TOLERANCIA_DIAS_SEGUNDA_PASSADA, TOLERANCIA_VALOR_SEGUNDA_PASSADA,
+    )
+
+    def processar():
+        """Conciliação, relatório e planilha final; o resultado fica em cache.RESULTADOS."""
+        # Leitura e limpeza ficam em cache pelo conteúdo dos arquivos entre as reexecuções
+        try:
+            with st.spinner('📂 Carregando planilhas...'):
+                df_erp = carregar_limpo(caminho_erp, "erp", carregar_planilha, limpar_erp, VERSAO_LIMPEZA_ERP)
+        except Exception as e:
+            st.error(f"❌ Erro ao carregar arquivos: {str(e)}")
+            st.stop()
+
+        # Os extratos são lidos, limpos e conciliados em lote.conciliar_lote (em paralelo quando são vários)
+        with st.spinner('🔎 Realizando conciliação...'):
+            progresso = progresso_streamlit("🔄 Conciliando registros", unidade=unidade_do_progresso(arquivos_santander))
+            try:
+                resultado = conciliar_lote(
+                    "santander", df_erp, arquivos_santander,
+                    atribuicao_global=atribuicao_global, ao_progredir=progresso,
+                    busca_por_codigo=busca_por_codigo,
+                )
+            except Exception as e:
+                st.error(f"❌ Erro ao carregar arquivos: {str(e)}")
+                st.stop()
+            progresso.concluir()
+        resultado.update(planilha=None, erro=None)
 
-        # Exibe as métricas principais (usando valores diretos, não do DataFrame)
-
-                        #!!!!!!MELHORIA A ADICIONAR!!!!!!
-
-    #!!!!!!!!!!!!!!!!!!!!ADICIONAR VALORES DE TOTAL DEPOSITADO EM BANCO AQUI!!!!!!!!!!!!!!!!!!!!!!!!!!    
-        with st.container():
-            st.subheader("Resumo Financeiro")
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("✅ Conciliados", 
-                        f"R$ {df_conciliado['VALOR LÍQUIDO'].sum():,.2f}", 
-                        f"{len(df_conciliado)} títulos")
-            with col2:
-                st.metric("⚠ Não Conciliados", 
-                        f"R$ {df_nao_conciliado['VALOR LÍQUIDO'].sum():,.2f}", 
-                        f"{len(df_nao_conciliado)} títulos")
-            with col3:
-                st.metric("❌ Cancelados", 
-                        f"R$ {df_cancelamento_venda['VALOR LÍQUIDO'].sum():,.2f}", 
-                        f"{len(df_cancelamento_venda)} títulos")
-
-            # Exibe a tabela completa 
-            with st.expander("📊 Ver relatório completo"):
-                st.dataframe(relatorio_df, hide_index=True)
-                
-        output_path = "Conciliação_final.xlsx"
         try:
             with st.spinner('Gerando arquivo de conciliação...'):
-                # Primeiro escreve o Excel
-                with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-                    df_conciliado_final = df_conciliado.merge(
-                        df_erp[['Chave', 'Valor', 'Pessoa do Título']],
-                        left_on='Chave ERP',
-                        right_on='Chave',
-                        how='left'
-                    ).rename(columns={'Valor': 'Valor bruto'})
-
-                    cols_conciliados = [
-                        "DATA DE VENCIMENTO", "Pessoa do Título",
-                        "AUTORIZAÇÃO", "NÚMERO COMPROVANTE DE VENDA (NSU)", "DATA DA VENDA",
-                        "VALOR DA PARCELA", "Valor bruto", "VALOR LÍQUIDO",
-                        "PARCELA", "TOTAL_PARCELAS", "Autorização ERP", "NSU ERP",
-                        "Chave ERP", "Valor ERP", "Status", "Pontuação"
-                    ]
-                    df_conciliado_final.to_excel(writer, sheet_name="Conciliados", index=False, columns=cols_conciliados)
-
-                    df_nao_conciliado_final = df_nao_conciliado.merge(
-                        df_erp[['Chave', 'Valor', 'Pessoa do Título']],
-                        left_on='Chave ERP',
-                        right_on='Chave',
-                        how='left'
-                    ).rename(columns={'Valor': 'Valor bruto'})
-
-                    cols_nao_conciliados = [
-                        "EC CENTRALIZADOR", "DATA DE VENCIMENTO", "Pessoa do Título",
-                        "AUTORIZAÇÃO", "NÚMERO COMPROVANTE DE VENDA (NSU)", "DATA DA VENDA",
-                        "VALOR DA PARCELA", "Valor bruto", "VALOR LÍQUIDO",
-                        "PARCELA", "TOTAL_PARCELAS", "Autorização ERP", "NSU ERP",
-                        "Chave ERP", "Valor ERP", "DIF_DIAS", "DIF_VALOR", "Status", "Pontuação"
-                    ]
-                    df_nao_conciliado_final.to_excel(writer, sheet_name="Não conciliados", index=False, columns=cols_nao_conciliados)
-
-                    df_cancelamento_venda.to_excel(writer, sheet_name="Cancelamentos", index=False)
-                    df_aluguel_maquina.to_excel(writer, sheet_name="Aluguel e Tarifas", index=False)
-                    relatorio_df.to_excel(writer, sheet_name="Resumo", index=False)
-
-                # Após o ExcelWriter fechar e salvar corretamente o arquivo
-                wb = load_workbook(output_path)
-                ws_conciliados = wb["Conciliados"]
-                ws_resumo = wb["Resumo"]
-
-                header = [cell.value for cell in ws_conciliados[1]]
-                idx_chave = header.index("Chave ERP")
-                letra_coluna = chr(65 + idx_chave)
-
-                chaves = [str(cell.value) for cell in ws_conciliados[f"{letra_coluna}"][1:] if cell.value is not None]
-                blocos = [chaves[i:i + 2000] for i in range(0, len(chaves), 2000)]
-                blocos_concat = [", ".join(bloco) for bloco in blocos]
-
-                start_row = ws_resumo.max_row + 2
-                for i, texto in enumerate(blocos_concat, start=1):
-                    ws_resumo.cell(row=start_row + i - 1, column=1, value=f"Grupo {i}")
-                    ws_resumo.cell(row=start_row + i - 1, column=2, value=texto)
-
-                wb.save(output_path)
-            # Botão de download
-            if os.path.exists(output_path):
-                with open(output_path, "rb") as file:
-                    st.download_button(
-                        label="📥 Baixar Planilha de Conciliação",
-                        data=file,
-                        file_name="Conciliação_final_santander.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
+                resultado["planilha"], _ = gerar_planilha(resultado["abas"])
 
         except Exception as e:
-            st.error(f"❌ Erro ao gerar arquivo: {str(e)}")
\ No newline at end of file
+            resultado["erro"] = f"❌ Erro ao gerar arquivo: {str(e)}"
+        return resultado
+
+    # Mesmos arquivos e parâmetros reaproveitam a conciliação inteira, sem rodar de novo
+    chave = chave_resultado("santander", caminho_erp, arquivos_santander, *tolerancias, atribuicao_global, busca_por_codigo, capturar_perfil)
+    resultado = RESULTADOS.obter_ou_calcular(chave, lambda: medir_resultado(processar, capturar_perfil))
+    df_conciliado = resultado["conciliados"]
+    df_nao_conciliado = resultado["nao_conciliados"]
+    df_cancelamento_venda = resultado["cancelamentos"]
+    relatorio_df = resultado["relatorio"]
+
+    # --- Exibição de Resultados no Streamlit ---
+    st.header("Resultados da Conciliação")
+
+    with st.container():
+        st.subheader("Resumo Financeiro")
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("✅ Conciliados", 
+                    f"R$ {df_conciliado['VALOR LÍQUIDO'].sum():,.2f}", 
+                    f"{len(df_conciliado)} títulos")
+        with col2:
+            st.metric("⚠ Não Conciliados", 
+                    f"R$ {df_nao_conciliado['VALOR LÍQUIDO'].sum():,.2f}", 
+                    f"{len(df_nao_conciliado)} títulos")
+        with col3:
+            st.metric("❌ Cancelados", 
+                    f"R$ {df_cancelamento_venda['VALOR LÍQUIDO'].sum():,.2f}", 
+                    f"{len(df_cancelamento_venda)} títulos")
+
+        # Exibe a tabela completa 
+        with st.expander("📊 Ver relatório completo"):
+            st.dataframe(relatorio_df, hide_index=True)
+
+    if resultado["erro"]:
+        st.error(resultado["erro"])
+
+    # Botão de download
+    if resultado["planilha"] is not None:
+        st.download_button(
+            label="📥 Baixar Planilha de Conciliação",
+            data=resultado["planilha"],
+            file_name="Conciliação_final_santander.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+    if resultado["abas"]:
+        mostrar_outros_formatos(resultado["abas"], "Santander")
+    mostrar_desempenho(painel, resultado.get("desempenho"), "Santander")
\ No newline at end of file
@@ -0,0 +1,54 @@
+import pandas as pd
+
+from conciliacao import PERFIL_SANTANDER, conciliar, limpar_erp
+
+SANTANDER = PERFIL_SANTANDER.pessoa_titulo
+NSU_SANTANDER = PERFIL_SANTANDER.coluna_nsu
+
+
+def erp(*titulos):
+    """ERP limpo a partir de (Chave, Emissão, Valor, Autorização, NSU)."""
+    df = pd.DataFrame(titulos, columns=["Chave", "Emissão", "Valor", "Autorização", "NSU"])
+    df["Numero"] = [f"{chave}-1/1" for chave in df["Chave"]]
+    df["Pessoa do Título"] = SANTANDER
+    return limpar_erp(df)
+
+
+def extrato(*linhas):
+    """Extrato Santander limpo a partir de (data, valor, autorização, NSU)."""
+    df = pd.DataFrame(linhas, columns=["DATA DA VENDA", "VALOR DA PARCELA", "AUTORIZAÇÃO", NSU_SANTANDER])
+    df["DATA DA VENDA"] = pd.to_datetime(df["DATA DA VENDA"], dayfirst=True)
+    df["PARCELA"] = 1
+    df["TOTAL_PARCELAS"] = 1
+    return df
+
+
+def test_autorizacao_santander_ignora_zeros_a_esquerda_do_erp():
+    df_erp = erp((1, "10/03/2024", "100,00", "001234", "555"))
+    df_extrato = extrato(("10/03/2024", 100.0, 1234, "999"))
+
+    resultado, _ = conciliar(df_extrato, df_erp, PERFIL_SANTANDER)
+
+    # Autorização idêntica: as duas similaridades valem 100 e a pontuação fica zerada
+    assert resultado.loc[0, "Chave ERP"] == 1
+    assert resultado.loc[0, "Pontuação"] == 0
+
+
+def test_nsu_ausente_nos_dois_lados_conta_como_identico():
+    df_erp = erp((1, "10/03/2024", "100,00", "111", None))
+    df_extrato = extrato(("10/03/2024", 100.0, 999, None))
+
+    resultado, _ = conciliar(df_extrato, df_erp, PERFIL_SANTANDER)
+
+    # Como no texto original ("nan" == "nan"), o NSU vazio dos dois lados é chave idêntica
+    assert resultado.loc[0, "Chave ERP"] == 1
+    assert resultado.loc[0, "Pontuação"] == 0
+
+
+def test_codigo_ausente_so_de_um_lado_tem_similaridade_zero():
+    df_erp = erp((1, "10/03/2024", "100,00", "111", None))
+    df_extrato = extrato(("10/03/2024", 100.0, 999, "555"))
+
+    resultado, _ = conciliar(df_extrato, df_erp, PERFIL_SANTANDER)
+
+    assert resultado.loc[0, "Pontuação"] == 200
@@ -0,0 +1,30 @@
+import pandas as pd
+
+from conciliacao import PERFIL_SANTANDER
+from santander import STATUS_POR_CODIGO, conciliar_santander_erp
+from test_conciliacao import erp, extrato
+
+
+def conciliar(busca_por_codigo):
+    # Emissão 60 dias depois da venda: fora até da janela de 30 dias da segunda passada
+    df_erp = erp((1, "09/05/2024", "100,00", "123457", "888"))
+    df_extrato = extrato(("10/03/2024", 100.0, 123456, "555"))
+    _, df_nao_conciliado, _ = conciliar_santander_erp(df_extrato, df_erp, busca_por_codigo=busca_por_codigo)
+    return df_nao_conciliado.iloc[0]
+
+
+def test_sem_busca_por_codigo_a_linha_fica_sem_titulo():
+    linha = conciliar(busca_por_codigo=False)
+
+    assert linha["Status"] == PERFIL_SANTANDER.status_nao_conciliado
+    assert pd.isna(linha["Chave ERP"])
+
+
+def test_busca_por_codigo_acha_o_titulo_fora_da_janela():
+    linha = conciliar(busca_por_codigo=True)
+
+    assert linha["Chave ERP"] == 1
+    assert linha["Status"] == f"{STATUS_POR_CODIGO} e Divergência de Data"
+    assert linha["Pontuação"] == 5
+    assert linha["NSU ERP"] == "888"
+    assert linha["DIF_DIAS"] == 60